@@ -24,7 +24,7 @@ from account.serializers import (
 )
 from feature.models import Category, Food, History
 from feature.serializers import HistorySerializer, ReviewSerializer
-from core.utils import Pagination, PaginationHandlerMixin
+from core.utils import CursorPagination, PaginationHandlerMixin
 
 
 User = get_user_model()
@@ -320,7 +320,7 @@ class Interest(APIView):
 
 
 class HistoryList(APIView, PaginationHandlerMixin):
-    pagination_class    = Pagination
+    pagination_class    = CursorPagination
     serializer_class    = HistorySerializer
     permission_classes  = (IsAuthenticated,)
     authentication_classes = (TokenAuthentication,)
@@ -330,7 +330,7 @@ class HistoryList(APIView, PaginationHandlerMixin):
         operation_description   = '나의 음식 선택 기록을 조회합니다.',
         manual_parameters       = [
             openapi.Parameter('limit', openapi.IN_QUERY, description='Page limit size', type=openapi.TYPE_STRING),
-            openapi.Parameter('page', openapi.IN_QUERY, description='Page number', type=openapi.TYPE_STRING),
+            openapi.Parameter('cursor', openapi.IN_QUERY, description='Cursor of next/previous page', type=openapi.TYPE_STRING),
         ],
         responses               = {200: openapi.Response('', serializer_class(many=True))}
     )
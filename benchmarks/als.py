@@ -0,0 +1,73 @@
+'''
+ALS 학습 벤치마크: (사용자 x 음식) 모델과 이전의 (사용자 x 카테고리) 모델의 학습 시간, 최대 메모리(RSS), factor 크기.
+실제 메뉴(data/menu_data_kcal.csv)의 음식 수 412개, 카테고리 8개가 기본값.
+
+    python -m benchmarks.als
+    python -m benchmarks.als --users 10000 100000 --histories-per-user 60 --factors 64
+'''
+import argparse
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import scipy.sparse as sparse
+
+from recommendation.sweep import fit
+
+
+def synthetic_counts(n_users, n_items, histories_per_user, seed=0):
+    '''인기 음식이 몰리는(zipf) (사용자 x item) 먹은 횟수 CSR 행렬'''
+    rng         = np.random.default_rng(seed)
+    weights     = 1 / np.arange(1, n_items + 1)
+    n           = n_users * histories_per_user
+    users       = rng.integers(n_users, size=n)
+    items       = rng.permutation(n_items)[rng.choice(n_items, size=n, p=weights / weights.sum())]
+    matrix      = sparse.csr_matrix(
+        (np.ones(n, dtype=np.float32), (users, items)), shape=(n_users, n_items)
+    )
+    matrix.sum_duplicates()
+    return matrix
+
+
+def train(n_users, n_items, histories_per_user, factors, iterations):
+    '''새 프로세스에서 실행해 ru_maxrss가 이 학습만의 최대 메모리가 되도록 한다.'''
+    matrix      = synthetic_counts(n_users, n_items, histories_per_user)
+    before      = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    _t          = time.perf_counter()
+    model       = fit(matrix, factors, regularization=0.01, iterations=iterations)
+    seconds     = time.perf_counter() - _t
+
+    return {
+        'nnz'           : matrix.nnz,
+        'train_s'       : seconds,
+        # linux의 ru_maxrss 단위는 KB
+        'peak_rss_mb'   : resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'fit_rss_mb'    : (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before) / 1024,
+        'factors_mb'    : (np.asarray(model.user_factors).nbytes + np.asarray(model.item_factors).nbytes) / 1024 ** 2,
+    }
+
+
+def run(users, items, histories_per_user, factors, iterations):
+    print(f'{"users":>8} {"items":>6} {"nnz":>10} {"train(s)":>9} {"peak(MB)":>9} {"fit(MB)":>8} {"factors(MB)":>12}')
+    for n_users in users:
+        for n_items in items:
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                result  = executor.submit(train, n_users, n_items, histories_per_user, factors, iterations).result()
+            print(
+                f'{n_users:>8} {n_items:>6} {result["nnz"]:>10} {result["train_s"]:>9.2f} '
+                f'{result["peak_rss_mb"]:>9.1f} {result["fit_rss_mb"]:>8.1f} {result["factors_mb"]:>12.1f}'
+            )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--items', type=int, nargs='+', default=[8, 412], help='카테고리 수, 음식 수')
+    parser.add_argument('--histories-per-user', type=int, default=60)
+    parser.add_argument('--factors', type=int, default=64)
+    parser.add_argument('--iterations', type=int, default=30)
+    args = parser.parse_args()
+
+    run(args.users, args.items, args.histories_per_user, args.factors, args.iterations)
@@ -0,0 +1,65 @@
+'''
+ALS item 검색 벤치마크: exact(전체 내적) vs IVF 인덱스(ann)의 recall@n과 요청 1건당 지연 시간.
+
+    python -m benchmarks.ann
+    python -m benchmarks.ann --items 10000 100000 --factors 64 --probes 1 4 16
+'''
+import argparse
+import time
+
+import numpy as np
+
+from recommendation.ann import IVFIndex
+from recommendation.cf import top_k
+
+
+def synthetic_factors(n_items, n_factors, n_queries, n_clusters=50, seed=0):
+    '''ALS factor처럼 몇 개의 방향에 모여 있는 item/사용자 factor'''
+    rng         = np.random.default_rng(seed)
+    centers     = rng.normal(size=(n_clusters, n_factors))
+    items       = centers[rng.integers(n_clusters, size=n_items)] + 0.5 * rng.normal(size=(n_items, n_factors))
+    queries     = centers[rng.integers(n_clusters, size=n_queries)] + 0.5 * rng.normal(size=(n_queries, n_factors))
+    return items.astype(np.float32), queries.astype(np.float32)
+
+
+def per_query(func, queries):
+    '''(결과 목록, 요청 1건당 평균 ms)'''
+    _t          = time.perf_counter()
+    results     = [func(query) for query in queries]
+    return results, (time.perf_counter() - _t) * 1000 / len(queries)
+
+
+def run(items, n_factors, n_queries, n, probes):
+    print(f'{"items":>10} {"lists":>6} {"build(s)":>9} {"method":>10} {"ms/query":>9} {"recall@n":>9}')
+    for n_items in items:
+        item_factors, queries = synthetic_factors(n_items, n_factors, n_queries)
+
+        exact, t_exact  = per_query(
+            lambda query: top_k(item_factors.dot(query), n, min_score=-np.inf), queries
+        )
+
+        _t              = time.perf_counter()
+        index           = IVFIndex.build(item_factors)
+        t_build         = time.perf_counter() - _t
+        print(f'{n_items:>10} {index.n_lists:>6} {t_build:>9.2f} {"exact":>10} {t_exact:>9.3f} {1:>9.3f}')
+
+        for n_probe in probes:
+            approx, t_ann   = per_query(
+                lambda query: index.search(item_factors, query, n, n_probe), queries
+            )
+            recall          = np.mean([
+                len(np.intersect1d(a, e)) / len(e) for a, e in zip(approx, exact)
+            ])
+            print(f'{"":>10} {"":>6} {"":>9} {f"ann/{n_probe}":>10} {t_ann:>9.3f} {recall:>9.3f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--factors', type=int, default=64)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('-n', type=int, default=10)
+    parser.add_argument('--probes', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+
+    run(args.items, args.factors, args.queries, args.n, args.probes)
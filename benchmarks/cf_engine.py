@@ -0,0 +1,76 @@
+'''
+CF 엔진 벤치마크: 기록 수(1k ~ 1M)에 따른 행렬 생성, 이웃 계산, 사용자 1명 점수 계산 시간.
+
+    python -m benchmarks.cf_engine
+    python -m benchmarks.cf_engine --rows 1000 10000 --foods 412 --legacy
+'''
+import argparse
+import time
+
+import numpy as np
+
+from recommendation.cf import ItemNeighbors, UserItemMatrix
+
+
+def synthetic_history(n_rows, n_foods, rows_per_user=20, seed=0):
+    '''사용자마다 rows_per_user개의 기록. 음식은 인기 편중(zipf)을 반영.'''
+    rng         = np.random.default_rng(seed)
+    n_users     = max(1, n_rows // rows_per_user)
+    users       = rng.integers(1, n_users + 1, size=n_rows)
+    weights     = 1 / np.arange(1, n_foods + 1)
+    foods       = rng.choice(n_foods, size=n_rows, p=weights / weights.sum()) + 1
+    return users, foods
+
+
+def legacy(users, foods):
+    '''기존 MemoryBasedRecommend의 pandas pivot + 이중 루프 방식.'''
+    import pandas as pd
+    from sklearn.metrics.pairwise import cosine_similarity
+
+    df          = pd.DataFrame({'user': users, 'food': foods, 'values': 1})
+    pivot_table = pd.pivot_table(df, index='user', columns='food', values='values', aggfunc='sum', fill_value=0)
+    food_id_to_idx = {food_id: i for i, food_id in enumerate(pivot_table.columns)}
+    score       = pivot_table.dot(cosine_similarity(pivot_table.T))
+    for row, uid in enumerate(score.index):
+        for ate in df[df.user==uid].food.values:
+            score.iat[row, food_id_to_idx[ate]] = 0
+    return score
+
+
+def timed(func, *args, repeat=1):
+    best        = float('inf')
+    for _ in range(repeat):
+        _t          = time.perf_counter()
+        result      = func(*args)
+        best        = min(best, time.perf_counter() - _t)
+    return result, best * 1000
+
+
+def run(rows, n_foods, k, with_legacy):
+    print(f'{"rows":>10} {"users":>8} {"matrix(ms)":>12} {"build(ms)":>12} {"score(ms)":>10} {"legacy(ms)":>12}')
+    for n_rows in rows:
+        users, foods    = synthetic_history(n_rows, n_foods)
+        matrix, t_matrix= timed(UserItemMatrix.from_pairs, users, foods)
+        neighbors, t_build = timed(ItemNeighbors.build, matrix, k)
+
+        # 요청 1건: 사용자 1명의 기록으로 점수 계산 (기록 수에 비례)
+        history         = foods[users == users[0]]
+        _, t_score      = timed(neighbors.recommend, history, 5, repeat=20)
+
+        t_legacy        = '-'
+        if with_legacy and n_rows <= 10000:
+            _, t_legacy = timed(legacy, users, foods)
+            t_legacy    = f'{t_legacy:.1f}'
+
+        print(f'{n_rows:>10} {matrix.shape[0]:>8} {t_matrix:>12.1f} {t_build:>12.1f} {t_score:>10.3f} {t_legacy:>12}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--foods', type=int, default=412)
+    parser.add_argument('--k', type=int, default=20)
+    parser.add_argument('--legacy', action='store_true', help='10k 이하에서 기존 방식도 측정')
+    args = parser.parse_args()
+
+    run(args.rows, args.foods, args.k, args.legacy)
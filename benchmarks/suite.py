@@ -0,0 +1,193 @@
+'''
+추천 벤치마크 모음: 데이터 규모별로 오프라인 모델 생성과 recommendation/views.py의 각 API 응답 시간을 재고 JSON으로 저장.
+
+테스트 DB(test_<NAME>)를 새로 만들어 사용하므로 개발 DB와 ./data의 모델 파일은 건드리지 않는다.
+규모마다 DB를 비우고 generate_data.generate()로 데이터를 다시 만든다.
+
+    python -m benchmarks.suite
+    python -m benchmarks.suite --scales 1000x20000 10000x200000 --requests 50 --output bench.json
+'''
+import argparse
+import datetime
+import json
+import os
+import platform
+import tempfile
+import time
+
+import numpy as np
+
+# Django 설정(django.setup)은 generate_data를 import할 때 함께 진행됨
+import generate_data
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from recommendation.als import ALS_ITEM_FIELD, als_model
+from recommendation.ann import IVFIndex
+from recommendation.cf import CF_WINDOW_DAYS, ItemNeighbors, neighbors
+from recommendation.export import export_history
+from recommendation.factors import FactorModel
+from recommendation.sampling import food_index
+from recommendation.sweep import ALPHA, fit
+
+
+User        = get_user_model()
+
+# (method, path) - recommendation/urls.py
+VIEWS       = [
+    ('get', 'random'),
+    ('get', 'random?min_kcal=300&max_kcal=700'),
+    ('get', 'yesterday-popular'),
+    ('get', 'interest-popular'),
+    ('get', 'interest-user'),
+    ('get', 'memory-cf'),
+    ('get', 'als'),
+    ('post', 'batch'),
+]
+BATCH_USERS = 100
+
+
+def summary(seconds):
+    ms          = np.asarray(seconds) * 1000
+    return {
+        'requests'  : len(ms),
+        'mean_ms'   : round(float(ms.mean()), 3),
+        'p50_ms'    : round(float(np.percentile(ms, 50)), 3),
+        'p95_ms'    : round(float(np.percentile(ms, 95)), 3),
+        'max_ms'    : round(float(ms.max()), 3),
+    }
+
+
+def timed(func, *args, **kwargs):
+    _t          = time.perf_counter()
+    result      = func(*args, **kwargs)
+    return result, round(time.perf_counter() - _t, 4)
+
+
+def build_cf(directory):
+    since       = timezone.now() - datetime.timedelta(days=CF_WINDOW_DAYS)
+    model       = ItemNeighbors.build(export_history('food_id', since=since))
+
+    path        = os.path.join(directory, 'cf_neighbors.npz')
+    model.save(path)
+    # 이전 규모의 모델(지워진 임시 디렉터리, flush된 음식 id)을 check_interval 동안 계속 쓰지 않도록
+    neighbors.invalidate(path)
+
+
+def build_als(directory, factors=64, regularization=0.01, iterations=30):
+    '''create_als_model.py와 같은 (사용자 x 음식) 학습. implicit이 없으면 건너뜀'''
+    matrix      = export_history(ALS_ITEM_FIELD)
+
+    model       = fit(matrix.matrix, factors, regularization, iterations)
+
+    FactorModel(
+        user_ids        = matrix.user_ids,
+        item_ids        = matrix.item_ids,
+        user_factors    = model.user_factors,
+        item_factors    = model.item_factors,
+        meta            = {'regularization': regularization, 'alpha': ALPHA},
+        index           = IVFIndex.build(model.item_factors),
+    ).save(directory)
+    als_model.invalidate(os.path.join(directory, 'CURRENT'))
+
+
+def time_views(views, user_ids, n_requests, rng):
+    admin       = User.objects.create_superuser('bench-admin', '', 'qwer1234!@')
+    client      = APIClient()
+    results     = {}
+    for method, path in views:
+        seconds     = []
+        for user_id in rng.choice(user_ids, size=n_requests):
+            if method == 'post':
+                client.force_authenticate(admin)
+                body        = {'user_ids': rng.choice(user_ids, size=BATCH_USERS).tolist(), 'strategy': 'als'}
+                _t          = time.perf_counter()
+                response    = client.post(f'/api/recommendation/{path}', body, format='json')
+            else:
+                client.force_authenticate(User.objects.get(pk=int(user_id)))
+                _t          = time.perf_counter()
+                response    = client.get(f'/api/recommendation/{path}')
+            seconds.append(time.perf_counter() - _t)
+            assert response.status_code == 200, (path, response.status_code)
+        results[f'{method.upper()} {path}'] = summary(seconds)
+    return results
+
+
+def run_scale(n_users, n_histories, n_requests, seed):
+    call_command('flush', interactive=False, verbosity=0)
+    food_index.invalidate()
+    rng         = np.random.default_rng(seed)
+
+    user_ids, t_generate = timed(
+        generate_data.generate, n_users, n_histories, seed=seed, verbose=False
+    )
+    result      = {
+        'users'         : n_users,
+        'histories'     : n_histories,
+        'generate_s'    : t_generate,
+        'build'         : {},
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        _, result['build']['memory-cf_s'] = timed(build_cf, directory)
+        try:
+            _, result['build']['als_s'] = timed(build_als, os.path.join(directory, 'als'))
+        except ImportError:
+            als_model.invalidate(os.path.join(directory, 'als', 'CURRENT'))
+            result['build']['als_s'] = None
+
+        views       = VIEWS
+        if result['build']['als_s'] is None:
+            views   = [(method, path) for method, path in VIEWS if path not in ('als', 'batch')]
+
+        # 응답 캐시를 끄고 매 요청의 계산 시간을 잰다
+        with override_settings(RECOMMENDATION={**settings.RECOMMENDATION, 'CACHE_TIMEOUT': 0}):
+            result['views'] = time_views(views, user_ids, n_requests, rng)
+    return result
+
+
+def run(scales, n_requests, seed, output):
+    setup_test_environment()
+    old_name    = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        results = [run_scale(n_users, n_histories, n_requests, seed) for n_users, n_histories in scales]
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+    report      = {
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python'    : platform.python_version(),
+        'numpy'     : np.__version__,
+        'database'  : settings.DATABASES['default']['ENGINE'],
+        'requests'  : n_requests,
+        'seed'      : seed,
+        'scales'    : results,
+    }
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    print(f'DONE: Saved benchmark results to {output}')
+
+
+def scale(value):
+    '''"사용자수x기록수" (ex. 1000x20000)'''
+    n_users, n_histories = value.lower().split('x')
+    return int(n_users), int(n_histories)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scales', type=scale, nargs='+', default=[(1000, 20000), (10000, 200000)])
+    parser.add_argument('--requests', type=int, default=30, help='API별 요청 수')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=f'./benchmarks/results/suite-{datetime.datetime.now(datetime.timezone.utc):%Y%m%d%H%M%S}.json')
+    args = parser.parse_args()
+
+    run(args.scales, args.requests, args.seed, args.output)
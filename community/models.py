@@ -62,6 +62,10 @@ class Post(TimeStampedModel):
     class Meta:
         db_table = 'community_post'
         ordering = ['-created_at']
+        indexes  = [
+            # CursorPagination: (정렬, id) 순서로 cursor 다음 행을 바로 찾는다
+            models.Index(fields=['-created_at', '-id'], name='post_created_id_idx'),
+        ]
 
     def __str__(self):
         return f'{self.title} | {self.user}'
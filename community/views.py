@@ -21,10 +21,10 @@ from community.serializers import (
 )
 from community.models import Category, Post, Comment
 from core.permissions import IsAdminOrReadOnly, IsOwnerOrReadOnly
-from core.utils import Pagination, PaginationHandlerMixin
+from core.utils import CursorPagination, PaginationHandlerMixin
 
 class PostList(APIView, PaginationHandlerMixin):
-    pagination_class    = Pagination
+    pagination_class    = CursorPagination
     serializer_class    = PostListSerializer
     permission_classes  = (IsAuthenticated, )
     authentication_classes = (TokenAuthentication,)
@@ -38,7 +38,7 @@ class PostList(APIView, PaginationHandlerMixin):
             openapi.Parameter('u', openapi.IN_QUERY, description='Search for user nickname', type=openapi.TYPE_STRING),
             openapi.Parameter('s', openapi.IN_QUERY, description='Sort by', type=openapi.TYPE_STRING),
             openapi.Parameter('limit', openapi.IN_QUERY, description='Page limit size', type=openapi.TYPE_STRING),
-            openapi.Parameter('page', openapi.IN_QUERY, description='Page number', type=openapi.TYPE_STRING),
+            openapi.Parameter('cursor', openapi.IN_QUERY, description='Cursor of next/previous page', type=openapi.TYPE_STRING),
         ],
         responses               = {200: openapi.Response('', serializer_class(many=True))}
     )
@@ -61,6 +61,7 @@ PROJECT_APPS = [
     'account',
     'community',
     'feature',
+    'recommendation',
 ]
 
 INSTALLED_APPS = DJANGO_APPS + PROJECT_APPS
@@ -83,6 +84,24 @@ SWAGGER_SETTINGS = {
     }
 }
 
+RECOMMENDATION = {
+    # True면 refresh_recommendations 명령으로 미리 계산해 둔 결과를 먼저 사용
+    'SERVE_PRECOMPUTED': False,
+    # ALS 추천의 item 검색 방식 ('exact' | 'ann')
+    'RETRIEVAL': 'exact',
+    # 사용자별/전략별 추천 응답 캐시 시간(초)
+    'CACHE_TIMEOUT': 300,
+}
+
+# 추천 응답 캐시의 invalidate가 모든 워커(프로세스)와 refresh_recommendations 명령에 반영되도록 공유되는 캐시를 사용
+# (LocMemCache는 프로세스마다 따로 있어 워커가 하나일 때만 맞음)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, '.cache'),
+    },
+}
+
 # CACHES = {
 #     'default': {
 #         'BACKEND': 'django_redis.cache.RedisCache',
@@ -1,9 +1,144 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class Pagination(PageNumberPagination):
     page_size_query_param = 'limit'
 
+class CursorPagination(BasePagination):
+    '''
+    keyset(cursor) pagination. 정렬 컬럼 값과 id로 다음 페이지의 시작 위치를 찾는다.
+    COUNT(*)와 OFFSET이 없으므로 몇 번째 페이지든 (정렬 컬럼, id) 인덱스에서 limit + 1개만 읽는다.
+
+    정렬은 queryset의 order_by(없으면 Meta.ordering)를 그대로 쓰고, 값이 같은 행을 구분하도록
+    첫 정렬과 같은 방향으로 id를 덧붙인다. ex) ['-created_at'] -> (-created_at, -id), ['name'] -> (name, id)
+
+    Pagination과 같이 limit이 있을 때만 나누며, 응답은 {'next', 'previous', 'results'}.
+    '''
+    page_size_query_param   = 'limit'
+    cursor_query_param      = 'cursor'
+    invalid_cursor_message  = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return None
+        return page_size if page_size > 0 else None
+
+    def get_ordering(self, queryset):
+        ordering    = list(queryset.query.order_by or queryset.model._meta.ordering)
+        assert all(isinstance(field, str) for field in ordering), 'CursorPagination은 필드 이름으로 된 정렬만 지원합니다.'
+        if not {'id', 'pk'} & {field.lstrip('-') for field in ordering}:
+            ordering.append('-pk' if ordering and ordering[0].startswith('-') else 'pk')
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size  = self.get_page_size(request)
+        if self.page_size is None:
+            return None
+
+        self.request    = request
+        self.ordering   = self.get_ordering(queryset)
+        cursor          = self.decode_cursor(queryset.model, request)
+
+        # 이전 페이지는 정렬을 뒤집어서 cursor 앞쪽의 limit개를 읽고 다시 뒤집는다
+        reverse         = cursor is not None and cursor[0]
+        ordering        = [_invert(field) for field in self.ordering] if reverse else self.ordering
+        queryset        = queryset.order_by(*ordering)
+        if cursor is not None:
+            queryset    = queryset.filter(_after(ordering, cursor[1]))
+
+        rows            = list(queryset[:self.page_size + 1])
+        has_more        = len(rows) > self.page_size
+        rows            = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.has_next       = has_more if not reverse else True
+        self.has_previous   = cursor is not None if not reverse else has_more
+        self.rows           = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_next_link(self):
+        if not self.has_next or not self.rows:
+            return None
+        return self.encode_cursor(False, self.rows[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.rows:
+            return None
+        return self.encode_cursor(True, self.rows[0])
+
+    def encode_cursor(self, reverse, row):
+        values      = [getattr(row, field.lstrip('-')) for field in self.ordering]
+        cursor      = json.dumps([reverse, values], default=_json_default, separators=(',', ':'))
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            base64.urlsafe_b64encode(cursor.encode()).decode(),
+        )
+
+    def decode_cursor(self, model, request):
+        '''(reverse, 정렬 컬럼 값 목록) 또는 None. 값은 모델 필드의 타입으로 바꾼다. (ex. created_at -> datetime)'''
+        encoded     = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            reverse, values = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            if len(values) != len(self.ordering):
+                raise ValueError
+            return bool(reverse), [
+                _to_python(model, field.lstrip('-'), value) for field, value in zip(self.ordering, values)
+            ]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+def _invert(field):
+    return field[1:] if field.startswith('-') else '-' + field
+
+def _after(ordering, values):
+    '''
+    정렬 순서에서 values 다음에 오는 행의 조건.
+    (a, b) 순이면 a > va OR (a = va AND b > vb) (내림차순 필드는 <)
+    '''
+    condition   = Q()
+    for i, field in enumerate(ordering):
+        name        = field.lstrip('-')
+        lookup      = 'lt' if field.startswith('-') else 'gt'
+        condition   |= Q(
+            **{prev.lstrip('-'): value for prev, value in zip(ordering[:i], values[:i])},
+            **{f'{name}__{lookup}': values[i]},
+        )
+    return condition
+
+def _json_default(value):
+    # DjangoJSONEncoder는 datetime을 ms 단위로 자르므로 같은 ms 안의 행을 건너뛴다. microsecond까지 그대로 쓴다.
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+def _to_python(model, name, value):
+    try:
+        field   = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+    except FieldDoesNotExist:
+        # annotate 한 값 (ex. 댓글 수)
+        return value
+    return field.to_python(value)
+
 class PaginationHandlerMixin(object):
     @property
     def paginator(self):
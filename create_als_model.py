@@ -1,61 +1,107 @@
-import datetime
-import joblib
-
-import pandas as pd
-import numpy as np
-import scipy.sparse as sparse
-from scipy.sparse.linalg import spsolve
-import random
-import implicit
-from implicit.evaluation import  *
-from implicit.als import AlternatingLeastSquares as ALS
-
-
-HISTORY_PATH    = './data/history_test.csv'
-FOOD_PATH       = './data/food_test.csv'
-
-history = pd.read_csv(HISTORY_PATH)
-food = pd.read_csv(FOOD_PATH)
-
-history.columns = ['user_id', 'food_id', 'date(utc)']
-
-data = history.merge(
-    food, on='food_id'
-)[['user_id', 'food_id', 'food_category', 'date(utc)']].sort_values(
-    'user_id'
-).reset_index(drop=True)
-
-data['date(utc)'] = data['date(utc)'].astype('datetime64')
-
-data.reset_index(inplace=True, drop=True)
+'''
+ALS 모델 생성. (사용자 x 음식) 먹은 횟수를 confidence(1 + alpha * log(1 + 횟수))로 바꿔 학습한다.
 
-train_df = data[['user_id', 'food_id', 'food_category']]
-train_df['values'] = 1
+    python create_als_model.py
+    python create_als_model.py --sweep --factors 16 32 64 --regularization 0.01 0.1 --alpha 5 10 40 --workers 4
 
-train_sum = train_df.groupby(['user_id', 'food_category'])['values'].sum().reset_index()
-
-user_id = list(np.sort(train_sum['user_id'].unique()))
-food_category = list(train_sum['food_category'].unique())
-values = list(train_sum['values'])
-
-rows = train_sum['user_id'].astype('category').cat.codes
-cols = train_sum['food_category'].astype('category').cat.codes
-
-sparse_train = sparse.csr_matrix((values, (rows, cols)))
-
-tmp = train_sum
-tmp['cat_vec'] = cols
-category = tmp.drop_duplicates('food_category').sort_values(by='cat_vec')['food_category'].to_list()
-
-als_model = ALS(
-    factors=64,
-    regularization=0.01,
-    iterations=30,
-)
-
-als_model.fit(sparse_train)
-
-joblib.dump(als_model, './data/als_model.pkl') 
-reverse_category = {name: i for i, name in enumerate(category)}
-joblib.dump(reverse_category, './data/als_category.pkl')
-print('DONE: ALS model created.')
\ No newline at end of file
+--sweep: 기록을 학습/평가용으로 나눠 모든 조합을 병렬로 학습하고 precision@k, ndcg@k로 평가한 뒤,
+         leaderboard(./data/als_sweep.json)를 쓰고 가장 좋은 설정으로 전체 기록을 다시 학습해 배포한다.
+'''
+import os
+import argparse
+import datetime
+import json
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+django.setup()
+
+from django.utils import timezone
+
+from recommendation.als import ALS_ITEM_FIELD, save_als
+from recommendation.export import export_history
+from recommendation.sweep import ALPHA, fit, sweep
+
+
+SWEEP_PATH      = './data/als_sweep.json'
+
+FACTORS         = 64
+REGULARIZATION  = 0.01
+ITERATIONS      = 30
+
+
+def main(args):
+    # 이 시각까지의 기록이 반영됨. 이후의 기록은 update_als_users 명령으로 증분 갱신
+    history_until = timezone.now()
+
+    # 사용자 x 음식 CSR 행렬 (값: 먹은 횟수). CSV 없이 DB에서 chunk 단위로 바로 읽음
+    matrix = export_history(ALS_ITEM_FIELD)
+
+    config = {
+        'factors'       : args.factors[0],
+        'regularization': args.regularization[0],
+        'iterations'    : args.iterations[0],
+        'alpha'         : args.alpha[0],
+    }
+    evaluation = {}
+    if args.sweep:
+        leaderboard = sweep(
+            matrix.matrix,
+            {
+                'factors'       : args.factors,
+                'regularization': args.regularization,
+                'iterations'    : args.iterations,
+                'alpha'         : args.alpha,
+            },
+            k           = args.k,
+            test_ratio  = args.test_ratio,
+            workers     = args.workers,
+            seed        = args.seed,
+        )
+        with open(SWEEP_PATH, 'w') as f:
+            json.dump({
+                'created_at'    : datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                'k'             : args.k,
+                'test_ratio'    : args.test_ratio,
+                'leaderboard'   : leaderboard,
+            }, f, ensure_ascii=False, indent=2)
+
+        print(f'{"factors":>8} {"reg":>8} {"iters":>6} {"alpha":>6} {f"p@{args.k}":>8} {f"ndcg@{args.k}":>8} {"train(s)":>9}')
+        for result in leaderboard:
+            print(
+                f'{result["factors"]:>8} {result["regularization"]:>8} {result["iterations"]:>6} {result["alpha"]:>6} '
+                f'{result["precision"]:>8.4f} {result["ndcg"]:>8.4f} {result["train_seconds"]:>9.2f}'
+            )
+
+        best        = leaderboard[0]
+        config      = {name: best[name] for name in config}
+        evaluation  = {f'precision@{args.k}': best['precision'], f'ndcg@{args.k}': best['ndcg']}
+
+    # 가장 좋은 설정(또는 지정한 설정)으로 전체 기록을 학습해 배포
+    als_model = fit(matrix.matrix, seed=args.seed, **config)
+
+    save_als(
+        als_model, matrix.item_ids, matrix.user_ids,
+        **config,
+        **evaluation,
+        trained_at      = datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        history_until   = history_until.isoformat(),
+    )
+    print(f'DONE: ALS model created. ({config})')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sweep', action='store_true')
+    parser.add_argument('--factors', type=int, nargs='+', default=[FACTORS])
+    parser.add_argument('--regularization', type=float, nargs='+', default=[REGULARIZATION])
+    parser.add_argument('--iterations', type=int, nargs='+', default=[ITERATIONS])
+    parser.add_argument('--alpha', type=float, nargs='+', default=[ALPHA])
+    parser.add_argument('-k', type=int, default=5, help='precision@k, ndcg@k (ALS 추천은 상위 5개 음식)')
+    parser.add_argument('--test-ratio', type=float, default=0.2)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    main(args)
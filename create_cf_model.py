@@ -0,0 +1,23 @@
+import os
+import datetime
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+django.setup()
+
+from django.utils import timezone
+
+from recommendation.cf import CF_WINDOW_DAYS, ItemNeighbors
+from recommendation.export import export_history
+
+
+# 최근 10일 간의 데이터를 사용
+since = timezone.now() - datetime.timedelta(days=CF_WINDOW_DAYS)
+
+# 사용자 x 음식 CSR 행렬. 같은 음식을 여러 번 먹었다면 횟수만큼 더해짐 (CSV 없이 DB에서 바로 읽음)
+matrix = export_history('food_id', since=since)
+
+neighbors = ItemNeighbors.build(matrix)
+neighbors.save()
+print(f'DONE: CF neighbors created. (version: {neighbors.version}, foods: {len(neighbors)})')
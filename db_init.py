@@ -139,32 +139,14 @@ def create_histories():
     print(f'DONE: Create histories by considering their interest ({history_size} histories per person')
 
 def createCSV():
-    histories   = f.History.objects.all()[:]
-    df          = pd.DataFrame()
-
-    for history in histories:
-        tmp     = pd.DataFrame(
-            {
-                'user': [history.user.id],
-                'food': [history.food.id],
-                'date(utc)': [history.created_at]
-            }
-        )
-        df      = pd.concat([df, tmp])
+    # 행마다 DataFrame을 이어 붙이지 않고, 필요한 컬럼만 한 번에 읽어서 만듦
+    histories   = f.History.objects.order_by().values_list('user_id', 'food_id', 'created_at')
+    df          = pd.DataFrame(list(histories), columns=['user', 'food', 'date(utc)'])
     df.to_csv(f'./data/history_test.csv', index=False)
     print('DONE: Create CSV file of history to \'./data/history_test.csv\'. (For ML or DS, \'date\': UTC)')
 
-    foods       = f.Food.objects.all()[:]
-    df          = pd.DataFrame()
-    for food in foods:
-        tmp     = pd.DataFrame(
-            {
-                'food_name': [food.name],
-                'food_category': [food.category.name],
-                'food_id': [food.id]
-            }
-        )
-        df      = pd.concat([df, tmp])
+    foods       = f.Food._base_manager.order_by().values_list('name', 'category__name', 'id')
+    df          = pd.DataFrame(list(foods), columns=['food_name', 'food_category', 'food_id'])
     df.to_csv(f'./data/food_test.csv', index=False)
 
     print('DONE: Create CSV file of history to \'./data/food_test.csv\'. (For ML or DS)')
@@ -3,6 +3,7 @@ from django.contrib import admin
 from feature.models import (
     Category, 
     Food, 
+    FoodViewCount,
     History,
     Review
 )
@@ -10,5 +11,6 @@ from feature.models import (
 
 admin.site.register(Category)
 admin.site.register(Food)
+admin.site.register(FoodViewCount)
 admin.site.register(History)
 admin.site.register(Review)
@@ -0,0 +1,144 @@
+import datetime
+import os
+import threading
+import time
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import DatabaseError, IntegrityError, connections, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from feature.models import Food, FoodViewCount
+
+
+# 랭킹에 반영할 기간. 분 단위 bucket 1440개
+RANKING_WINDOW          = datetime.timedelta(days=1)
+# 메모리에 모은 조회 수를 FoodViewCount에 더하는 주기(초). 프로세스가 종료되면 이 시간만큼의 조회 수를 잃을 수 있음
+# 요청과 상관없이 프로세스마다 background thread에서 더한다
+FLUSH_INTERVAL          = 10
+
+RANKING_KEY             = 'feature:food-ranking'
+RANKING_CACHE_TIMEOUT   = 60
+
+
+def _minute(now):
+    return now.replace(second=0, microsecond=0)
+
+
+class FoodViewCounter:
+    '''
+    음식 상세 조회 수를 분 단위 bucket({minute: Counter(food id)})으로 메모리에 모으고,
+    flush_interval마다 background thread에서 (minute, food) 행에 더한다. 요청 중에는 DB에 쓰지 않으며,
+    여러 프로세스의 수는 테이블에서 합쳐진다. flush_interval이 None이면 thread 없이 flush()/top()에서만 더한다.
+    '''
+    def __init__(self, flush_interval=FLUSH_INTERVAL, window=RANKING_WINDOW):
+        self.flush_interval = flush_interval
+        self.window         = window
+        self._lock          = threading.Lock()
+        self._buckets       = {}
+        # thread를 시작한 프로세스. fork된 워커는 부모의 thread를 물려받지 않으므로 다시 시작
+        self._flusher_pid   = None
+
+    def add(self, food_id, count=1, now=None):
+        minute      = _minute(now or timezone.now())
+        with self._lock:
+            self._buckets.setdefault(minute, Counter())[int(food_id)] += count
+            start   = self.flush_interval is not None and self._flusher_pid != os.getpid()
+            if start:
+                self._flusher_pid = os.getpid()
+        if start:
+            threading.Thread(target=self._run, name='food-view-flush', daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.try_flush()
+            finally:
+                # 이 thread의 DB 연결 (다음 flush까지 열어 두지 않음)
+                connections.close_all()
+
+    def try_flush(self):
+        '''flush하되 DB 오류로 요청이나 flush thread를 멈추지 않는다. 모은 수는 남아 있으므로 다음 flush에서 다시 시도'''
+        try:
+            return self.flush()
+        except DatabaseError:
+            return 0
+
+    def flush(self):
+        '''메모리의 bucket을 테이블에 더하고 기간이 지난 행을 지운다. 더한 (minute, food) 수를 반환'''
+        with self._lock:
+            buckets, self._buckets = self._buckets, {}
+        # DB에 쓰지 못하는 동안 모인 bucket 중 기간이 지난 것은 버림
+        buckets     = self._unexpired(buckets)
+        if not buckets:
+            return 0
+
+        try:
+            with transaction.atomic():
+                # 그 사이 삭제된 음식은 버림
+                food_ids    = set(Food.objects.filter(
+                    pk__in={food_id for counts in buckets.values() for food_id in counts}
+                ).values_list('pk', flat=True))
+                rows        = [
+                    (minute, food_id, count)
+                    for minute, counts in buckets.items()
+                    for food_id, count in counts.items() if food_id in food_ids
+                ]
+                for minute, food_id, count in rows:
+                    self._add_row(minute, food_id, count)
+                FoodViewCount.objects.filter(minute__lt=_minute(timezone.now()) - self.window).delete()
+        except DatabaseError:
+            self._restore(buckets)
+            raise
+        return len(rows)
+
+    def _add_row(self, minute, food_id, count):
+        rows        = FoodViewCount.objects.filter(minute=minute, food_id=food_id)
+        if rows.update(count=F('count') + count):
+            return
+        try:
+            with transaction.atomic():
+                FoodViewCount.objects.create(minute=minute, food_id=food_id, count=count)
+        except IntegrityError:
+            # 다른 프로세스가 먼저 만든 경우
+            rows.update(count=F('count') + count)
+
+    def _unexpired(self, buckets):
+        cutoff      = _minute(timezone.now()) - self.window
+        return {minute: counts for minute, counts in buckets.items() if minute >= cutoff}
+
+    def _restore(self, buckets):
+        # 기간이 지난 bucket은 다시 시도하지 않음 (DB 장애가 길어도 메모리가 계속 늘지 않도록)
+        buckets     = self._unexpired(buckets)
+        with self._lock:
+            for minute, counts in buckets.items():
+                self._buckets.setdefault(minute, Counter()).update(counts)
+
+    def top(self, n=10, now=None):
+        '''최근 window 동안 조회 수가 많은 food id n개. 이 프로세스가 모은 수를 먼저 flush한다.'''
+        # flush에 실패해도 테이블에 있는 수로 순위를 만든다
+        self.try_flush()
+        until       = _minute(now or timezone.now())
+        # 양쪽으로 닫힌 범위여야 planner가 food 인덱스로 전체를 읽지 않고 (minute, food) 인덱스로 찾는다
+        return [
+            food_id for food_id, _ in FoodViewCount.objects.filter(
+                minute__gt=until - self.window, minute__lte=until
+            ).values('food').annotate(
+                total=Sum('count')
+            ).order_by('-total', 'food').values_list('food', 'total')[:n]
+        ]
+
+
+food_views = FoodViewCounter()
+
+
+def ranking(n=10):
+    '''조회 수 상위 food id. 분 단위 집계이므로 RANKING_CACHE_TIMEOUT 동안 캐시한다.'''
+    key         = f'{RANKING_KEY}:{n}'
+    food_ids    = cache.get(key)
+    if food_ids is None:
+        food_ids    = food_views.top(n)
+        cache.set(key, food_ids, timeout=RANKING_CACHE_TIMEOUT)
+    return food_ids
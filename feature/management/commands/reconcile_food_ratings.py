@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from feature.models import Food
+
+
+class Command(BaseCommand):
+    help = (
+        'Food에 저장된 평점 합/리뷰 수/평균 평점을 Review에서 다시 집계해, 어긋난 음식만 고칩니다. '
+        '(queryset.update()나 DB를 직접 수정해서 receiver가 실행되지 않은 경우)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--foods', type=int, nargs='*', help='지정한 음식만 확인')
+        parser.add_argument('--dry-run', action='store_true', help='고치지 않고 어긋난 음식만 출력')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            foods   = Food.objects.with_review_stats().order_by('pk')
+            if options['foods']:
+                foods   = foods.filter(pk__in=options['foods'])
+            for food in foods.iterator():
+                stored  = (food.reviews_count, food.rating_sum, food.rating_avg)
+                actual  = (food.actual_reviews_count, food.actual_rating_sum, food.actual_rating_avg)
+                if stored != actual:
+                    self.stdout.write(
+                        f'{food.pk} {food.name}: reviews_count {food.reviews_count} -> {food.actual_reviews_count}, '
+                        f'rating_sum {food.rating_sum} -> {food.actual_rating_sum}, '
+                        f'rating_avg {food.rating_avg} -> {food.actual_rating_avg}'
+                    )
+            return
+
+        count       = Food.objects.reconcile(options['foods'] or None)
+        self.stdout.write(f'DONE: Reconciled {count} foods.')
@@ -1,7 +1,13 @@
-from django.db import models
+from collections import defaultdict, deque
+
+from django.db import connections, models, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import Signal, receiver
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db.models.functions import Coalesce
+from django.db.models.functions import Cast, Coalesce, Round
+from django.utils import timezone
 
 from core.models import TimeStampedModel
 
@@ -42,25 +48,85 @@ def upload_func(instance, filename):
     else:
         return 'images/food/{}.{}'.format(name ,ext)
 
+# Review가 추가/수정/삭제될 때 DB에서 갱신되는 Food의 컬럼
+REVIEW_STAT_FIELDS = ('rating_sum', 'reviews_count', 'rating_avg')
+
+def rating_avg(rating_sum, reviews_count):
+    '''rating_sum / reviews_count (리뷰가 없으면 0), 소수 둘째 자리까지'''
+    return models.Case(
+        models.When(
+            **{f'{reviews_count}__gt': 0},
+            then=Round(Cast(rating_sum, models.FloatField()) / F(reviews_count), 2),
+        ),
+        default     = 0,
+        output_field= models.DecimalField(max_digits=4, decimal_places=2),
+    )
+
+RATING_AVG = rating_avg('rating_sum', 'reviews_count')
+
 class FoodModelManager(models.Manager):
     def get_queryset(self):
+        # 평점/리뷰 수는 Food의 컬럼에 저장되어 있으므로 리뷰를 join하지 않음
         return super().get_queryset().select_related(
             'category'
-        ).prefetch_related(
-            'histories', 'histories__review'
-        ).annotate(
-            rating_avg=Coalesce(
-                models.Avg('histories__review__rating'),
-                0, 
-                output_field=models.DecimalField(
-                    max_digits      =4,
-                    decimal_places  =2
-                )
-            ),
+        )
+
+    def with_review_stats(self):
+        '''
+        Review에서 직접 집계한 리뷰 수(actual_reviews_count), 평점 합(actual_rating_sum)과
+        그 값으로 계산한 평균 평점(actual_rating_avg)을 붙인다.
+        '''
+        return self.get_queryset().annotate(
+            actual_reviews_count= models.Count('histories__review'),
+            actual_rating_sum   = Coalesce(models.Sum('histories__review__rating'), 0),
         ).annotate(
-            reviews_count=models.Count('histories__review')
+            actual_rating_avg   = rating_avg('actual_rating_sum', 'actual_reviews_count'),
         )
 
+    def apply_review(self, food_id, rating, count=1):
+        '''
+        음식의 평점 합에 rating, 리뷰 수에 count를 더한다. (리뷰 삭제: -평점, -1 / 평점 수정: 차이, 0)
+        다른 요청과 겹쳐도 틀어지지 않도록 F()로 DB에서 계산하고, rating_avg는 바뀐 값으로 다시 계산한다.
+        '''
+        with transaction.atomic():
+            self.filter(pk=food_id).update(
+                rating_sum      = F('rating_sum') + rating,
+                reviews_count   = F('reviews_count') + count,
+            )
+            self.filter(pk=food_id).update(rating_avg=RATING_AVG)
+
+    def reconcile(self, food_ids=None):
+        '''
+        저장된 평점 합/리뷰 수/평균 평점이 Review의 집계와 다른 음식을 고치고, 고친 음식 수를 반환한다.
+        food_ids가 없으면 모든 음식.
+        '''
+        foods       = self.with_review_stats().order_by()
+        if food_ids is not None:
+            foods   = foods.filter(pk__in=food_ids)
+        drifted     = [
+            Food(pk=pk, reviews_count=count, rating_sum=total)
+            for pk, count, total in foods.exclude(
+                reviews_count   = F('actual_reviews_count'),
+                rating_sum      = F('actual_rating_sum'),
+                rating_avg      = F('actual_rating_avg'),
+            ).values_list('pk', 'actual_reviews_count', 'actual_rating_sum')
+        ]
+        with transaction.atomic():
+            self.bulk_update(drifted, ['reviews_count', 'rating_sum'], batch_size=1000)
+            self.filter(pk__in=[food.pk for food in drifted]).update(rating_avg=RATING_AVG)
+        return len(drifted)
+
+    def in_order(self, food_ids):
+        '''
+        순위대로 정렬된 food id 목록 -> 같은 순서의 Food 목록 (없는 id는 제외)
+        FoodListSerializer에 필요한 컬럼만, prefetch 없이 한 번의 쿼리로 가져온다.
+        '''
+        food_ids    = [int(food_id) for food_id in food_ids]
+        foods       = self.get_queryset().only(
+            'name', 'image', 'category__name', 'rating_avg', 'reviews_count'
+        ).in_bulk(food_ids)
+        return [foods[food_id] for food_id in food_ids if food_id in foods]
+
 class Food(models.Model):
 
     category    = models.ForeignKey(
@@ -93,34 +159,115 @@ class Food(models.Model):
         null        = True,
     )
 
+    # Review가 추가/수정/삭제될 때마다 갱신 (아래 receiver). 어긋나면 reconcile_food_ratings 명령으로 다시 집계
+    rating_sum  = models.IntegerField(
+        verbose_name= 'rating sum',
+        default     = 0,
+        editable    = False,
+    )
+
+    reviews_count = models.IntegerField(
+        verbose_name= 'reviews count',
+        default     = 0,
+        editable    = False,
+    )
+
+    rating_avg  = models.DecimalField(
+        max_digits  = 4,
+        decimal_places= 2,
+        verbose_name= 'rating avg',
+        default     = 0,
+        editable    = False,
+    )
+
     objects     = FoodModelManager()
 
     class Meta:
         db_table = 'feature_food'
         ordering = ['name']
+        indexes  = [
+            # CursorPagination: (정렬, id) 순서로 cursor 다음 행을 바로 찾는다
+            models.Index(fields=['name', 'id'], name='food_name_id_idx'),
+        ]
 
     def __str__(self):
         return f'{self.category.name} | {self.name}'
 
+    def save(self, *args, **kwargs):
+        # 평점 합/리뷰 수/평균은 Review receiver가 F()로 갱신한다. 수정 화면/API의 save()가 읽어 온 시점의 값으로
+        # 덮어쓰지 않도록, update_fields를 지정하지 않은 수정에서는 제외한다. (다시 맞추려면 reconcile)
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            deferred    = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in REVIEW_STAT_FIELDS and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
     @property
     def reviews(self):
         return Review.objects.filter(history__food=self)
 
-    # @property
-    # def rating_avg(self):
-    #     return self.reviews.aggregate(
-    #             avg=Coalesce(
-    #                 models.Avg('rating'), 
-    #                 0, 
-    #                 output_field=models.DecimalField(
-    #                     max_digits      =4,
-    #                     decimal_places  =2
-    #                 )),
-    #         )['avg']
-
-    # @property
-    # def reviews_count(self):
-    #     return self.reviews.count()
+# bulk_create는 post_save를 보내지 않으므로 HistoryModelManager.bulk_add가 추가한 기록 전체로 한 번 보낸다.
+# sender=History, histories=[History, ...]
+histories_created = Signal()
+
+class HistoryModelManager(models.Manager):
+    def bulk_add(self, user, entries, batch_size=500):
+        '''
+        entries : (Food, 먹은 시각) 목록. 시각이 None이면 지금.
+        한 transaction에서 여러 행씩 insert하고, id가 채워진 History 목록을 반환한다.
+        카운터/캐시는 histories_created를 받아 배치마다 한 번씩 갱신된다.
+        '''
+        now         = timezone.now()
+        histories   = [
+            History(user=user, food=food, created_at=created_at or now, updated_at=now)
+            for food, created_at in entries
+        ]
+        with transaction.atomic(using=self.db):
+            self._insert_raw(histories, batch_size)
+            histories_created.send(sender=History, histories=histories)
+        return histories
+
+    def _insert_raw(self, histories, batch_size):
+        '''
+        bulk_create는 auto_now_add인 created_at을 항상 지금 시각으로 덮어쓰므로,
+        loaddata처럼 raw insert로 객체에 지정된 값을 그대로 저장한다.
+        id는 RETURNING으로 받을 수 있으면(PostgreSQL, sqlite, MariaDB 10.5+) insert 결과로,
+        아니면(MySQL) 방금 추가한 행을 다시 조회해 채운다.
+        '''
+        if not histories:
+            return
+        connection  = connections[self.db]
+        fields      = [field for field in History._meta.concrete_fields if not field.primary_key]
+        returning   = connection.features.can_return_rows_from_bulk_insert
+        # 같은 transaction 안에서 이 id 뒤에 추가된 이 사용자의 행이 이번에 추가한 행
+        last_pk     = None
+        if not returning:
+            last_pk = self.order_by('-pk').values_list('pk', flat=True).first() or 0
+
+        for start in range(0, len(histories), batch_size):
+            batch   = histories[start:start + batch_size]
+            rows    = self._insert(
+                batch, fields=fields, raw=True, using=self.db,
+                returning_fields=History._meta.db_returning_fields if returning else None,
+            )
+            for history, (pk, *_) in zip(batch, rows):
+                history.pk  = pk
+
+        if not returning:
+            # 같은 (음식, 시각)의 행은 서로 구분할 필요가 없으므로 id 순서대로 나눠 준다
+            inserted    = defaultdict(deque)
+            for pk, food_id, created_at in self.filter(
+                user_id=histories[0].user_id, pk__gt=last_pk
+            ).order_by('pk').values_list('pk', 'food_id', 'created_at'):
+                inserted[(food_id, created_at)].append(pk)
+            for history in histories:
+                history.pk  = inserted[(history.food_id, history.created_at)].popleft()
+
+        for history in histories:
+            history._state.adding   = False
+            history._state.db       = self.db
 
 class History(TimeStampedModel):
 
@@ -138,9 +285,19 @@ class History(TimeStampedModel):
         on_delete   = models.CASCADE
     )
 
+    objects     = HistoryModelManager()
+
     class Meta:
         db_table = 'feature_history'
         ordering = ['-created_at']
+        indexes  = [
+            # 나의 기록 목록(cursor), 메모리 기반 CF의 최근 기록
+            models.Index(fields=['user', 'created_at'], name='history_user_created_idx'),
+            # 기간별 집계 (backfill_daily_counts, export_history)
+            models.Index(fields=['created_at', 'food'], name='history_created_food_idx'),
+            # 음식별 기록/리뷰 (Review는 history_id의 unique 인덱스로 이어짐)
+            models.Index(fields=['food', 'created_at'], name='history_food_created_idx'),
+        ]
     
     def __str__(self):
         return f'{self.user.profile.nickname} | {self.food} | {self.created_at}'
@@ -183,6 +340,72 @@ class Review(TimeStampedModel):
     class Meta:
         db_table = 'feature_review'
         ordering = ['-created_at']
+        indexes  = [
+            # CursorPagination: (정렬, id) 순서로 cursor 다음 행을 바로 찾는다
+            models.Index(fields=['-created_at', '-id'], name='review_created_id_idx'),
+        ]
 
     def __str__(self):
         return f'{self.history.food.name} | {self.rating}'
+
+class FoodViewCount(models.Model):
+    '''
+    분 단위 음식 상세 조회 수. 각 프로세스가 메모리에 모은 수를 주기적으로 더한다. (feature.counters)
+    '''
+    minute      = models.DateTimeField(
+        verbose_name= 'minute',
+    )
+
+    food        = models.ForeignKey(
+        Food,
+        related_name= 'view_counts',
+        verbose_name= 'food',
+        on_delete   = models.CASCADE
+    )
+
+    count       = models.PositiveIntegerField(
+        verbose_name= 'count',
+        default     = 0,
+    )
+
+    class Meta:
+        db_table = 'feature_food_view_count'
+        constraints = [
+            models.UniqueConstraint(fields=['minute', 'food'], name='unique_minute_food'),
+        ]
+
+    def __str__(self):
+        return f'{self.minute} | {self.food_id} | {self.count}'
+
+
+def _review_food_id(review):
+    if Review._meta.get_field('history').is_cached(review):
+        return review.history.food_id
+    # 기록이 함께 삭제되는 경우에도 Review가 먼저 삭제되므로 아직 조회할 수 있음
+    return History._base_manager.filter(pk=review.history_id).values_list('food_id', flat=True).first()
+
+@receiver(post_init, sender=Review)
+def stash_rating(sender, instance, **kwargs):
+    # 평점 변경을 알 수 있도록 읽어 온 시점의 값을 기억해 둠 (only() 등으로 지연된 필드라면 조회하지 않음)
+    instance._initial_rating = instance.__dict__.get('rating', models.DEFERRED)
+
+@receiver(post_save, sender=Review)
+def count_review(sender, instance, created, **kwargs):
+    before  = instance._initial_rating
+    instance._initial_rating = instance.rating
+    if created:
+        Food.objects.apply_review(_review_food_id(instance), instance.rating)
+    elif before is models.DEFERRED:
+        # 이전 평점을 모르면 그 음식만 다시 집계
+        Food.objects.reconcile([_review_food_id(instance)])
+    elif before != instance.rating:
+        Food.objects.apply_review(_review_food_id(instance), instance.rating - before, count=0)
+
+@receiver(post_delete, sender=Review)
+def uncount_review(sender, instance, **kwargs):
+    if (food_id := _review_food_id(instance)) is None:
+        return
+    if instance._initial_rating is models.DEFERRED:
+        Food.objects.reconcile([food_id])
+    else:
+        Food.objects.apply_review(food_id, -instance._initial_rating, count=-1)
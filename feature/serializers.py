@@ -1,3 +1,4 @@
+from django.utils import timezone
 from rest_framework import serializers
 
 from feature.models import Category, Food, History, Review
@@ -105,6 +106,29 @@ class HistorySerializer(serializers.ModelSerializer):
             'food_id'   : {'required': True}
         }
 
+# 한 번에 추가할 수 있는 최대 기록 수
+HISTORY_BULK_MAX_SIZE = 500
+
+class HistoryBulkItemSerializer(serializers.Serializer):
+    food_id     = serializers.IntegerField()
+    created_at  = serializers.DateTimeField(required=False)
+
+    def validate_created_at(self, value):
+        if value > timezone.now():
+            raise serializers.ValidationError('created_at cannot be in the future.')
+        return value
+
+class HistoryBulkSerializer(serializers.Serializer):
+    '''
+    각 항목은 HistoryBulkItemSerializer로 따로 검증하므로, 잘못된 항목이 있어도 나머지는 추가된다.
+    '''
+    histories   = serializers.ListField(
+        # 객체가 아닌 항목도 여기서는 받고, 항목별 결과에 오류로 남긴다
+        child       = serializers.JSONField(allow_null=True),
+        min_length  = 1,
+        max_length  = HISTORY_BULK_MAX_SIZE,
+    )
+
 class CategoryListSerializer(serializers.ModelSerializer):
     category_id = serializers.ReadOnlyField(source='id')
     category_name = serializers.ReadOnlyField(source='name')
@@ -1,3 +1,535 @@
+import datetime
+import re
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.db.models import Count
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from account.models import Profile
+from community.models import Category as PostCategory, Comment, Post
+from feature.counters import FoodViewCounter, food_views
+from feature.models import Category, Food, FoodViewCount, History, Review
+from feature.serializers import FoodListSerializer
+from recommendation.models import DailyFoodCount, InterestFoodCount
+
+
+# EXPLAIN QUERY PLAN에서 인덱스로 찾지 않고 테이블 전체를 읽는 단계. ex) SCAN feature_history, SCAN TABLE feature_history
+FULL_SCAN       = re.compile(r'\bSCAN (?:TABLE )?(\w+)')
+
+# 계속 쌓이는 테이블. 요청의 쿼리가 이 테이블을 전체 scan하면 실패
+GROWING_TABLES  = {
+    'feature_history',
+    'feature_review',
+    'feature_food_view_count',
+    'recommendation_daily_food_count',
+    'recommendation_interest_food_count',
+}
+
+
+class FoodInOrderTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        user        = User.objects.create(username='tester')
+        category    = Category.objects.create(name='한식')
+        cls.foods   = [
+            Food.objects.create(category=category, name=f'food{i}', detail='') for i in range(5)
+        ]
+        for rating, food in enumerate(cls.foods):
+            history = History.objects.create(user=user, food=food)
+            Review.objects.create(history=history, rating=rating, content='')
+
+    def test_single_query_in_rank_order(self):
+        ranked      = [self.foods[3].id, self.foods[0].id, 999999, self.foods[4].id]
+
+        with self.assertNumQueries(1):
+            foods   = Food.objects.in_order(ranked)
+            data    = FoodListSerializer(foods, many=True).data
+
+        self.assertEqual(
+            [row['food_id'] for row in data],
+            [self.foods[3].id, self.foods[0].id, self.foods[4].id]
+        )
+        self.assertEqual(data[0]['category_name'], '한식')
+        self.assertEqual(data[0]['reviews_count'], 1)
+        self.assertEqual(data[0]['rating_avg'], 3)
+
+    def test_empty(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(Food.objects.in_order([]), [])
+
+
+class FoodViewCounterTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category        = Category.objects.create(name='한식')
+        cls.foods       = [Food.objects.create(category=category, name=f'food{i}', detail='') for i in range(3)]
+
+    def setUp(self):
+        self.counter    = FoodViewCounter(flush_interval=None)
+        self.now        = timezone.now().replace(second=0, microsecond=0)
+
+    def counts(self):
+        return {
+            (minute, food_id): count
+            for minute, food_id, count in FoodViewCount.objects.values_list('minute', 'food', 'count')
+        }
+
+    def test_add_flush(self):
+        food        = self.foods[0]
+        self.counter.add(food.id, now=self.now)
+        self.counter.add(food.id, now=self.now)
+        self.counter.add(self.foods[1].id, now=self.now - datetime.timedelta(minutes=1))
+        # 요청 중에는 DB에 쓰지 않음
+        self.assertFalse(FoodViewCount.objects.exists())
+
+        self.assertEqual(self.counter.flush(), 2)
+        self.assertEqual(self.counts(), {
+            (self.now, food.id): 2,
+            (self.now - datetime.timedelta(minutes=1), self.foods[1].id): 1,
+        })
+
+        # 이미 있는 행에는 더함
+        self.counter.add(food.id, count=3, now=self.now)
+        self.assertEqual(self.counter.flush(), 1)
+        self.assertEqual(self.counts()[(self.now, food.id)], 5)
+        self.assertEqual(self.counter.flush(), 0)
+
+    def test_flush_drops_deleted_foods_and_expired_rows(self):
+        expired     = self.now - self.counter.window - datetime.timedelta(minutes=1)
+        FoodViewCount.objects.create(minute=expired, food=self.foods[0], count=1)
+        self.counter.add(999999, now=self.now)
+        self.counter.add(self.foods[1].id, now=self.now)
+        self.counter.add(self.foods[2].id, now=expired)
+
+        self.assertEqual(self.counter.flush(), 1)
+        self.assertEqual(self.counts(), {(self.now, self.foods[1].id): 1})
+
+    def test_restore_on_error(self):
+        expired     = self.now - self.counter.window - datetime.timedelta(minutes=1)
+        self.counter.add(self.foods[0].id, now=self.now)
+        self.counter.add(self.foods[1].id, now=expired)
+        with mock.patch.object(FoodViewCounter, '_add_row', side_effect=DatabaseError):
+            self.assertEqual(self.counter.try_flush(), 0)
+            with self.assertRaises(DatabaseError):
+                self.counter.flush()
+
+        # 실패한 수는 다음 flush에서 다시 더하고, 기간이 지난 bucket은 버림
+        self.assertEqual(list(self.counter._buckets), [self.now])
+        self.counter.add(self.foods[0].id, now=self.now)
+        self.assertEqual(self.counter.flush(), 1)
+        self.assertEqual(self.counts(), {(self.now, self.foods[0].id): 2})
+
+    def test_top(self):
+        # 다른 프로세스가 더한 수 + 이 프로세스가 아직 flush하지 않은 수
+        FoodViewCount.objects.create(minute=self.now - datetime.timedelta(minutes=5), food=self.foods[0], count=2)
+        FoodViewCount.objects.create(minute=self.now - self.counter.window, food=self.foods[2], count=10)
+        self.counter.add(self.foods[1].id, count=2, now=self.now)
+        self.counter.add(self.foods[2].id, now=self.now)
+
+        # 조회 수가 같으면 food id 순, window 밖의 행은 세지 않음
+        self.assertEqual(self.counter.top(n=3, now=self.now), [self.foods[0].id, self.foods[1].id, self.foods[2].id])
+        self.assertEqual(self.counter.top(n=1, now=self.now), [self.foods[0].id])
+
+    def test_top_when_flush_fails(self):
+        FoodViewCount.objects.create(minute=self.now, food=self.foods[0], count=1)
+        self.counter.add(self.foods[1].id, count=2, now=self.now)
+        with mock.patch.object(FoodViewCounter, '_add_row', side_effect=DatabaseError):
+            self.assertEqual(self.counter.top(now=self.now), [self.foods[0].id])
+        self.assertEqual(self.counter.top(now=self.now), [self.foods[1].id, self.foods[0].id])
+
+    @mock.patch('feature.counters.threading.Thread')
+    def test_flush_thread(self, thread):
+        # 프로세스마다 한 번만 시작
+        counter     = FoodViewCounter(flush_interval=10)
+        counter.add(self.foods[0].id)
+        counter.add(self.foods[1].id)
+        thread.assert_called_once_with(target=counter._run, name='food-view-flush', daemon=True)
+        thread.return_value.start.assert_called_once_with()
+
+        thread.reset_mock()
+        self.counter.add(self.foods[0].id)
+        thread.assert_not_called()
+
+
+class ReviewStatsTest(TestCase):
+    '''Review receiver가 Food의 평점 합/리뷰 수/평균을 Review의 집계와 같게 유지하는지'''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user        = User.objects.create(username='tester')
+        category        = Category.objects.create(name='한식')
+        cls.food        = Food.objects.create(category=category, name='food', detail='')
+        cls.other       = Food.objects.create(category=category, name='other', detail='')
+
+    def review(self, rating, food=None):
+        history     = History.objects.create(user=self.user, food=food or self.food)
+        return Review.objects.create(history=history, rating=rating, content='')
+
+    def assertStats(self, food, reviews_count, rating_sum, rating_avg):
+        food.refresh_from_db()
+        self.assertEqual(
+            (food.reviews_count, food.rating_sum, food.rating_avg),
+            (reviews_count, rating_sum, Decimal(rating_avg)),
+        )
+        # 저장된 값이 Review에서 직접 집계한 값과 같아야 함
+        self.assertEqual(Food.objects.reconcile([food.pk]), 0)
+
+    def test_create(self):
+        self.review(4)
+        self.review(1)
+        self.review(2)
+        self.assertStats(self.food, 3, 7, '2.33')
+        self.assertStats(self.other, 0, 0, '0')
+
+    def test_rating_change(self):
+        review      = self.review(4)
+        self.review(1)
+        review.rating = 5
+        review.save()
+        self.assertStats(self.food, 2, 6, '3')
+
+        # 같은 평점으로 다시 저장해도 바뀌지 않음
+        review.save()
+        self.assertStats(self.food, 2, 6, '3')
+
+    def test_rating_change_deferred(self):
+        # 이전 평점을 모르면 다시 집계
+        review      = self.review(4)
+        review      = Review.objects.only('history').get(pk=review.pk)
+        review.rating = 1
+        review.save()
+        self.assertStats(self.food, 1, 1, '1')
+
+    def test_delete(self):
+        review      = self.review(4)
+        self.review(1)
+        review.delete()
+        self.assertStats(self.food, 1, 1, '1')
+
+        Review.objects.only('history').get().delete()
+        self.assertStats(self.food, 0, 0, '0')
+
+    def test_delete_with_history(self):
+        # 기록을 지우면 리뷰도 함께 삭제됨
+        self.review(4).history.delete()
+        self.review(2)
+        self.assertStats(self.food, 1, 2, '2')
+
+    def test_food_save_keeps_stats(self):
+        # 리뷰보다 먼저 읽어 온 Food를 저장해도 평점 컬럼을 덮어쓰지 않음
+        food        = Food.objects.get(pk=self.food.pk)
+        self.review(3)
+        food.name   = 'renamed'
+        food.save()
+        self.assertStats(self.food, 1, 3, '3')
+        self.assertEqual(self.food.name, 'renamed')
+
+    def test_reconcile(self):
+        self.review(4)
+        self.review(2, food=self.other)
+        Food.objects.filter(pk=self.food.pk).update(reviews_count=5, rating_sum=1, rating_avg=0)
+        Food.objects.filter(pk=self.other.pk).update(reviews_count=0)
+
+        self.assertEqual(Food.objects.reconcile(), 2)
+        self.assertStats(self.food, 1, 4, '4')
+        self.assertStats(self.other, 1, 2, '2')
+
+    def test_reconcile_rating_avg(self):
+        # 평점 합/리뷰 수는 맞고 평균만 어긋난 경우도 찾아서 고침
+        self.review(3)
+        self.review(4)
+        self.review(4, food=self.other)
+        self.assertEqual(Food.objects.reconcile(), 0)
+        Food.objects.filter(pk=self.food.pk).update(rating_avg=0)
+
+        out         = StringIO()
+        call_command('reconcile_food_ratings', '--dry-run', stdout=out)
+        lines       = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertTrue(lines[0].startswith(f'{self.food.pk} {self.food.name}: reviews_count 2 -> 2'))
+        self.assertIn('rating_avg 0.00 -> 3.5', lines[0])
+
+        self.assertEqual(Food.objects.reconcile(), 1)
+        self.assertStats(self.food, 2, 7, '3.5')
+        self.assertStats(self.other, 1, 4, '4')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN 형식은 sqlite 기준')
+class QueryPlanMixin:
+    '''
+    요청(또는 함수)이 실행한 SELECT를 모두 기록해 EXPLAIN QUERY PLAN으로 확인한다.
+    ANALYZE를 하지 않으므로 sqlite는 테이블이 크다고 가정하고 계획을 세운다. (운영 DB와 비슷)
+    '''
+    @classmethod
+    def seed(cls):
+        cls.categories  = [Category.objects.create(name=name) for name in ('한식', '중식')]
+        cls.foods       = [
+            Food.objects.create(category=cls.categories[i % 2], name=f'food{i}', detail='', image='food.jpg')
+            for i in range(20)
+        ]
+        for i in range(3):
+            User.objects.create(username=f'tester{i}')
+        # Profile은 User와 함께 만들어지므로 선호 대분류를 바꾼 뒤 다시 읽음
+        Profile.objects.filter(user__username__startswith='tester').update(interest_in=cls.categories[0])
+        cls.users       = list(
+            User.objects.filter(username__startswith='tester').select_related('profile').order_by('username')
+        )
+        minute          = timezone.now().replace(second=0, microsecond=0)
+        for i, user in enumerate(cls.users):
+            for j, food in enumerate(cls.foods):
+                history = History.objects.create(user=user, food=food)
+                if j % 2:
+                    Review.objects.create(history=history, rating=j % 5, content='')
+                FoodViewCount.objects.get_or_create(minute=minute, food=food, defaults={'count': i + j})
+
+    def setUp(self):
+        cache.clear()
+        self.client     = APIClient()
+        self.client.force_authenticate(self.users[0])
+        # 음식 상세 조회가 테스트 DB에 쓰는 flush thread를 시작하지 않도록
+        patcher         = mock.patch.object(food_views, 'flush_interval', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def capture_plans(self, func):
+        '''func()가 실행한 SELECT의 [(sql, [계획 단계, ...]), ...]와 func()의 결과'''
+        with CaptureQueriesContext(connection) as queries:
+            result  = func()
+        plans       = []
+        with connection.cursor() as cursor:
+            for query in queries.captured_queries:
+                if query['sql'].startswith('SELECT'):
+                    cursor.execute(f'EXPLAIN QUERY PLAN {query["sql"]}')
+                    plans.append((query['sql'], [row[-1] for row in cursor.fetchall()]))
+        return plans, result
+
+    def assertNoFullScan(self, func, sorted_by_index=False):
+        '''sorted_by_index: ORDER BY가 있는 쿼리는 정렬 없이 인덱스 순서로 읽어야 함 (cursor pagination 목록)'''
+        plans, result = self.capture_plans(func)
+        self.assertTrue(plans)
+        for sql, plan in plans:
+            scanned = GROWING_TABLES & set(FULL_SCAN.findall('\n'.join(plan)))
+            self.assertFalse(scanned, '\n'.join([f'full scan of {sorted(scanned)}', sql, *plan]))
+            if sorted_by_index and ' ORDER BY ' in sql:
+                self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan, '\n'.join([sql, *plan]))
+        return result
+
+    def assertGetNoFullScan(self, path, sorted_by_index=False):
+        response    = self.assertNoFullScan(lambda: self.client.get(path), sorted_by_index)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+class FeatureQueryPlanTest(QueryPlanMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seed()
+
+    def test_history_list(self):
+        response    = self.assertGetNoFullScan('/api/feature/histories?limit=5', sorted_by_index=True)
+        self.assertGetNoFullScan(response.json()['next'], sorted_by_index=True)
+
+    def test_food_reviews(self):
+        self.assertGetNoFullScan(f'/api/feature/foods/{self.foods[1].id}/reviews?limit=5')
+
+    def test_food_detail(self):
+        self.assertGetNoFullScan(f'/api/feature/foods/{self.foods[1].id}')
+
+    def test_food_ranking(self):
+        # FoodRanking은 기본 권한(IsAdminUser 포함)을 사용
+        self.users[0].is_staff = True
+        self.assertGetNoFullScan('/api/feature/ranking/foods')
+
+    def test_detects_full_scan(self):
+        # 인덱스가 없는 컬럼으로 거르면 실패해야 함
+        with self.assertRaises(AssertionError):
+            self.assertNoFullScan(lambda: list(Review.objects.filter(content='')))
+
+
+class CursorPaginationTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user        = User.objects.create(username='tester')
+        category        = Category.objects.create(name='한식')
+        # 같은 이름(정렬 값)이 여러 페이지에 걸치도록
+        cls.foods       = [
+            Food.objects.create(category=category, name=f'food{i // 3}', detail='', image='food.jpg')
+            for i in range(7)
+        ]
+        for food in cls.foods:
+            History.objects.create(user=cls.user, food=food)
+        # created_at이 모두 같아도 id로 이어서 읽어야 함
+        History.objects.update(created_at=timezone.now())
+
+        post_category   = PostCategory.objects.create(name='자유')
+        cls.posts       = [
+            Post.objects.create(user=cls.user, category=post_category, title=f'post{i}', content='')
+            for i in range(6)
+        ]
+        for post, count in zip(cls.posts, (2, 0, 1, 2, 0, 3)):
+            for _ in range(count):
+                Comment.objects.create(user=cls.user, post=post, content='')
+
+    def setUp(self):
+        self.client     = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, path):
+        response    = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def walk(self, path, key):
+        '''next 링크를 끝까지 따라가며 [페이지별 id 목록, ...]과 페이지 응답 목록을 반환'''
+        pages, ids  = [], []
+        while path:
+            page    = self.get(path)
+            pages.append(page)
+            ids.append([row[key] for row in page['results']])
+            path    = page['next']
+        return ids, pages
+
+    def assertPages(self, path, key, expected, limit):
+        ids, pages  = self.walk(f'{path}{"&" if "?" in path else "?"}limit={limit}', key)
+        self.assertEqual(ids, [expected[i:i + limit] for i in range(0, len(expected), limit)])
+        self.assertIsNone(pages[0]['previous'])
+        self.assertIsNone(pages[-1]['next'])
+        # previous 링크는 바로 앞 페이지
+        for before, page in zip(pages, pages[1:]):
+            self.assertEqual(self.get(page['previous'])['results'], before['results'])
+
+    def test_history_list(self):
+        expected    = list(History.objects.filter(user=self.user).order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertPages('/api/feature/histories', 'history_id', expected, limit=3)
+
+    def test_food_list(self):
+        expected    = [food.id for food in sorted(self.foods, key=lambda food: (food.name, food.id))]
+        self.assertPages('/api/feature/foods', 'food_id', expected, limit=2)
+
+    def test_post_comment_sort(self):
+        # 댓글 수(annotate) -> 작성 시각 -> id 순
+        expected    = list(Post.objects.annotate(
+            count=Count('comments')
+        ).order_by('-count', '-created_at', '-id').values_list('id', flat=True))
+        self.assertPages('/api/community/posts?s=comment', 'post_id', expected, limit=2)
+
+    def test_without_limit(self):
+        data        = self.get('/api/feature/histories')
+        self.assertIsInstance(data, list)
+        self.assertEqual(len(data), len(self.foods))
+
+    def test_invalid_cursor(self):
+        response    = self.client.get('/api/feature/histories?limit=2&cursor=invalid')
+        self.assertEqual(response.status_code, 404)
+
+
+class HistoryBulkTest(TestCase):
+    path            = '/api/feature/histories/bulk'
+
+    @classmethod
+    def setUpTestData(cls):
+        category        = Category.objects.create(name='한식')
+        cls.foods       = [Food.objects.create(category=category, name=f'food{i}', detail='') for i in range(2)]
+        cls.user        = User.objects.create(username='tester')
+        Profile.objects.filter(user=cls.user).update(interest_in=category)
+
+    def setUp(self):
+        self.client     = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, histories):
+        return self.client.post(self.path, {'histories': histories}, format='json')
+
+    def test_mixed_batch(self):
+        created_at  = timezone.now().replace(microsecond=123456) - datetime.timedelta(days=2)
+        future      = timezone.now() + datetime.timedelta(days=1)
+        before      = timezone.now()
+        response    = self.post([
+            {'food_id': self.foods[0].id, 'created_at': created_at.isoformat()},
+            {'food_id': 999999},
+            3,
+            {'food_id': self.foods[1].id},
+            None,
+            {'food_id': self.foods[1].id, 'created_at': future.isoformat()},
+            {'created_at': created_at.isoformat()},
+            {'food_id': self.foods[0].id},
+        ])
+        self.assertEqual(response.status_code, 201)
+        data        = response.json()
+        self.assertEqual(data['created'], 3)
+
+        results     = data['results']
+        self.assertEqual([row['index'] for row in results], list(range(8)))
+        self.assertEqual(
+            [row['status'] for row in results],
+            ['created', 'error', 'error', 'created', 'error', 'error', 'error', 'created'],
+        )
+        self.assertIn('food_id', results[1]['errors'])
+        self.assertIn('non_field_errors', results[2]['errors'])
+        self.assertIn('non_field_errors', results[4]['errors'])
+        self.assertIn('created_at', results[5]['errors'])
+        self.assertIn('food_id', results[6]['errors'])
+
+        # 결과의 history_id는 요청 순서대로 실제 행을 가리킴
+        histories   = History.objects.in_bulk([row['history_id'] for row in results if row['status'] == 'created'])
+        for i, food in ((0, self.foods[0]), (3, self.foods[1]), (7, self.foods[0])):
+            history = histories[results[i]['history_id']]
+            self.assertEqual((history.user_id, history.food_id), (self.user.id, food.id))
+            self.assertEqual(results[i]['food_id'], food.id)
+
+        # created_at을 보내면 그대로(microsecond까지), 없으면 요청 시각
+        self.assertEqual(histories[results[0]['history_id']].created_at, created_at)
+        self.assertGreaterEqual(histories[results[3]['history_id']].created_at, before)
+
+    def test_counters_once_per_batch(self):
+        created_at  = timezone.now() - datetime.timedelta(days=2)
+        histories   = [{'food_id': self.foods[0].id}] * 3 + [
+            {'food_id': self.foods[1].id, 'created_at': created_at.isoformat()}
+        ]
+        with mock.patch.object(DailyFoodCount.objects, 'apply', wraps=DailyFoodCount.objects.apply) as daily, \
+                mock.patch.object(InterestFoodCount.objects, 'apply', wraps=InterestFoodCount.objects.apply) as interest:
+            response = self.post(histories)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(daily.call_count, 1)
+        self.assertEqual(interest.call_count, 1)
+
+        self.assertEqual(
+            set(DailyFoodCount.objects.values_list('date', 'food', 'count')),
+            {(timezone.localdate(), self.foods[0].id, 3), (timezone.localdate(created_at), self.foods[1].id, 1)},
+        )
+        self.assertEqual(
+            dict(InterestFoodCount.objects.values_list('food', 'count')),
+            {self.foods[0].id: 3, self.foods[1].id: 1},
+        )
+
+    def test_without_returning(self):
+        # MySQL처럼 bulk insert에서 id를 돌려받지 못해도 같은 결과
+        features    = type(connection.features)
+        with mock.patch.object(features, 'can_return_rows_from_bulk_insert', mock.PropertyMock(return_value=False)):
+            response = self.post([{'food_id': self.foods[0].id}, {'food_id': self.foods[1].id}, {'food_id': self.foods[0].id}])
+        self.assertEqual(response.status_code, 201)
+        results     = response.json()['results']
+        self.assertEqual(
+            [(row['history_id'], row['food_id']) for row in results],
+            list(History.objects.order_by('id').values_list('id', 'food_id')),
+        )
+
+    def test_nothing_created(self):
+        response    = self.post([{'food_id': 999999}, 'food'])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['created'], 0)
+        self.assertFalse(History.objects.exists())
 
-# Create your tests here.
+        self.assertEqual(self.post([]).status_code, 400)
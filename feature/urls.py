@@ -7,6 +7,7 @@ from feature.views import (
     FoodReviewList,
 
     HistoryList,
+    HistoryBulk,
     HistoryDetail,
     
     ReviewList,
@@ -23,6 +24,7 @@ urlpatterns = [
     path('foods/<int:pk>/reviews', FoodReviewList.as_view()),
     
     path('histories', HistoryList.as_view()),
+    path('histories/bulk', HistoryBulk.as_view()),
     path('histories/<int:pk>', HistoryDetail.as_view()),
 
     path('reviews', ReviewList.as_view()),
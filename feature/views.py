@@ -1,8 +1,5 @@
-from datetime import timedelta 
-
-from django.utils import timezone
-from django.db.models import Count
 from rest_framework.views import APIView
+from rest_framework.relations import PrimaryKeyRelatedField
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.authentication import TokenAuthentication
@@ -21,17 +18,19 @@ from feature.serializers import (
     CategoryListSerializer, 
     FoodListSerializer, 
     FoodDetailSerializer,
+    HistoryBulkItemSerializer,
+    HistoryBulkSerializer,
     HistorySerializer,
     ReviewSerializer
 )
+from feature.counters import food_views, ranking
 from feature.models import Category, Food, History, Review
 from core.permissions import IsAdminOrReadOnly, IsOwnerOrReadOnly
-from core.utils import Pagination, PaginationHandlerMixin
-from core.models import GetRequestLog
+from core.utils import CursorPagination, PaginationHandlerMixin
 
 
 class FoodList(APIView, PaginationHandlerMixin):
-    pagination_class    = Pagination
+    pagination_class    = CursorPagination
     serializer_class    = FoodListSerializer
     permission_classes  = (IsAuthenticated, )
     authentication_classes = (TokenAuthentication,)
@@ -41,7 +40,7 @@ class FoodList(APIView, PaginationHandlerMixin):
         operation_description   = '음식 목록을 조회합니다.',
         manual_parameters       = [
             openapi.Parameter('limit', openapi.IN_QUERY, description='Page limit size', type=openapi.TYPE_STRING),
-            openapi.Parameter('page', openapi.IN_QUERY, description='Page number', type=openapi.TYPE_STRING),
+            openapi.Parameter('cursor', openapi.IN_QUERY, description='Cursor of next/previous page', type=openapi.TYPE_STRING),
         ],
         responses               = {200: openapi.Response('', serializer_class(many=True))}
     )
@@ -80,12 +79,11 @@ class FoodDetail(APIView):
         responses               = {200: openapi.Response('', serializer_class(many=True))}
     )
     def get(self, request, pk):
-        food        = Food.objects.select_related(
-            'category'
-        ).prefetch_related(
-            'histories', 'histories__review'
-        ).get(pk=pk)
+        # 평점은 Food의 컬럼, 리뷰 목록은 Food.reviews로 따로 조회하므로 기록/리뷰를 prefetch하지 않음
+        food        = Food.objects.get(pk=pk)
         serializer  = self.serializer_class(food)
+        # 음식 랭킹용 조회 수 (메모리에 모았다가 주기적으로 저장)
+        food_views.add(food.pk)
         return Response(serializer.data, status=HTTP_200_OK)
 
     @swagger_auto_schema(   
@@ -127,7 +125,7 @@ class FoodDetail(APIView):
         return Response(status=HTTP_204_NO_CONTENT)
 
 class HistoryList(APIView, PaginationHandlerMixin):
-    pagination_class    = Pagination
+    pagination_class    = CursorPagination
     serializer_class    = HistorySerializer
     permission_classes  = (IsAuthenticated,)
     authentication_classes = (TokenAuthentication,)
@@ -137,7 +135,7 @@ class HistoryList(APIView, PaginationHandlerMixin):
         operation_description   = '나의 음식 선택 기록을 조회합니다.',
         manual_parameters       = [
             openapi.Parameter('limit', openapi.IN_QUERY, description='Page limit size', type=openapi.TYPE_STRING),
-            openapi.Parameter('page', openapi.IN_QUERY, description='Page number', type=openapi.TYPE_STRING),
+            openapi.Parameter('cursor', openapi.IN_QUERY, description='Cursor of next/previous page', type=openapi.TYPE_STRING),
         ],
         responses               = {200: openapi.Response('', serializer_class(many=True))}
     )
@@ -164,6 +162,62 @@ class HistoryList(APIView, PaginationHandlerMixin):
             return Response(serializer.data, status=HTTP_201_CREATED)
         return Response(serializer.errors, status=HTTP_400_BAD_REQUEST)
 
+class HistoryBulk(APIView):
+    serializer_class    = HistoryBulkSerializer
+    permission_classes  = (IsAuthenticated,)
+    authentication_classes = (TokenAuthentication,)
+
+    @swagger_auto_schema(
+        operation_id            = '기록 일괄 추가',
+        operation_description   = '음식 선택 기록을 한 번에 최대 500개까지 추가하고, 항목마다 결과를 요청 순서대로 반환합니다.',
+        request_body            = serializer_class,
+        responses               = {201: openapi.Response('')}
+    )
+    def post(self, request):
+        serializer  = self.serializer_class(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=HTTP_400_BAD_REQUEST)
+
+        items       = serializer.validated_data['histories']
+        results     = [None] * len(items)
+        valid       = []
+        for i, item in enumerate(items):
+            item_serializer = HistoryBulkItemSerializer(data=item)
+            if item_serializer.is_valid():
+                valid.append((i, item_serializer.validated_data))
+            else:
+                results[i]  = {'index': i, 'status': 'error', 'errors': item_serializer.errors}
+
+        # 모든 음식을 한 번에 확인. 카운터 갱신에 필요한 category id만 읽는다
+        foods       = Food.objects.select_related(None).only('category').in_bulk(
+            {item['food_id'] for _, item in valid}
+        )
+        entries     = []
+        for i, item in valid:
+            if item['food_id'] in foods:
+                entries.append((i, item))
+            else:
+                results[i]  = {'index': i, 'status': 'error', 'errors': {'food_id': [
+                    PrimaryKeyRelatedField.default_error_messages['does_not_exist'].format(pk_value=item['food_id'])
+                ]}}
+
+        histories   = History.objects.bulk_add(
+            request.user, [(foods[item['food_id']], item.get('created_at')) for _, item in entries]
+        ) if entries else []
+        for (i, _), history in zip(entries, histories):
+            results[i]  = {
+                'index'     : i,
+                'status'    : 'created',
+                'history_id': history.id,
+                'food_id'   : history.food_id,
+                'created_at': history.created_at,
+            }
+
+        return Response(
+            {'created': len(histories), 'results': results},
+            status=HTTP_201_CREATED if histories else HTTP_400_BAD_REQUEST
+        )
+
 class HistoryDetail(APIView):
     serializer_class    = ReviewSerializer
     permission_classes  = (IsAuthenticated, IsOwnerOrReadOnly,)
@@ -185,7 +239,7 @@ class HistoryDetail(APIView):
         return Response(serializer.data, status=HTTP_200_OK)
 
 class FoodReviewList(APIView, PaginationHandlerMixin):
-    pagination_class    = Pagination
+    pagination_class    = CursorPagination
     serializer_class    = ReviewSerializer
     permission_classes  = (IsAuthenticated, )
     authentication_classes = (TokenAuthentication,)
@@ -195,7 +249,7 @@ class FoodReviewList(APIView, PaginationHandlerMixin):
         operation_description   = '특정 음식의 리뷰를 조회합니다.',
         manual_parameters       = [
             openapi.Parameter('limit', openapi.IN_QUERY, description='Page limit size', type=openapi.TYPE_STRING),
-            openapi.Parameter('page', openapi.IN_QUERY, description='Page number', type=openapi.TYPE_STRING),
+            openapi.Parameter('cursor', openapi.IN_QUERY, description='Cursor of next/previous page', type=openapi.TYPE_STRING),
         ],
         responses               = {200: openapi.Response('', serializer_class(many=True))}
     )
@@ -212,7 +266,8 @@ class FoodReviewList(APIView, PaginationHandlerMixin):
 
         return Response(serializer.data, status=HTTP_200_OK)
 
-class ReviewList(APIView):
+class ReviewList(APIView, PaginationHandlerMixin):
+    pagination_class    = CursorPagination
     serializer_class    = ReviewSerializer
     permission_classes  = (IsAuthenticated, )
     authentication_classes = (TokenAuthentication,)
@@ -220,6 +275,10 @@ class ReviewList(APIView):
     @swagger_auto_schema(
         operation_id            = '리뷰 조회',
         operation_description   = '모든 리뷰를 조회합니다.',
+        manual_parameters       = [
+            openapi.Parameter('limit', openapi.IN_QUERY, description='Page limit size', type=openapi.TYPE_STRING),
+            openapi.Parameter('cursor', openapi.IN_QUERY, description='Cursor of next/previous page', type=openapi.TYPE_STRING),
+        ],
         responses               = {200: openapi.Response('', serializer_class(many=True))}
     )
     def get(self, request):
@@ -312,38 +371,17 @@ class CategoryDetail(APIView):
 
 class FoodRanking(APIView):
     '''
-    # TODO: 추후 Redis cache 사용
+    최근 24시간 음식 상세 조회 수 순위. 분 단위로 저장된 조회 수(FoodViewCount)를 합치며 1분 동안 캐시한다.
     '''
     serializer_class    = FoodListSerializer
     authentication_classes = (TokenAuthentication,)
 
     @swagger_auto_schema(
         operation_id            = '음식 랭킹',
-        operation_description   = 'Request log를 기반으로 음식 랭킹을 최대 10개까지 조회합니다.',
+        operation_description   = '최근 24시간 음식 조회 수를 기반으로 음식 랭킹을 최대 10개까지 조회합니다.',
         responses               = {200: openapi.Response('', serializer_class(many=True))}
     )
     def get(self, request):
-        now         = timezone.now()
-        today_logs  = GetRequestLog.objects.all().values(
-            'endpoint'
-        ).filter(
-            date__gt=now-timedelta(1)
-        ).filter(
-            endpoint__regex=r'^/api/feature/foods/[0-9]+$'
-        ).annotate(
-            count=Count('id')
-        ).order_by('-count')
-
-        foods       = []
-        log_idx     = 0
-        
-        while len(foods)<10 and log_idx<len(today_logs):
-            food_id = today_logs[log_idx]['endpoint'].split('/')[-1]
-            try:
-                foods.append(Food.objects.get(pk=food_id))
-            except:
-                pass
-            log_idx += 1
-
+        foods       = Food.objects.in_order(ranking(10))
         serializer  = self.serializer_class(foods, many=True)
         return Response(serializer.data, status=HTTP_200_OK)
@@ -0,0 +1,198 @@
+'''
+대용량 테스트 데이터 생성기. 사용자/프로필/기록을 bulk_create로 한 번에 넣는다.
+
+    python generate_data.py --users 100000 --histories 10000000
+    python generate_data.py --users 1000 --histories 20000 --days 30 --seed 1
+
+- 선호 대분류와 음식은 인기 편중(zipf)을 따르고, 기록의 interest_bias 비율은 사용자의 선호 대분류에서 고른다.
+- 음식이 없으면 합성 대분류/음식을 만든다. (실제 메뉴는 process_data.py, db_init.py 참고)
+- bulk_create는 signal을 호출하지 않으므로 마지막에 집계 테이블(backfill_*)을 다시 계산한다.
+  create_als_model.py / create_cf_model.py는 DB에서 바로 읽는다. (recommendation.export.export_history)
+'''
+import argparse
+import contextlib
+import datetime
+import io
+import os
+import re
+import time
+
+import django
+import numpy as np
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+django.setup()
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.db import transaction
+from django.utils import timezone
+
+from account.models import Profile
+from feature.models import Category, Food, History
+
+
+User            = get_user_model()
+
+
+def zipf_weights(n, s=1.0):
+    weights     = 1 / np.arange(1, n + 1) ** s
+    return weights / weights.sum()
+
+
+@contextlib.contextmanager
+def keep_timestamps(model):
+    '''bulk_create가 created_at/updated_at을 현재 시각으로 덮어쓰지 않도록 auto_now(_add)를 잠시 끈다.'''
+    fields      = [field for field in model._meta.fields if getattr(field, 'auto_now_add', False) or getattr(field, 'auto_now', False)]
+    saved       = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now, field.auto_now_add = False, False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def ensure_foods(n_categories=8, n_foods=400, rng=None):
+    '''음식이 하나도 없으면 합성 대분류/음식을 만든다.'''
+    if Food._base_manager.exists():
+        return
+    rng         = rng or np.random.default_rng()
+    Category.objects.bulk_create([
+        Category(name=f'category-{i}') for i in range(1, n_categories + 1)
+    ])
+    category_ids= list(Category.objects.order_by('pk').values_list('pk', flat=True))
+    Food.objects.bulk_create([
+        Food(
+            name        = f'food-{i}',
+            detail      = '',
+            kcal        = round(float(rng.uniform(100, 1200)), 2),
+            category_id = category_ids[i % len(category_ids)],
+        ) for i in range(n_foods)
+    ], batch_size=1000)
+
+
+def next_suffix(prefix):
+    '''prefix 뒤에 숫자만 붙은 기존 username 중 가장 큰 숫자 + 1 (사용자를 지웠거나 prefix를 다시 써도 겹치지 않음)'''
+    pattern     = re.compile(rf'{re.escape(prefix)}(\d+)')
+    suffixes    = (
+        pattern.fullmatch(username)
+        for username in User.objects.filter(username__startswith=prefix).values_list('username', flat=True).iterator()
+    )
+    return max((int(match.group(1)) for match in suffixes if match), default=0) + 1
+
+
+def create_users(n_users, prefix='gen', batch_size=5000, rng=None):
+    '''
+    사용자와 프로필을 만들고, (user id 배열, 선호 대분류 id 배열)을 반환.
+    비밀번호 해시는 한 번만 계산해서 모든 사용자가 공유한다.
+    '''
+    rng         = rng or np.random.default_rng()
+    category_ids= np.array(Category.objects.order_by('pk').values_list('pk', flat=True))
+    password    = make_password('qwer1234!@')
+    start       = next_suffix(prefix)
+    usernames   = [f'{prefix}{i}' for i in range(start, start + n_users)]
+
+    with transaction.atomic():
+        last_pk     = User.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        User.objects.bulk_create(
+            (User(username=username, password=password) for username in usernames),
+            batch_size=batch_size,
+        )
+        user_ids    = np.array(User.objects.filter(
+            pk__gt=last_pk
+        ).order_by('pk').values_list('pk', flat=True))
+
+        interests   = rng.choice(category_ids, size=len(user_ids), p=zipf_weights(len(category_ids)))
+        Profile.objects.bulk_create((
+            Profile(user_id=int(user_id), nickname=f'{prefix}{user_id}', interest_in_id=int(interest))
+            for user_id, interest in zip(user_ids, interests)
+        ), batch_size=batch_size)
+    return user_ids, interests
+
+
+def sample_histories(user_ids, interests, n_histories, days=30, interest_bias=0.5, rng=None):
+    '''
+    (user id, food id, created_at(UTC datetime64)) 배열.
+    사용자별 기록 수는 활동량(lognormal)에 비례하고, 음식은 대분류 안에서 zipf를 따른다.
+    '''
+    rng         = rng or np.random.default_rng()
+    foods       = np.array(Food._base_manager.order_by('pk').values_list('pk', 'category_id'))
+    category_ids= np.unique(foods[:, 1])
+
+    activity    = rng.lognormal(sigma=1.0, size=len(user_ids))
+    per_user    = rng.multinomial(n_histories, activity / activity.sum())
+    users       = np.repeat(user_ids, per_user)
+    categories  = np.where(
+        rng.random(n_histories) < interest_bias,
+        np.repeat(interests, per_user),
+        rng.choice(category_ids, size=n_histories, p=zipf_weights(len(category_ids))),
+    )
+
+    food_ids    = np.zeros(n_histories, dtype=np.int64)
+    for category_id in category_ids:
+        rows        = np.flatnonzero(categories == category_id)
+        candidates  = foods[foods[:, 1] == category_id, 0]
+        food_ids[rows] = rng.choice(candidates, size=len(rows), p=zipf_weights(len(candidates)))
+
+    now         = np.datetime64(timezone.now().replace(tzinfo=None), 's')
+    seconds     = rng.uniform(0, days * 86400, size=n_histories).astype('timedelta64[s]')
+    return users, food_ids, now - seconds
+
+
+def create_histories(users, food_ids, created_at, batch_size=10000):
+    # datetime 객체는 batch마다 만들어서, 전체 기록 수만큼 메모리에 올리지 않음
+    # batch마다 commit (bulk_create 한 번이 하나의 transaction). 수천만 행을 한 transaction으로 쓰지 않음
+    with keep_timestamps(History):
+        for start in range(0, len(users), batch_size):
+            stop        = start + batch_size
+            History.objects.bulk_create([
+                History(user_id=int(user_id), food_id=int(food_id), created_at=created, updated_at=created)
+                for user_id, food_id, created in zip(
+                    users[start:stop].tolist(),
+                    food_ids[start:stop].tolist(),
+                    (created.replace(tzinfo=datetime.timezone.utc) for created in created_at[start:stop].tolist()),
+                )
+            ])
+
+
+def generate(n_users, n_histories, days=30, interest_bias=0.5, prefix='gen', seed=None, verbose=True):
+    rng         = np.random.default_rng(seed)
+
+    def step(message, func, *args, **kwargs):
+        _t          = time.perf_counter()
+        result      = func(*args, **kwargs)
+        if verbose:
+            print(f'DONE: {message} ({time.perf_counter() - _t:.1f}s)')
+        return result
+
+    step('Ensure foods', ensure_foods, rng=rng)
+    user_ids, interests = step(f'Create {n_users} users', create_users, n_users, prefix=prefix, rng=rng)
+    users, food_ids, created_at = step(
+        'Sample histories', sample_histories, user_ids, interests, n_histories, days, interest_bias, rng=rng
+    )
+    step(f'Create {n_histories} histories', create_histories, users, food_ids, created_at)
+    step('Backfill daily counts', call_command, 'backfill_daily_counts', stdout=io.StringIO())
+    step('Backfill interest counts', call_command, 'backfill_interest_counts', stdout=io.StringIO())
+    return user_ids
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--histories', type=int, default=20000)
+    parser.add_argument('--days', type=int, default=30, help='기록의 created_at을 최근 며칠에 고르게 분포')
+    parser.add_argument('--interest-bias', type=float, default=0.5, help='선호 대분류에서 고르는 기록의 비율')
+    parser.add_argument('--prefix', default='gen', help='username 접두사')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    generate(
+        args.users, args.histories,
+        days            = args.days,
+        interest_bias   = args.interest_bias,
+        prefix          = args.prefix,
+        seed            = args.seed,
+    )
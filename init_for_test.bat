@@ -6,4 +6,5 @@ echo from django.contrib.auth import get_user_model; User = get_user_model(); Us
 python ./process_data.py
 python ./db_init.py
 python ./create_als_model.py
+python ./create_cf_model.py
 python ./manage.py runserver
\ No newline at end of file
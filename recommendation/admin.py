@@ -1,3 +1,9 @@
 from django.contrib import admin
 
-# Register your models here.
+from recommendation.models import ALSStaleUser, DailyFoodCount, InterestFoodCount, UserRecommendation
+
+
+admin.site.register(DailyFoodCount)
+admin.site.register(InterestFoodCount)
+admin.site.register(UserRecommendation)
+admin.site.register(ALSStaleUser)
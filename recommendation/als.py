@@ -0,0 +1,46 @@
+import os
+
+from recommendation.ann import IVFIndex
+from recommendation.artifacts import ArtifactHolder
+from recommendation.conf import get_setting
+from recommendation.factors import FactorModel
+
+
+ALS_FACTORS_DIR     = './data/als'
+ALS_CURRENT_PATH    = os.path.join(ALS_FACTORS_DIR, 'CURRENT')
+
+# 모델의 item이 History의 어떤 값인지 (History.objects.values(ALS_ITEM_FIELD))
+# 음식 단위로 학습해서 추천 결과가 바로 음식 id
+ALS_ITEM_FIELD      = 'food_id'
+
+
+def save_als(model, item_ids, user_ids, **meta):
+    '''
+    item_ids    : 모델의 item 인덱스 순서의 food id
+    user_ids    : 모델의 user 인덱스 순서의 user id
+    meta        : regularization, alpha, history_until(학습에 반영된 기록의 마지막 시각) 등.
+                  update_als_users 명령이 증분 갱신할 때 사용한다.
+
+    서빙에서 mmap으로 여는 factor 행렬(.npy)과 id 매핑,
+    RETRIEVAL = 'ann'일 때 사용할 item factor의 IVF 인덱스를 저장한다.
+    '''
+    FactorModel(
+        user_ids        = user_ids,
+        item_ids        = item_ids,
+        user_factors    = model.user_factors,
+        item_factors    = model.item_factors,
+        meta            = meta,
+        index           = IVFIndex.build(model.item_factors),
+    ).save(ALS_FACTORS_DIR)
+
+
+def retrieval_options():
+    '''FactorModel.recommend / recommend_users에 넘길 검색 방식 (settings.RECOMMENDATION)'''
+    return {
+        'retrieval' : get_setting('RETRIEVAL'),
+        'n_probe'   : get_setting('ANN_PROBES'),
+    }
+
+
+# 요청마다 모델을 읽지 않도록 프로세스당 한 번만 열어 둠 (factor 행렬은 mmap)
+als_model = ArtifactHolder('als', ALS_CURRENT_PATH, FactorModel.load)
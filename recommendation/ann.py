@@ -0,0 +1,112 @@
+import os
+
+import numpy as np
+
+from recommendation.cf import top_k
+
+
+ANN_FILE_NAME   = 'ann.npz'
+ANN_PROBES      = 8
+
+
+class IVFIndex:
+    '''
+    item factor에 대한 IVF(inverted file) 근사 최근접 이웃 인덱스. 내적(dot product)이 클수록 가깝다.
+
+    오프라인에서 item factor를 k-means로 n_lists개의 군집으로 나눠 두고,
+    요청 시에는 사용자 factor와 내적이 큰 n_probe개 군집의 item만 정확히 계산한다.
+    전체 item 대신 약 (n_probe / n_lists) 비율의 item만 곱하므로 item이 많을수록 빨라진다.
+
+    centroids   : (n_lists, factors) float32, 군집 중심
+    offsets     : (n_lists + 1,) int64, 군집 c의 item은 items[offsets[c]:offsets[c + 1]]
+    items       : (items,) int64, 군집 순서로 정렬된 item 인덱스
+    '''
+    def __init__(self, centroids, offsets, items):
+        self.centroids  = np.asarray(centroids, dtype=np.float32)
+        self.offsets    = np.asarray(offsets, dtype=np.int64)
+        self.items      = np.asarray(items, dtype=np.int64)
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, item_factors, n_lists=None, iterations=20, seed=0):
+        '''
+        item_factors: (items, factors)
+        n_lists     : 군집 수. 생략하면 sqrt(items)
+        '''
+        item_factors= np.asarray(item_factors, dtype=np.float32)
+        n_items     = len(item_factors)
+        n_lists     = max(1, min(n_lists or int(np.sqrt(n_items)), n_items))
+
+        rng         = np.random.default_rng(seed)
+        centroids   = item_factors[rng.choice(n_items, size=n_lists, replace=False)].copy()
+        sq_norms    = (item_factors ** 2).sum(axis=1)
+        for _ in range(iterations):
+            # |x - c|^2 = |x|^2 - 2 x·c + |c|^2
+            distance    = sq_norms[:, None] - 2 * item_factors.dot(centroids.T) + (centroids ** 2).sum(axis=1)
+            assign      = distance.argmin(axis=1)
+            counts      = np.bincount(assign, minlength=n_lists)
+            sums        = np.zeros_like(centroids)
+            np.add.at(sums, assign, item_factors)
+            # 빈 군집은 이전 중심을 유지
+            filled      = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+
+        distance    = sq_norms[:, None] - 2 * item_factors.dot(centroids.T) + (centroids ** 2).sum(axis=1)
+        assign      = distance.argmin(axis=1)
+        items       = np.argsort(assign, kind='stable')
+        offsets     = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=n_lists))])
+        return cls(centroids, offsets, items)
+
+    @classmethod
+    def load(cls, directory):
+        '''directory에 인덱스가 없으면 None'''
+        path        = os.path.join(directory, ANN_FILE_NAME)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            return cls(data['centroids'], data['offsets'], data['items'])
+
+    def save(self, directory):
+        np.savez(
+            os.path.join(directory, ANN_FILE_NAME),
+            centroids   = self.centroids,
+            offsets     = self.offsets,
+            items       = self.items,
+        )
+
+    def candidates(self, query, n_probe=ANN_PROBES, min_items=0, allowed=None):
+        '''
+        query와 내적이 큰 n_probe개 군집의 item 인덱스.
+        그래도 min_items개보다 적으면 다음 군집을 더 본다.
+        allowed: item 인덱스 순서의 bool 배열 (ex. kcal 구간). True인 item만 후보로 세고 반환한다.
+        '''
+        lists       = np.argsort(-self.centroids.dot(query), kind='stable')
+        if allowed is None:
+            sizes       = np.diff(self.offsets)
+        else:
+            counts      = np.concatenate([[0], np.cumsum(allowed[self.items])])
+            sizes       = counts[self.offsets[1:]] - counts[self.offsets[:-1]]
+        enough      = np.flatnonzero(np.cumsum(sizes[lists]) >= min_items)
+        n_lists     = max(n_probe, enough[0] + 1 if len(enough) else len(lists))
+        items       = np.concatenate(
+            [self.items[self.offsets[c]:self.offsets[c + 1]] for c in lists[:n_lists]]
+        ) if len(lists) else np.zeros(0, dtype=np.int64)
+        return items if allowed is None else items[allowed[items]]
+
+    def search(self, item_factors, query, n, n_probe=ANN_PROBES, adjust=None, min_items=None, allowed=None):
+        '''
+        item_factors 중 query와 내적이 큰 (근사) 상위 n개의 item 인덱스
+        adjust      : adjust(scores, candidates). top-k 전에 후보의 점수를 바꾼다. (ex. 싫어요 제외)
+        min_items   : 적어도 이만큼의 후보를 계산 (기본 n)
+        allowed     : candidates()와 같음
+        '''
+        candidates  = self.candidates(
+            query, n_probe, min_items=n if min_items is None else min_items, allowed=allowed
+        )
+        scores      = np.asarray(item_factors[candidates]).dot(query)
+        if adjust is not None:
+            adjust(scores, candidates)
+        return candidates[top_k(scores, n, min_score=-np.inf)]
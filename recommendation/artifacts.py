@@ -0,0 +1,94 @@
+import os
+import datetime
+import threading
+import time
+
+
+# 이름 -> ArtifactHolder. 상태 조회 API에서 사용
+registry = {}
+
+
+class _Loaded:
+    def __init__(self, value, mtime, version, loaded_at, load_seconds):
+        self.value          = value
+        self.mtime          = mtime
+        self.version        = version
+        self.loaded_at      = loaded_at
+        self.load_seconds   = load_seconds
+
+
+class ArtifactHolder:
+    '''
+    오프라인에서 만든 모델 파일을 프로세스(워커)당 한 번만 읽어 두는 holder.
+
+    get()은 최대 check_interval초마다 파일의 mtime만 확인하고(os.stat),
+    파일이 바뀌었을 때만 다시 읽는다. 새 모델을 모두 읽은 뒤 참조 하나를 교체하므로
+    다른 스레드는 항상 이전 모델 또는 새 모델 중 하나를 온전히 보게 된다.
+    '''
+    def __init__(self, name, path, loader, check_interval=5):
+        self.name           = name
+        self.path           = path
+        self.loader         = loader
+        self.check_interval = check_interval
+
+        self._lock          = threading.Lock()
+        self._loaded        = None
+        self._checked_at    = 0
+
+        registry[name]      = self
+
+    def get(self):
+        loaded      = self._loaded
+        now         = time.monotonic()
+        if loaded is not None and now - self._checked_at < self.check_interval:
+            return loaded.value
+
+        self._checked_at = now
+        try:
+            mtime   = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            # 교체 도중 등으로 파일이 잠시 없으면 읽어 둔 모델을 계속 사용
+            if loaded is None:
+                raise
+            return loaded.value
+        if loaded is not None and loaded.mtime == mtime:
+            return loaded.value
+
+        with self._lock:
+            # 다른 스레드가 먼저 읽었을 수 있음
+            loaded  = self._loaded
+            if loaded is None or loaded.mtime != mtime:
+                loaded = self._load(mtime)
+                self._loaded = loaded
+        return loaded.value
+
+    def invalidate(self, path=None):
+        '''읽어 둔 모델을 버리고 다음 get()에서 바로 다시 읽는다. path가 있으면 그 파일로 바꾼다.'''
+        with self._lock:
+            if path is not None:
+                self.path    = path
+            self._loaded     = None
+            self._checked_at = 0
+
+    def _load(self, mtime):
+        _t          = time.perf_counter()
+        value       = self.loader(self.path)
+        load_seconds= time.perf_counter() - _t
+
+        version     = getattr(value, 'version', None) or datetime.datetime.fromtimestamp(
+            mtime / 1e9, tz=datetime.timezone.utc
+        ).strftime('%Y%m%d%H%M%S')
+        return _Loaded(value, mtime, version, datetime.datetime.now(datetime.timezone.utc), load_seconds)
+
+    def status(self):
+        loaded      = self._loaded
+        return {
+            'name'          : self.name,
+            'path'          : self.path,
+            'exists'        : os.path.exists(self.path),
+            'loaded'        : loaded is not None,
+            'version'       : loaded.version if loaded else None,
+            'loaded_at'     : loaded.loaded_at.isoformat() if loaded else None,
+            'load_seconds'  : round(loaded.load_seconds, 4) if loaded else None,
+            'pid'           : os.getpid(),
+        }
@@ -0,0 +1,200 @@
+import datetime
+
+import numpy as np
+import scipy.sparse as sparse
+from django.db.models import Sum
+from django.utils import timezone
+
+from account.models import Profile
+from feature.models import Food, History
+from recommendation.als import als_model, retrieval_options
+from recommendation.cf import CF_WINDOW_DAYS, neighbors, top_k_rows
+from recommendation.models import DailyFoodCount, InterestFoodCount
+from recommendation.preferences import Preferences, apply_rows, n_candidates, rank
+from recommendation.sampling import food_index
+
+
+def popular_counts(n=10, days=None, **filters):
+    '''
+    가장 많이 먹은 음식의 (id 배열, 먹은 횟수 배열). History 대신 날짜별 집계(DailyFoodCount)를 더한다.
+    days: 오늘을 포함해 최근 며칠 동안 (None이면 전체 기간)
+    '''
+    counts      = DailyFoodCount.objects.filter(**filters)
+    if days is not None:
+        # 양쪽으로 닫힌 범위여야 planner가 food 인덱스로 전체를 읽지 않고 (date, food) 인덱스로 찾는다
+        # DailyFoodCount.date는 timezone.localdate() 기준 (서버의 시간대와 무관)
+        today   = timezone.localdate()
+        counts  = counts.filter(date__range=(today - datetime.timedelta(days=days), today))
+
+    rows        = counts.values(
+        'food'
+    ).annotate(
+        count=Sum('count')
+    ).filter(
+        count__gt=0
+    ).order_by('-count').values_list('food', 'count')[:n]
+    return _arrays(rows)
+
+
+def kcal_filters(min_kcal=None, max_kcal=None):
+    '''집계 테이블(DailyFoodCount, InterestFoodCount)의 kcal 구간 조건. 순위를 DB에서 매기므로 필터도 DB에서'''
+    filters     = {}
+    if min_kcal is not None:
+        filters['food__kcal__gte'] = min_kcal
+    if max_kcal is not None:
+        filters['food__kcal__lte'] = max_kcal
+    return filters
+
+
+def _arrays(rows):
+    '''[(food id, 횟수), ...] -> (id 배열, 횟수 배열)'''
+    rows        = np.array(rows, dtype=np.int64).reshape(-1, 2)
+    return rows[:, 0], rows[:, 1]
+
+
+def popular(n=10, days=None, preferences=None, **filters):
+    '''가장 많이 먹은 음식 id. preferences(Preferences)가 있으면 싫어요는 빼고 좋아요는 올린다.'''
+    return rank(*popular_counts(n_candidates(n, preferences), days, **filters), n, preferences)
+
+
+def yesterday_popular(n=10, preferences=None, **kcal):
+    '''어제부터 가장 많이 먹은 음식 id. kcal: min_kcal, max_kcal'''
+    return popular(n, days=1, preferences=preferences, **kcal_filters(**kcal))
+
+
+def interest_popular_counts(category_id, n=10, **kcal):
+    return popular_counts(n, days=30, category=category_id, **kcal_filters(**kcal))
+
+
+def interest_popular(category_id, n=10, preferences=None, **kcal):
+    '''선호 대분류에서 최근 30일 동안 가장 많이 먹은 음식 id'''
+    return rank(*interest_popular_counts(category_id, n_candidates(n, preferences), **kcal), n, preferences)
+
+
+def interest_user_counts(category_id, n=10, **kcal):
+    '''
+    같은 선호 대분류를 선택한 사용자들이 가장 많이 먹은 음식의 (id 배열, 횟수 배열)
+    History 대신 대분류별 집계(InterestFoodCount)를 (대분류, 횟수) 인덱스 순서로 읽는다.
+    '''
+    return _arrays(InterestFoodCount.objects.filter(
+        interest=category_id, count__gt=0, **kcal_filters(**kcal)
+    ).order_by('-count').values_list('food', 'count')[:n])
+
+
+def interest_user(category_id, n=10, preferences=None, **kcal):
+    '''같은 선호 대분류를 선택한 사용자들이 가장 많이 먹은 음식 id'''
+    return rank(*interest_user_counts(category_id, n_candidates(n, preferences), **kcal), n, preferences)
+
+
+def _by_interest(counts, user_ids, n, **kcal):
+    '''
+    선호 대분류가 같은 사용자는 후보가 같으므로, 대분류마다 한 번만 조회하고
+    사용자별로는 후보의 점수 배열에 좋아요/싫어요만 적용한다.
+    '''
+    interests   = dict(Profile.objects.filter(
+        user_id__in=list(user_ids)
+    ).values_list('user_id', 'interest_in_id'))
+    preferences = Preferences.load_users(interests)
+
+    # 대분류마다 그 대분류 사용자 중 싫어요가 가장 많은 사용자만큼 후보를 더 가져온다
+    sizes       = {}
+    for user_id, category_id in interests.items():
+        sizes[category_id] = max(sizes.get(category_id, 0), n_candidates(n, preferences[user_id]))
+
+    candidates  = {
+        category_id: counts(category_id, size, **kcal) for category_id, size in sizes.items()
+    }
+    return {
+        int(user_id): rank(*candidates[interests[user_id]], n, preferences[user_id])
+        if int(user_id) in interests else []
+        for user_id in user_ids
+    }
+
+
+def recommend_interest_popular(user_ids, n=10, **kcal):
+    return _by_interest(interest_popular_counts, user_ids, n, **kcal)
+
+
+def recommend_interest_user(user_ids, n=10, **kcal):
+    return _by_interest(interest_user_counts, user_ids, n, **kcal)
+
+
+def recommend_memory_cf(user_ids, n=5, **kcal):
+    '''
+    여러 사용자의 메모리 기반 CF 추천. {user id: [food id, ...]}
+    사용자들의 최근 기록을 한 번에 조회해 (사용자 x 음식) CSR 행렬을 만들고,
+    이웃 유사도 행렬과 한 번 곱해서 점수를 구한다.
+    kcal(min_kcal, max_kcal)이 있으면 구간 밖의 음식은 top-k 전에 점수 배열에서 제외한다.
+    '''
+    model       = neighbors.get()
+    user_ids    = np.unique(np.asarray(user_ids, dtype=np.int64))
+    since       = timezone.localdate() - datetime.timedelta(days=CF_WINDOW_DAYS)
+
+    pairs       = np.array(
+        History.objects.filter(
+            user_id__in     = user_ids.tolist(),
+            created_at__gte = since,
+        ).values_list('user_id', 'food_id'),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+
+    # 모델에 없는 음식의 기록은 제외
+    cols        = np.searchsorted(model.food_ids, pairs[:, 1])
+    cols[cols == len(model)] = 0
+    known       = model.food_ids[cols] == pairs[:, 1]
+    rows        = np.searchsorted(user_ids, pairs[known, 0])
+
+    consumed    = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, cols[known])),
+        shape   = (len(user_ids), len(model)),
+    )
+    consumed.sum_duplicates()
+
+    scores      = model.score_users(consumed)
+    if (allowed := food_index.get().mask(model.food_ids, **kcal)) is not None:
+        scores[:, ~allowed] = -np.inf
+    preferences = Preferences.load_users(user_ids.tolist())
+    apply_rows(scores, model.food_ids, [preferences[int(user_id)] for user_id in user_ids])
+    return {
+        int(user_id): model.food_ids[top].tolist()
+        for user_id, top in zip(user_ids, top_k_rows(scores, n))
+    }
+
+
+def recommend_als(user_ids, n=5, **kcal):
+    '''
+    여러 사용자의 ALS 추천. {user id: [food id, ...]}
+    사용자 factor들과 음식 factor를 한 번에 곱해 사용자마다 상위 n개 음식을 고른다.
+    '''
+    model       = als_model.get()
+    return model.recommend_users(
+        user_ids, n=n,
+        preferences = Preferences.load_users(user_ids),
+        allowed     = food_index.get().mask(model.item_ids, **kcal),
+        **retrieval_options()
+    )
+
+
+STRATEGIES = {
+    'interest-popular'  : recommend_interest_popular,
+    'interest-user'     : recommend_interest_user,
+    'memory-cf'         : recommend_memory_cf,
+    'als'               : recommend_als,
+}
+
+
+def recommend_batch(strategy, user_ids, n=5, **kcal):
+    '''
+    {user id: [Food, ...]}
+    추천된 음식은 한 번의 쿼리로 가져온다. kcal: min_kcal, max_kcal
+    '''
+    food_ids    = STRATEGIES[strategy](user_ids, n, **kcal)
+    foods       = {
+        food.id: food for food in Food.objects.in_order({
+            food_id for ids in food_ids.values() for food_id in ids
+        })
+    }
+    return {
+        user_id: [foods[food_id] for food_id in ids if food_id in foods]
+        for user_id, ids in food_ids.items()
+    }
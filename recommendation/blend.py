@@ -0,0 +1,217 @@
+import asyncio
+import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+
+from account.models import Profile
+from feature.models import Food
+from feature.serializers import FoodListSerializer
+from recommendation.als import als_model, retrieval_options
+from recommendation.batch import interest_popular, yesterday_popular
+from recommendation.cf import CF_WINDOW_DAYS, neighbors
+from recommendation.conf import get_setting
+from recommendation.preferences import Preferences
+from recommendation.sampling import food_index
+
+
+# popular가 성공할 때마다 갱신하고, 시간 안에 끝나지 않은 추천 대신 사용 (없으면 _fallback에서 바로 만듦)
+FALLBACK_KEY        = 'recommendation:blend:popular'
+FALLBACK_TIMEOUT    = 60 * 60 * 24
+
+
+# 각 추천: (user, n, preferences, kcal) -> food id 목록. kcal: {'min_kcal', 'max_kcal'} (없을 수 있음)
+def _random(user, n, preferences, kcal):
+    return food_index.get().sample(n, exclude=preferences.disliked, **kcal)
+
+
+def _popular(user, n, preferences, kcal):
+    if kcal:
+        return yesterday_popular(n, preferences, **kcal)
+    # 모든 사용자가 같이 쓰는 fallback이므로 좋아요/싫어요를 적용하지 않은 결과를 캐시 (싫어요는 merge에서 제외)
+    food_ids    = yesterday_popular(n + len(preferences.disliked))
+    cache.set(FALLBACK_KEY, food_ids, timeout=FALLBACK_TIMEOUT)
+    return food_ids
+
+
+def _interest(user, n, preferences, kcal):
+    interest_id = Profile.objects.filter(user=user).values_list('interest_in_id', flat=True).first()
+    return interest_popular(interest_id, n, preferences, **kcal) if interest_id else []
+
+
+def _memory_cf(user, n, preferences, kcal):
+    since       = timezone.localdate() - datetime.timedelta(days=CF_WINDOW_DAYS)
+    ate         = user.histories.filter(created_at__gte=since).values_list('food', flat=True)
+    model       = neighbors.get()
+    return model.recommend(
+        list(ate), n=n, preferences=preferences, allowed=food_index.get().mask(model.food_ids, **kcal)
+    )
+
+
+def _als(user, n, preferences, kcal):
+    model       = als_model.get()
+    return model.recommend(
+        user.id, n=n,
+        preferences = preferences,
+        allowed     = food_index.get().mask(model.item_ids, **kcal),
+        **retrieval_options()
+    )
+
+
+# 이름 -> (food id 목록을 반환하는 함수, 로그인이 필요한지)
+SOURCES = {
+    'als'       : (_als, True),
+    'memory-cf' : (_memory_cf, True),
+    'interest'  : (_interest, True),
+    'popular'   : (_popular, False),
+    'random'    : (_random, False),
+}
+
+
+def _run(func, *args):
+    # 스레드 풀의 스레드에서 실행되므로 요청이 끝나도 DB 연결이 닫히지 않음. 직접 닫는다.
+    try:
+        return func(*args)
+    finally:
+        connection.close()
+
+
+def _run_before(deadline, func, *args):
+    # 실행기가 밀려서 제한 시간이 지난 뒤에야 시작되는 추천은 아무도 기다리지 않으므로 실행하지 않음
+    if time.monotonic() >= deadline:
+        return []
+    return _run(func, *args)
+
+
+# 각 추천을 실행하는 프로세스당 하나의 스레드 풀. 시간 초과된 추천의 스레드도 끝날 때까지 자리를 차지하므로,
+# 기본 실행기(다른 sync_to_async와 공유)를 쓰지 않고 크기를 제한한다.
+_executor       = None
+_executor_lock  = threading.Lock()
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=get_setting('BLEND_WORKERS'), thread_name_prefix='blend')
+        return _executor
+
+
+def _preferences(user):
+    return Preferences.load(user.id) if user.is_authenticated else Preferences()
+
+
+def _fallback(n):
+    '''캐시된 인기 음식. 이 캐시를 채우는 popular가 아직 한 번도 끝나지 않았으면 날짜별 집계로 바로 만든다.'''
+    food_ids    = cache.get(FALLBACK_KEY)
+    if food_ids is None:
+        food_ids    = yesterday_popular(n)
+        cache.set(FALLBACK_KEY, food_ids, timeout=FALLBACK_TIMEOUT)
+    return food_ids
+
+
+def _kcal_ids(kcal):
+    return set(food_index.get().kcal_ids(**kcal).tolist())
+
+
+async def _fetch(name, user, n, preferences, kcal, timeout):
+    '''(이름, food id 목록, 상태, 걸린 시간 ms). 시간 초과/오류면 빈 목록'''
+    func, _     = SOURCES[name]
+    _t          = time.perf_counter()
+    try:
+        # 각 추천을 blend 전용 스레드 풀의 서로 다른 스레드에서 동시에 실행
+        food_ids    = await asyncio.wait_for(
+            sync_to_async(_run_before, thread_sensitive=False, executor=_get_executor())(
+                time.monotonic() + timeout, func, user, n, preferences, kcal
+            ), timeout
+        )
+        status      = 'ok'
+    except asyncio.TimeoutError:
+        # 기다리지 않을 뿐, 이미 시작된 스레드의 쿼리는 끝까지 실행된다
+        food_ids, status = [], 'timeout'
+    except Exception as e:
+        food_ids, status = [], f'error: {e.__class__.__name__}'
+    return name, food_ids, status, round((time.perf_counter() - _t) * 1000, 1)
+
+
+def merge(results, quotas, n, exclude=(), allowed=None):
+    '''
+    results : {이름: food id 목록} (SOURCES 순서가 우선순위)
+    quotas  : {이름: 최대 개수}
+    exclude : 추천하지 않을 food id (ex. 싫어요)
+    allowed : 이 food id만 추천 (ex. kcal 구간). None이면 모두
+    중복을 제외하며 각 추천에서 quota만큼 차례로 가져오고, 모자라면 남은 후보로 n개까지 채운다.
+    [(food id, 이름), ...]
+    '''
+    picked, seen = [], set(exclude)
+
+    def take(name, food_ids, limit):
+        count   = 0
+        for food_id in food_ids:
+            if len(picked) >= n or count >= limit:
+                break
+            if food_id not in seen and (allowed is None or food_id in allowed):
+                seen.add(food_id)
+                picked.append((food_id, name))
+                count += 1
+
+    for name, food_ids in results.items():
+        take(name, food_ids, quotas.get(name, 0))
+    for name, food_ids in results.items():
+        take(name, food_ids, n)
+    return picked
+
+
+async def blend(user, n=10, **kcal):
+    '''
+    모든 추천을 동시에 실행해 각자의 제한 시간(BLEND_TIMEOUTS) 안에 끝난 결과만 합친다.
+    시간 안에 끝나지 않은 추천의 몫은 캐시된 인기 음식으로 채운다.
+    kcal    : min_kcal, max_kcal. 각 추천이 점수 배열/쿼리에 적용한다.
+    '''
+    timeouts    = get_setting('BLEND_TIMEOUTS')
+    quotas      = get_setting('BLEND_QUOTAS')
+    names       = [
+        name for name, (_, login_required) in SOURCES.items()
+        if user.is_authenticated or not login_required
+    ]
+
+    # 좋아요/싫어요는 한 번만 읽어서 모든 추천이 같이 사용한다
+    preferences = await sync_to_async(_run, thread_sensitive=False)(_preferences, user)
+    fetched     = await asyncio.gather(*(
+        _fetch(name, user, max(quotas.get(name, 0), n), preferences, kcal, timeouts.get(name, 0.2))
+        for name in names
+    ))
+
+    results     = {name: food_ids for name, food_ids, _, _ in fetched}
+    sources     = {name: {'status': status, 'ms': ms} for name, _, status, ms in fetched}
+    missed      = sum(quotas.get(name, 0) for name, _, status, _ in fetched if status != 'ok')
+    allowed     = None
+    if missed:
+        results['fallback'] = await sync_to_async(_run, thread_sensitive=False)(
+            _fallback, n + len(preferences.disliked)
+        )
+        if kcal:
+            # 캐시된 fallback에는 kcal 구간이 적용되어 있지 않음
+            allowed     = await sync_to_async(_kcal_ids)(kcal)
+
+    picked      = merge(
+        results, {**quotas, 'fallback': missed}, n,
+        exclude = preferences.disliked.tolist(),
+        allowed = allowed,
+    )
+    foods       = await sync_to_async(_hydrate)(picked)
+    return {'foods': foods, 'sources': sources}
+
+
+def _hydrate(picked):
+    '''[(food id, 이름), ...] -> 추천된 순서의 FoodListSerializer 데이터 (+ source)'''
+    source      = dict(picked)
+    foods       = Food.objects.in_order([food_id for food_id, _ in picked])
+    return [
+        {**data, 'source': source[food.id]}
+        for food, data in zip(foods, FoodListSerializer(foods, many=True).data)
+    ]
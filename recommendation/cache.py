@@ -0,0 +1,71 @@
+from functools import wraps
+
+from django.core.cache import cache
+from rest_framework.response import Response
+from rest_framework.status import HTTP_200_OK
+
+from recommendation.conf import get_setting
+
+
+# 사용자별 응답을 캐시하는 추천 전략 (views의 strategy 속성)
+CACHED_STRATEGIES   = ('interest-popular', 'interest-user', 'memory-cf', 'als')
+STATS_KEY           = 'recommendation:cache:{}:{}'
+# 조합이 많아 캐시하지 않는 query parameter. 있으면 매번 계산한다.
+UNCACHED_PARAMS     = ('min_kcal', 'max_kcal')
+
+
+def cache_key(strategy, user_id):
+    return f'recommendation:{strategy}:{user_id}'
+
+
+def _incr(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # 키가 없으면 incr가 실패하므로 만들고, 그 사이 다른 요청이 만들었다면 다시 증가
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def cache_per_user(get):
+    '''
+    추천 view의 get()에 붙이는 데코레이터. (사용자, self.strategy)별로 200 응답의 데이터를 캐시한다.
+    사용자의 기록/선호/비선호/선호 대분류가 바뀌면 recommendation.models의 receiver가 invalidate()를 호출한다.
+    '''
+    @wraps(get)
+    def wrapper(self, request, *args, **kwargs):
+        timeout     = get_setting('CACHE_TIMEOUT')
+        if not timeout or any(name in request.query_params for name in UNCACHED_PARAMS):
+            return get(self, request, *args, **kwargs)
+
+        key         = cache_key(self.strategy, request.user.id)
+        data        = cache.get(key)
+        if data is not None:
+            _incr(STATS_KEY.format(self.strategy, 'hits'))
+            return Response(data, status=HTTP_200_OK)
+
+        _incr(STATS_KEY.format(self.strategy, 'misses'))
+        response    = get(self, request, *args, **kwargs)
+        if response.status_code == HTTP_200_OK:
+            cache.set(key, response.data, timeout=timeout)
+        return response
+    return wrapper
+
+
+def invalidate(*user_ids):
+    '''사용자들의 모든 전략의 캐시된 응답을 지운다.'''
+    cache.delete_many([
+        cache_key(strategy, user_id) for user_id in user_ids for strategy in CACHED_STRATEGIES
+    ])
+
+
+def stats():
+    '''전략별 hit/miss 수. 캐시를 공유하는 모든 워커의 합 (LocMemCache면 워커별 값)'''
+    counts      = cache.get_many([
+        STATS_KEY.format(strategy, name) for strategy in CACHED_STRATEGIES for name in ('hits', 'misses')
+    ])
+    return [{
+        'strategy'  : strategy,
+        'hits'      : counts.get(STATS_KEY.format(strategy, 'hits'), 0),
+        'misses'    : counts.get(STATS_KEY.format(strategy, 'misses'), 0),
+    } for strategy in CACHED_STRATEGIES]
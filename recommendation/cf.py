@@ -0,0 +1,303 @@
+import os
+import datetime
+
+import numpy as np
+import scipy.sparse as sparse
+
+from recommendation.artifacts import ArtifactHolder
+
+
+CF_NEIGHBORS_PATH   = './data/cf_neighbors.npz'
+CF_WINDOW_DAYS      = 10
+CF_TOP_K            = 20
+
+
+def index_of(ids, values):
+    '''정렬된 id 배열에서 values의 인덱스를 찾는다. 없는 id는 제외한다.'''
+    values      = np.asarray(values, dtype=ids.dtype)
+    if not len(ids):
+        return np.zeros(0, dtype=np.int64)
+    idx         = np.searchsorted(ids, values)
+    idx[idx == len(ids)] = 0
+    return idx[ids[idx] == values]
+
+
+def top_k(scores, k, min_score=0):
+    '''
+    점수가 min_score보다 큰 항목 중 상위 k개의 인덱스를 점수 내림차순으로 반환.
+    전체 정렬 대신 argpartition으로 k개만 골라낸 뒤 그 안에서만 정렬한다.
+    '''
+    candidates  = np.flatnonzero(scores > min_score)
+    if len(candidates) > k:
+        part        = np.argpartition(-scores[candidates], k - 1)[:k]
+        candidates  = candidates[part]
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+def top_k_rows(scores, k, min_score=0):
+    '''
+    (사용자 x 아이템) 점수 배열의 행마다 top_k를 구한다.
+    행 전체를 argpartition/정렬한 뒤, 행별로 min_score 이하인 항목만 걸러낸다.
+    '''
+    k           = min(k, scores.shape[1])
+    if k == 0:
+        return [np.zeros(0, dtype=np.int64) for _ in range(scores.shape[0])]
+
+    part        = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    values      = np.take_along_axis(scores, part, axis=1)
+    rank        = np.argsort(-values, axis=1, kind='stable')
+    part        = np.take_along_axis(part, rank, axis=1)
+    values      = np.take_along_axis(values, rank, axis=1)
+    return [row[value > min_score] for row, value in zip(part, values)]
+
+
+def mask_consumed(score, consumed):
+    '''
+    (사용자 x 음식) 점수 행렬에서 이미 먹었던 음식의 점수를 0으로 만든다.
+    consumed의 nonzero 위치만 빼기 때문에 사용자 x 음식 전체를 순회하지 않는다.
+    '''
+    score       = sparse.csr_matrix(score)
+    score       = score - score.multiply(consumed.astype(bool))
+    score.eliminate_zeros()
+    return score
+
+
+def item_neighbors(matrix, k=CF_TOP_K, block_size=1024):
+    '''
+    사용자 x 음식 CSR 행렬로부터 음식 간 코사인 유사도를 구하고,
+    음식마다 유사도 상위 k개의 이웃(인덱스, 유사도)만 남긴다. 자기 자신은 제외.
+
+    유사도는 희소 행렬 곱으로 계산하고, top-k는 block_size 개의 음식씩 나눠서 구하므로
+    한 번에 (block_size x 음식 수) 크기의 배열만 메모리에 올라간다.
+    '''
+    n_items     = matrix.shape[1]
+    k           = max(1, min(k, n_items - 1))
+
+    # 음식(열)별 L2 정규화 후 X^T X = 코사인 유사도
+    norms       = np.sqrt(np.asarray(matrix.power(2).sum(axis=0))).ravel()
+    inv_norms   = np.divide(1, norms, out=np.zeros_like(norms, dtype=np.float64), where=norms > 0)
+    normalized  = sparse.csr_matrix(matrix.multiply(inv_norms.reshape(1, -1)), dtype=np.float32)
+    sim         = (normalized.T.tocsr()).dot(normalized).tocsr()
+
+    neighbor_idx= np.zeros((n_items, k), dtype=np.int32)
+    neighbor_sim= np.zeros((n_items, k), dtype=np.float32)
+    for start in range(0, n_items, block_size):
+        stop        = min(start + block_size, n_items)
+        block       = sim[start:stop].toarray()
+        block[np.arange(stop - start), np.arange(start, stop)] = 0
+
+        idx         = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        val         = np.take_along_axis(block, idx, axis=1)
+        rank        = np.argsort(-val, axis=1, kind='stable')
+        neighbor_idx[start:stop] = np.take_along_axis(idx, rank, axis=1)
+        neighbor_sim[start:stop] = np.take_along_axis(val, rank, axis=1)
+
+    return neighbor_idx, neighbor_sim
+
+
+def neighbor_matrix(neighbor_idx, neighbor_sim):
+    '''top-k 이웃을 (음식 x 음식) CSR 유사도 행렬로 펼친다.'''
+    n_items, k  = neighbor_idx.shape
+    return sparse.csr_matrix(
+        (
+            neighbor_sim.ravel(),
+            neighbor_idx.ravel(),
+            np.arange(0, n_items * k + 1, k),
+        ),
+        shape       = (n_items, n_items),
+    )
+
+
+class UserItemMatrix:
+    '''
+    사용자 x 음식 CSR 행렬과 id <-> 인덱스 매핑.
+
+    user_ids, item_ids는 정렬되어 있어 searchsorted로 인덱스를 찾는다.
+    item_ids는 보통 food id(int)이지만 카테고리 이름 등 정렬 가능한 값이면 된다.
+    '''
+    def __init__(self, matrix, user_ids, item_ids):
+        self.matrix     = sparse.csr_matrix(matrix)
+        self.user_ids   = np.asarray(user_ids, dtype=np.int64)
+        self.item_ids   = np.asarray(item_ids)
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    @classmethod
+    def from_pairs(cls, users, items, values=None, dtype=np.float32):
+        '''
+        (user id, item id[, value]) 배열로부터 행렬을 만든다.
+        같은 (user, item) 쌍이 여러 번 나오면 값을 더한다. (= pivot_table의 aggfunc='sum')
+        '''
+        user_ids, rows  = np.unique(np.asarray(users, dtype=np.int64), return_inverse=True)
+        item_ids, cols  = np.unique(np.asarray(items, dtype=np.int64), return_inverse=True)
+        if values is None:
+            values      = np.ones(len(rows), dtype=dtype)
+
+        matrix      = sparse.csr_matrix(
+            (np.asarray(values, dtype=dtype), (rows, cols)),
+            shape       = (len(user_ids), len(item_ids)),
+        )
+        matrix.sum_duplicates()
+        return cls(matrix, user_ids, item_ids)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            matrix  = sparse.csr_matrix(
+                (data['data'], data['indices'], data['indptr']),
+                shape   = tuple(data['shape']),
+            )
+            return cls(matrix, data['user_ids'], data['item_ids'])
+
+    def save(self, path):
+        '''압축된 .npz로 저장. 다른 프로세스가 읽는 중일 수 있으므로 임시 파일에 쓴 뒤 교체'''
+        tmp_path    = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(
+                f,
+                data        = self.matrix.data,
+                indices     = self.matrix.indices,
+                indptr      = self.matrix.indptr,
+                shape       = np.array(self.matrix.shape),
+                user_ids    = self.user_ids,
+                item_ids    = self.item_ids,
+            )
+        os.replace(tmp_path, path)
+
+    def user_index(self, user_ids):
+        return index_of(self.user_ids, user_ids)
+
+    def item_index(self, item_ids):
+        return index_of(self.item_ids, item_ids)
+
+    def user_items(self, user_id):
+        '''사용자가 먹은 음식의 (인덱스, 횟수). 행 하나만 읽으므로 기록 수에 비례.'''
+        row         = self.user_index([user_id])
+        if not len(row):
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=self.matrix.dtype)
+        start, stop = self.matrix.indptr[row[0]], self.matrix.indptr[row[0] + 1]
+        return self.matrix.indices[start:stop], self.matrix.data[start:stop]
+
+
+class ItemNeighbors:
+    '''
+    메모리 기반 CF의 오프라인 결과물.
+    음식마다 유사도가 높은 top-k 이웃의 (인덱스, 유사도)만 저장한다.
+
+    food_ids    : (n,)   int64, 정렬된 음식 id
+    neighbor_idx: (n, k) int32, 이웃 음식의 인덱스
+    neighbor_sim: (n, k) float32, 이웃 음식과의 유사도
+    item_norm   : (n,)   float32, 학습 데이터 기준 음식별 점수의 L2 norm (정규화용)
+    '''
+    def __init__(self, food_ids, neighbor_idx, neighbor_sim, item_norm, version):
+        self.food_ids       = np.asarray(food_ids, dtype=np.int64)
+        self.neighbor_idx   = np.asarray(neighbor_idx, dtype=np.int32)
+        self.neighbor_sim   = np.asarray(neighbor_sim, dtype=np.float32)
+        self.item_norm      = np.asarray(item_norm, dtype=np.float32)
+        self.version        = version
+
+    def __len__(self):
+        return len(self.food_ids)
+
+    @classmethod
+    def build(cls, matrix, k=CF_TOP_K):
+        '''
+        matrix      : UserItemMatrix (사용자 x 음식 섭취 횟수)
+        '''
+        neighbor_idx, neighbor_sim = item_neighbors(matrix.matrix, k)
+
+        # 요청 시점에는 다른 사용자의 점수를 알 수 없으므로,
+        # 기존의 열 방향 정규화(normalize(score, axis=0))에 쓰이던 norm을 미리 계산해 둠
+        score       = mask_consumed(
+            matrix.matrix.dot(neighbor_matrix(neighbor_idx, neighbor_sim)),
+            matrix.matrix
+        )
+        item_norm   = np.sqrt(np.asarray(score.power(2).sum(axis=0))).ravel()
+
+        version     = datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%d%H%M%S')
+        return cls(matrix.item_ids, neighbor_idx, neighbor_sim, item_norm, version)
+
+    @classmethod
+    def load(cls, path=CF_NEIGHBORS_PATH):
+        with np.load(path) as data:
+            return cls(
+                data['food_ids'],
+                data['neighbor_idx'],
+                data['neighbor_sim'],
+                data['item_norm'],
+                str(data['version']),
+            )
+
+    def save(self, path=CF_NEIGHBORS_PATH):
+        # 서빙 중인 프로세스가 쓰다 만 파일을 읽지 않도록 임시 파일에 쓴 뒤 교체
+        tmp_path    = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(
+                f,
+                food_ids    = self.food_ids,
+                neighbor_idx= self.neighbor_idx,
+                neighbor_sim= self.neighbor_sim,
+                item_norm   = self.item_norm,
+                version     = np.array(self.version),
+            )
+        os.replace(tmp_path, path)
+
+    def index_of(self, food_ids):
+        '''food id -> 인덱스. 모델에 없는 음식은 제외한다.'''
+        return index_of(self.food_ids, food_ids)
+
+    def score(self, food_ids):
+        '''
+        사용자가 먹은 음식 id 목록(중복 허용)만으로 전체 음식의 점수를 계산.
+        (피벗 테이블의 한 행) x (음식 간 유사도) 와 같지만, 먹은 음식의 이웃만 더한다.
+        '''
+        scores      = np.zeros(len(self), dtype=np.float32)
+        ate, counts = np.unique(self.index_of(food_ids), return_counts=True)
+        if not len(ate):
+            return scores
+
+        weights     = self.neighbor_sim[ate] * counts[:, None]
+        scores      += np.bincount(
+            self.neighbor_idx[ate].ravel(),
+            weights     = weights.ravel(),
+            minlength   = len(self),
+        ).astype(np.float32)
+
+        # 이미 먹었던 음식은 제외하고, 음식별 점수를 정규화
+        scores[ate] = 0
+        np.divide(scores, self.item_norm, out=scores, where=self.item_norm > 0)
+        return scores
+
+    def recommend(self, food_ids, n=5, preferences=None, allowed=None):
+        '''
+        preferences : Preferences. top-k 전에 점수 배열에서 싫어요를 빼고 좋아요를 올린다.
+        allowed     : self.food_ids 순서의 bool 배열 (ex. FoodIndex.mask). False인 음식은 추천하지 않는다.
+        '''
+        scores      = self.score(food_ids)
+        if allowed is not None:
+            scores[~allowed] = -np.inf
+        if preferences:
+            preferences.apply(scores, self.food_ids)
+        return self.food_ids[top_k(scores, n)].tolist()
+
+    @property
+    def matrix(self):
+        '''(음식 x 음식) top-k 유사도 CSR 행렬. 여러 사용자를 한 번에 계산할 때 사용.'''
+        if not hasattr(self, '_matrix'):
+            self._matrix = neighbor_matrix(self.neighbor_idx, self.neighbor_sim)
+        return self._matrix
+
+    def score_users(self, consumed):
+        '''
+        consumed: (사용자 x 음식) CSR 섭취 횟수 행렬. 열 순서는 self.food_ids와 같음
+        한 번의 희소 행렬 곱으로 여러 사용자의 점수를 구한다. (사용자 x 음식) dense 배열 반환.
+        '''
+        scores      = mask_consumed(consumed.dot(self.matrix), consumed).toarray()
+        np.divide(scores, self.item_norm, out=scores, where=self.item_norm > 0)
+        return scores
+
+
+# 프로세스당 한 번만 읽고, create_cf_model.py가 파일을 교체하면 다시 읽음
+neighbors = ArtifactHolder('memory-cf', CF_NEIGHBORS_PATH, ItemNeighbors.load)
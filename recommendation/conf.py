@@ -0,0 +1,38 @@
+from django.conf import settings
+
+
+DEFAULTS = {
+    # True면 refresh_recommendations 명령으로 미리 계산해 둔 결과를 먼저 사용
+    'SERVE_PRECOMPUTED' : False,
+    # ALS 추천의 item 검색 방식. 'exact': 전체 item과 내적, 'ann': IVF 인덱스로 근사 검색
+    'RETRIEVAL'         : 'exact',
+    # 'ann'일 때 정확히 계산할 군집 수. 클수록 정확하지만 느려짐
+    'ANN_PROBES'        : 8,
+    # 사용자별/전략별 추천 응답을 캐시할 시간(초). 0이면 캐시하지 않음
+    'CACHE_TIMEOUT'     : 300,
+    # blended 추천에서 각 추천을 기다리는 최대 시간(초). 넘으면 버리고 캐시된 인기 음식으로 채움
+    'BLEND_TIMEOUTS'    : {
+        'als'       : 0.2,
+        'memory-cf' : 0.2,
+        'interest'  : 0.1,
+        'popular'   : 0.1,
+        'random'    : 0.05,
+    },
+    # blended 추천의 각 추천을 실행하는 프로세스당 스레드 수. 모두 사용 중이면 다음 추천은 기다리다 시간 초과됨
+    'BLEND_WORKERS'     : 16,
+    # blended 추천에서 각 추천이 먼저 차지하는 최대 개수
+    'BLEND_QUOTAS'      : {
+        'als'       : 3,
+        'memory-cf' : 3,
+        'interest'  : 2,
+        'popular'   : 1,
+        'random'    : 1,
+    },
+    # 좋아요 한 음식의 추천 점수에 곱하는 값 (싫어요 한 음식은 항상 제외)
+    'LIKE_BOOST'        : 1.5,
+}
+
+
+def get_setting(name):
+    '''settings.RECOMMENDATION[name], 없으면 기본값'''
+    return getattr(settings, 'RECOMMENDATION', {}).get(name, DEFAULTS[name])
@@ -0,0 +1,52 @@
+from itertools import islice
+
+import numpy as np
+
+from feature.models import History
+from recommendation.cf import UserItemMatrix
+
+
+HISTORY_MATRIX_PATH = './data/history_matrix.npz'
+EXPORT_CHUNK_SIZE   = 20000
+
+
+def _codes(values, mapping):
+    '''int가 아닌 item(ex. 카테고리 이름)을 등장 순서대로 0, 1, 2, ... 코드로 바꾼다.'''
+    return np.fromiter(
+        (mapping.setdefault(value, len(mapping)) for value in values),
+        dtype=np.int32, count=len(values),
+    )
+
+
+def export_history(item_field='food_id', since=None, chunk_size=EXPORT_CHUNK_SIZE):
+    '''
+    History를 (사용자 x item) 섭취 횟수 CSR 행렬(UserItemMatrix)로 바로 내보낸다.
+
+    item_field  : item으로 사용할 History의 값 (ex. 'food_id', 'food__category__name')
+    since       : 이 시각 이후(created_at >=)의 기록만
+    chunk_size  : 한 번에 DB에서 읽을 행 수. 모델 객체 없이 (user id, item) 튜플만 읽어서
+                  chunk마다 int32 배열로 바꾸므로, 기록 수만큼의 파이썬 객체를 들고 있지 않는다.
+    '''
+    histories   = History.objects.order_by()
+    if since is not None:
+        histories   = histories.filter(created_at__gte=since)
+    rows        = histories.values_list('user_id', item_field).iterator(chunk_size=chunk_size)
+
+    users, items, mapping = [], [], {}
+    while chunk := list(islice(rows, chunk_size)):
+        user_ids, values = zip(*chunk)
+        users.append(np.fromiter(user_ids, dtype=np.int32, count=len(user_ids)))
+        if isinstance(values[0], int) and not mapping:
+            items.append(np.fromiter(values, dtype=np.int32, count=len(values)))
+        else:
+            items.append(_codes(values, mapping))
+
+    users       = np.concatenate(users) if users else np.zeros(0, dtype=np.int32)
+    items       = np.concatenate(items) if items else np.zeros(0, dtype=np.int32)
+    matrix      = UserItemMatrix.from_pairs(users, items)
+    if mapping:
+        # 코드 -> 원래 값. searchsorted로 찾을 수 있도록 값 순서로 열을 다시 정렬
+        names       = np.array(list(mapping))[matrix.item_ids]
+        order       = np.argsort(names, kind='stable')
+        matrix      = UserItemMatrix(matrix.matrix[:, order], matrix.user_ids, names[order])
+    return matrix
@@ -0,0 +1,225 @@
+import os
+import datetime
+import json
+import shutil
+
+import numpy as np
+
+from recommendation.ann import ANN_PROBES, IVFIndex
+from recommendation.cf import index_of, top_k, top_k_rows
+from recommendation.preferences import Preferences, apply_rows, n_candidates
+
+
+KEEP_VERSIONS   = 3
+
+
+class FactorModel:
+    '''
+    ALS의 사용자/아이템 factor 행렬과 id 매핑.
+
+    디렉터리 구조 (directory/CURRENT 에 현재 버전 이름이 적혀 있음)
+        directory/CURRENT
+        directory/<version>/user_ids.npy      (users,)   정렬된 user id
+        directory/<version>/item_ids.npy      (items,)   모델의 item 인덱스 순서의 item id
+        directory/<version>/user_factors.npy  (users, factors) float32
+        directory/<version>/item_factors.npy  (items, factors) float32
+        directory/<version>/meta.json         학습 설정, 학습/갱신 시각 등
+        directory/<version>/ann.npz           item factor의 IVF 인덱스 (없을 수 있음)
+
+    load()는 factor 행렬을 mmap_mode='r'로 열기 때문에, 같은 호스트의 워커들은
+    페이지 캐시에 올라간 한 벌의 행렬을 공유한다.
+    '''
+    def __init__(self, user_ids, item_ids, user_factors, item_factors, version=None, meta=None, index=None):
+        self.user_ids       = user_ids
+        self.item_ids       = item_ids
+        self.user_factors   = user_factors
+        self.item_factors   = item_factors
+        self.version        = version or datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%d%H%M%S')
+        self.meta           = meta or {}
+        self.index          = index
+
+    def __len__(self):
+        return len(self.item_ids)
+
+    @classmethod
+    def load(cls, current_path):
+        directory   = os.path.dirname(current_path)
+        with open(current_path) as f:
+            version = f.read().strip()
+
+        def _load(name, mmap_mode='r'):
+            return np.load(os.path.join(directory, version, f'{name}.npy'), mmap_mode=mmap_mode)
+
+        meta        = {}
+        meta_path   = os.path.join(directory, version, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta    = json.load(f)
+
+        return cls(
+            user_ids        = _load('user_ids'),
+            item_ids        = _load('item_ids', mmap_mode=None),
+            user_factors    = _load('user_factors'),
+            item_factors    = _load('item_factors'),
+            version         = version,
+            meta            = meta,
+            index           = IVFIndex.load(os.path.join(directory, version)),
+        )
+
+    def save(self, directory):
+        '''
+        새 버전 디렉터리에 모두 쓴 뒤 CURRENT를 교체한다.
+        이미 열려 있는 mmap은 이전 버전 파일을 계속 가리키므로, 최근 몇 개 버전은 남겨 둔다.
+        '''
+        # 같은 이름의 버전이 이미 있으면 (1초 안에 다시 저장) 열려 있는 파일을 덮어쓰지 않도록 이름을 바꿈
+        base, suffix= self.version, 0
+        while os.path.exists(os.path.join(directory, self.version)):
+            suffix      += 1
+            self.version= f'{base}-{suffix}'
+
+        path        = os.path.join(directory, self.version)
+        os.makedirs(path)
+
+        order       = np.argsort(self.user_ids)
+        np.save(os.path.join(path, 'user_ids.npy'), np.asarray(self.user_ids, dtype=np.int64)[order])
+        np.save(os.path.join(path, 'user_factors.npy'), np.asarray(self.user_factors, dtype=np.float32)[order])
+        np.save(os.path.join(path, 'item_ids.npy'), np.asarray(self.item_ids))
+        np.save(os.path.join(path, 'item_factors.npy'), np.asarray(self.item_factors, dtype=np.float32))
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(self.meta, f, ensure_ascii=False, indent=2)
+        if self.index is not None:
+            self.index.save(path)
+
+        current_path= os.path.join(directory, 'CURRENT')
+        with open(current_path + '.tmp', 'w') as f:
+            f.write(self.version)
+        os.replace(current_path + '.tmp', current_path)
+
+        versions    = sorted(
+            name for name in os.listdir(directory)
+            if os.path.isdir(os.path.join(directory, name))
+        )
+        for name in versions[:-KEEP_VERSIONS]:
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+    def user_row(self, user_id):
+        row         = index_of(self.user_ids, [user_id])
+        return int(row[0]) if len(row) else None
+
+    def scores(self, user_id):
+        '''사용자 factor와 전체 item factor의 내적. 모델에 없는 사용자면 None.'''
+        row         = self.user_row(user_id)
+        if row is None:
+            return None
+        return self.item_factors.dot(self.user_factors[row])
+
+    def _search(self, row, n, n_probe, preferences, allowed=None):
+        '''IVF 인덱스로 한 사용자의 상위 n개 item 인덱스. preferences는 후보의 점수에만 적용'''
+        adjust      = None
+        if preferences:
+            def adjust(scores, candidates):
+                preferences.apply(scores, self.item_ids[candidates])
+        return self.index.search(
+            self.item_factors, np.asarray(self.user_factors[row]), n, n_probe,
+            adjust      = adjust,
+            min_items   = n_candidates(n, preferences),
+            allowed     = allowed,
+        )
+
+    def recommend(self, user_id, n=10, retrieval='exact', n_probe=ANN_PROBES, preferences=None, allowed=None):
+        '''
+        retrieval   : 'exact'면 전체 item과 내적, 'ann'이면 IVF 인덱스의 n_probe개 군집만 계산
+                      (인덱스가 없으면 exact)
+        preferences : Preferences. top-k 전에 점수 배열에서 싫어요를 빼고 좋아요를 올린다.
+        allowed     : item 인덱스 순서의 bool 배열 (ex. FoodIndex.mask). False인 item은 추천하지 않는다.
+        '''
+        row         = self.user_row(user_id)
+        if row is None:
+            return []
+        if retrieval == 'ann' and self.index is not None:
+            return self.item_ids[self._search(row, n, n_probe, preferences, allowed)].tolist()
+
+        scores      = self.scores(user_id)
+        if allowed is not None:
+            scores[~allowed] = -np.inf
+        if preferences:
+            preferences.apply(scores, self.item_ids)
+        return self.item_ids[top_k(scores, n, min_score=-np.inf)].tolist()
+
+    def recommend_users(self, user_ids, n=10, retrieval='exact', n_probe=ANN_PROBES, preferences=None, allowed=None):
+        '''
+        여러 사용자의 추천을 한 번의 행렬 곱으로 계산. {user id: [item id, ...]}
+        모델에 없는 사용자는 빈 리스트. retrieval, allowed는 recommend()와 같음
+        preferences : {user id: Preferences}. item id가 정렬되어 있어야 한다. (create_als_model.py)
+        '''
+        preferences = preferences or {}
+        user_ids    = np.asarray(user_ids, dtype=np.int64)
+        rows        = np.searchsorted(self.user_ids, user_ids)
+        rows[rows == len(self.user_ids)] = 0
+        known       = self.user_ids[rows] == user_ids if len(self.user_ids) else np.zeros(len(user_ids), dtype=bool)
+
+        result      = {int(user_id): [] for user_id in user_ids}
+        if not known.any():
+            return result
+
+        if retrieval == 'ann' and self.index is not None:
+            for user_id, row in zip(user_ids[known], rows[known]):
+                top         = self._search(row, n, n_probe, preferences.get(int(user_id)), allowed)
+                result[int(user_id)] = self.item_ids[top].tolist()
+            return result
+
+        scores      = self.user_factors[rows[known]].dot(self.item_factors.T)
+        if allowed is not None:
+            scores[:, ~allowed] = -np.inf
+        if preferences:
+            apply_rows(scores, self.item_ids, [
+                preferences.get(int(user_id)) or Preferences() for user_id in user_ids[known]
+            ])
+        for user_id, top in zip(user_ids[known], top_k_rows(scores, n, min_score=-np.inf)):
+            result[int(user_id)] = self.item_ids[top].tolist()
+        return result
+
+    def solve_users(self, user_items, regularization):
+        '''
+        item factor를 고정한 채 사용자 factor만 다시 푼다. (ALS의 사용자 쪽 한 단계)
+        user_items: [(item 인덱스 배열, confidence 배열), ...]
+
+        x_u = (YtY + Yu^T (C_u - I) Yu + λI)^-1 Yu^T C_u p_u
+        YtY는 한 번만 계산하고, 사용자마다 먹은 item의 행만 더하므로 기록 수에 비례한다.
+        '''
+        item_factors= np.asarray(self.item_factors, dtype=np.float64)
+        n_factors   = item_factors.shape[1]
+        base        = item_factors.T.dot(item_factors) + regularization * np.eye(n_factors)
+
+        factors     = np.zeros((len(user_items), n_factors), dtype=np.float32)
+        for row, (items, confidence) in enumerate(user_items):
+            if not len(items):
+                continue
+            yu          = item_factors[items]
+            confidence  = np.asarray(confidence, dtype=np.float64)
+            a           = base + yu.T.dot((confidence - 1)[:, None] * yu)
+            b           = yu.T.dot(confidence)
+            factors[row]= np.linalg.solve(a, b)
+        return factors
+
+    def with_users(self, user_ids, factors, meta=None):
+        '''
+        주어진 사용자들의 factor를 교체(새 사용자는 추가)한 새 버전의 모델.
+        item factor와 IVF 인덱스는 그대로 공유한다.
+        '''
+        user_ids    = np.asarray(user_ids, dtype=np.int64)
+        rows        = np.searchsorted(self.user_ids, user_ids)
+        rows[rows == len(self.user_ids)] = 0
+        known       = self.user_ids[rows] == user_ids if len(self.user_ids) else np.zeros(len(user_ids), dtype=bool)
+
+        user_factors= np.array(self.user_factors, dtype=np.float32)
+        user_factors[rows[known]] = factors[known]
+
+        return FactorModel(
+            user_ids        = np.concatenate([self.user_ids, user_ids[~known]]),
+            item_ids        = self.item_ids,
+            user_factors    = np.concatenate([user_factors, factors[~known]]),
+            item_factors    = self.item_factors,
+            meta            = {**self.meta, **(meta or {})},
+            index           = self.index,
+        )
@@ -0,0 +1,49 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils.dateparse import parse_date
+
+from feature.models import History
+from recommendation.models import DailyFoodCount
+
+
+class Command(BaseCommand):
+    help = 'History로부터 날짜별/음식별 기록 수(DailyFoodCount)를 다시 집계합니다.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='이 날짜(YYYY-MM-DD)부터 다시 집계. 생략하면 전체')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        since       = parse_date(options['since']) if options['since'] else None
+
+        histories   = History.objects.all()
+        counts      = DailyFoodCount.objects.all()
+        if since:
+            # 날짜는 현재 시간대(TIME_ZONE) 기준이므로 그 날짜의 0시부터
+            histories   = histories.filter(created_at__gte=datetime.datetime.combine(since, datetime.time()))
+            counts      = counts.filter(date__gte=since)
+
+        rows        = histories.annotate(
+            date=TruncDate('created_at')
+        ).values(
+            'date', 'food', 'food__category'
+        ).annotate(
+            count=Count('id')
+        ).order_by()
+
+        with transaction.atomic():
+            counts.delete()
+            DailyFoodCount.objects.bulk_create((
+                DailyFoodCount(
+                    date        = row['date'],
+                    food_id     = row['food'],
+                    category_id = row['food__category'],
+                    count       = row['count'],
+                ) for row in rows.iterator()
+            ), batch_size=options['batch_size'])
+
+        self.stdout.write(f'DONE: Backfilled daily food counts. ({DailyFoodCount.objects.count()} rows)')
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from feature.models import History
+from recommendation.models import InterestFoodCount
+
+
+class Command(BaseCommand):
+    help = 'History와 사용자의 선호 대분류로부터 대분류별/음식별 기록 수(InterestFoodCount)를 다시 집계합니다.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        rows        = History.objects.filter(
+            user__profile__interest_in__isnull=False
+        ).values(
+            'user__profile__interest_in', 'food'
+        ).annotate(
+            count=Count('id')
+        ).order_by()
+
+        with transaction.atomic():
+            InterestFoodCount.objects.all().delete()
+            InterestFoodCount.objects.bulk_create((
+                InterestFoodCount(
+                    interest_id = row['user__profile__interest_in'],
+                    food_id     = row['food'],
+                    count       = row['count'],
+                ) for row in rows.iterator()
+            ), batch_size=options['batch_size'])
+
+        self.stdout.write(f'DONE: Backfilled interest food counts. ({InterestFoodCount.objects.count()} rows)')
@@ -0,0 +1,28 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recommendation.export import EXPORT_CHUNK_SIZE, HISTORY_MATRIX_PATH, export_history
+
+
+class Command(BaseCommand):
+    help = 'History를 (사용자 x item) CSR 행렬로 내보내 압축된 .npz로 저장합니다. (UserItemMatrix.load로 읽음)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--item-field', default='food_id', help='item으로 사용할 값 (ex. food_id, food__category__name)')
+        parser.add_argument('--days', type=int, help='최근 며칠 동안의 기록만. 생략하면 전체')
+        parser.add_argument('--output', default=HISTORY_MATRIX_PATH)
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        since       = None
+        if options['days'] is not None:
+            since   = timezone.now() - datetime.timedelta(days=options['days'])
+
+        matrix      = export_history(options['item_field'], since=since, chunk_size=options['chunk_size'])
+        matrix.save(options['output'])
+        self.stdout.write(
+            f'DONE: Exported {matrix.matrix.nnz} (user, item) pairs of {matrix.shape[0]} users x {matrix.shape[1]} items '
+            f'to {options["output"]}'
+        )
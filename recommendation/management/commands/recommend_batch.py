@@ -0,0 +1,32 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from recommendation.batch import STRATEGIES, recommend_batch
+
+
+User = get_user_model()
+
+class Command(BaseCommand):
+    help = '여러 사용자의 추천 결과를 한 번에 계산해 JSON Lines로 출력합니다. (점심 알림 등 배치 작업용)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--strategy', choices=sorted(STRATEGIES), default='als')
+        parser.add_argument('--users', type=int, nargs='*', help='user id 목록. 생략하면 활성 사용자 전체')
+        parser.add_argument('-n', type=int, default=5, help='사용자별 추천 개수')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        user_ids    = options['users'] or list(
+            User.objects.filter(is_active=True).order_by('id').values_list('id', flat=True)
+        )
+
+        chunk_size  = options['chunk_size']
+        for start in range(0, len(user_ids), chunk_size):
+            results = recommend_batch(options['strategy'], user_ids[start:start + chunk_size], options['n'])
+            for user_id, foods in results.items():
+                self.stdout.write(json.dumps({
+                    'user_id'   : user_id,
+                    'foods'     : [{'food_id': food.id, 'food_name': food.name} for food in foods],
+                }, ensure_ascii=False))
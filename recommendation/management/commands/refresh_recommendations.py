@@ -0,0 +1,54 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from recommendation.batch import STRATEGIES
+from recommendation.precompute import compute_chunk, init_worker, save_chunk
+
+
+User = get_user_model()
+
+class Command(BaseCommand):
+    help = (
+        '사용자별/전략별 추천 결과를 미리 계산해 UserRecommendation에 저장합니다. '
+        "settings.RECOMMENDATION['SERVE_PRECOMPUTED']가 True면 추천 API는 저장된 행 하나만 읽습니다."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--strategy', choices=sorted(STRATEGIES), nargs='*', help='생략하면 전체 전략')
+        parser.add_argument('--users', type=int, nargs='*', help='user id 목록. 생략하면 활성 사용자 전체')
+        parser.add_argument('-n', type=int, help='사용자별 추천 개수. 생략하면 전략별 API와 같은 개수')
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--workers', type=int, default=1, help='프로세스 수. 1이면 현재 프로세스에서 계산')
+
+    def handle(self, *args, **options):
+        strategies  = options['strategy'] or sorted(STRATEGIES)
+        user_ids    = options['users'] or list(
+            User.objects.filter(is_active=True).order_by('id').values_list('id', flat=True)
+        )
+        chunk_size  = options['chunk_size']
+        chunks      = [
+            (strategy, user_ids[start:start + chunk_size], options['n'])
+            for strategy in strategies
+            for start in range(0, len(user_ids), chunk_size)
+        ]
+
+        _t          = time.time()
+        if options['workers'] <= 1:
+            for chunk in chunks:
+                save_chunk(*compute_chunk(*chunk))
+        else:
+            # 워커가 부모의 DB 연결을 물려받지 않도록 fork 전에 닫아 둠
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=init_worker) as executor:
+                futures = [executor.submit(compute_chunk, *chunk) for chunk in chunks]
+                for future in as_completed(futures):
+                    save_chunk(*future.result())
+
+        self.stdout.write(
+            f'DONE: Refreshed {len(user_ids)} users x {len(strategies)} strategies '
+            f'({len(chunks)} chunks, {time.time() - _t:.1f}s)'
+        )
@@ -0,0 +1,90 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from feature.models import History
+from recommendation.als import ALS_CURRENT_PATH, ALS_FACTORS_DIR, ALS_ITEM_FIELD
+from recommendation.factors import FactorModel
+from recommendation.models import ALSStaleUser
+from recommendation.sweep import confidence
+
+
+class Command(BaseCommand):
+    help = (
+        '마지막 학습/갱신 이후 기록이 추가/수정/삭제된 사용자의 ALS factor만 다시 계산합니다. '
+        'item factor는 고정하고 사용자 행만 풀기 때문에 전체 재학습보다 훨씬 빠르며, 새 사용자도 추가됩니다. '
+        '기록이 모두 삭제된 사용자의 factor는 0이 됩니다.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='이 시각 이후 바뀐 기록을 반영 (ISO 8601). 생략하면 모델의 history_until')
+        parser.add_argument('--users', type=int, nargs='*', help='지정한 사용자만 갱신')
+        parser.add_argument('--regularization', type=float, help='생략하면 학습 시의 값')
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        model       = FactorModel.load(ALS_CURRENT_PATH)
+        now         = timezone.now()
+
+        regularization = options['regularization'] or model.meta.get('regularization')
+        if regularization is None:
+            raise CommandError('regularization 값을 알 수 없습니다. --regularization 을 지정하세요.')
+
+        if options['users']:
+            user_ids    = sorted(set(options['users']))
+        else:
+            since       = options['since'] or model.meta.get('history_until')
+            if since is None:
+                raise CommandError('마지막 갱신 시각을 알 수 없습니다. --since 를 지정하세요.')
+            since       = parse_datetime(since)
+            user_ids    = set(History.objects.filter(
+                Q(created_at__gte=since) | Q(updated_at__gte=since)
+            ).values_list('user_id', flat=True))
+            # 기록이 삭제된 사용자 (History의 post_delete에서 남김)
+            user_ids    = sorted(user_ids | set(ALSStaleUser.objects.values_list('user_id', flat=True)))
+
+        # 학습과 같은 confidence로 바꿔서 푼다. (alpha가 없는 이전 모델은 먹은 횟수 그대로)
+        alpha       = model.meta.get('alpha')
+
+        item_index  = {item: i for i, item in enumerate(model.item_ids.tolist())}
+        user_items  = {}
+        chunk_size  = options['chunk_size']
+        for start in range(0, len(user_ids), chunk_size):
+            rows    = History.objects.filter(
+                user_id__in=user_ids[start:start + chunk_size]
+            ).values_list(
+                'user', ALS_ITEM_FIELD
+            ).annotate(
+                count=Count('id')
+            ).order_by()
+            for user_id, item, count in rows:
+                if (idx := item_index.get(item)) is not None:
+                    items, counts = user_items.setdefault(user_id, ([], []))
+                    items.append(idx)
+                    counts.append(count)
+
+        # 남은 기록이 없는 사용자는 모델에 있을 때만 factor를 0으로 (먹은 적 없는 음식으로 추천하지 않음)
+        updated     = sorted(
+            user_id for user_id in user_ids
+            if user_id in user_items or model.user_row(user_id) is not None
+        )
+        if not updated:
+            ALSStaleUser.objects.filter(user_id__in=user_ids, changed_at__lte=now).delete()
+            self.stdout.write('DONE: No users to update.')
+            return
+
+        factors     = model.solve_users([
+            (items, counts if alpha is None else confidence(counts, alpha))
+            for items, counts in (user_items.get(user_id, ([], [])) for user_id in updated)
+        ], regularization)
+        updated_model = model.with_users(updated, factors, meta={
+            'history_until' : now.isoformat(),
+            'updated_at'    : now.isoformat(),
+            'updated_users' : len(updated),
+        })
+        updated_model.save(ALS_FACTORS_DIR)
+        # 이번 갱신 이후에 다시 삭제된 사용자는 남겨 둠
+        ALSStaleUser.objects.filter(user_id__in=user_ids, changed_at__lte=now).delete()
+
+        self.stdout.write(f'DONE: Updated {len(updated)} users. (version: {updated_model.version})')
@@ -1,3 +1,348 @@
-from django.db import models
+import threading
+from collections import Counter
 
-# Create your models here.
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from account.models import Profile, ProfileDislike, ProfileLike
+from feature.models import Category, Food, History, histories_created
+from recommendation.cache import invalidate
+from recommendation.sampling import food_index
+
+
+class UserRecommendation(models.Model):
+    '''
+    refresh_recommendations 명령으로 미리 계산해 둔 사용자별/전략별 추천 결과.
+    요청 시에는 이 행 하나만 읽는다.
+    '''
+    user        = models.ForeignKey(
+        User,
+        related_name= 'recommendations',
+        verbose_name= 'user',
+        on_delete   = models.CASCADE
+    )
+
+    strategy    = models.CharField(
+        verbose_name= 'strategy',
+        max_length  = 32,
+    )
+
+    food_ids    = models.JSONField(
+        verbose_name= 'food ids',
+        default     = list,
+    )
+
+    updated_at  = models.DateTimeField(
+        verbose_name= 'updated at',
+        auto_now    = True
+    )
+
+    class Meta:
+        db_table = 'recommendation_user_recommendation'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'strategy'], name='unique_user_strategy'),
+        ]
+
+    def __str__(self):
+        return f'{self.user} | {self.strategy} | {self.updated_at}'
+
+
+class ALSStaleUser(models.Model):
+    '''
+    기록이 삭제되어 update_als_users로 ALS factor를 다시 계산해야 하는 사용자.
+    삭제된 기록은 created_at/updated_at으로 찾을 수 없으므로 History의 post_delete에서 남긴다.
+    사용자가 삭제되어도 User의 삭제를 막지 않도록 FK 대신 id만 저장하고, 갱신한 뒤 지운다.
+    '''
+    user_id     = models.BigIntegerField(
+        verbose_name= 'user id',
+        primary_key = True,
+    )
+
+    changed_at  = models.DateTimeField(
+        verbose_name= 'changed at',
+        auto_now    = True
+    )
+
+    class Meta:
+        db_table = 'recommendation_als_stale_user'
+
+    def __str__(self):
+        return f'{self.user_id} | {self.changed_at}'
+
+
+class DailyFoodCountManager(models.Manager):
+    def apply(self, rows, sign=1):
+        '''
+        rows: (날짜, food id, category id) 목록. 같은 (날짜, 음식)끼리 묶어서 한 번씩만 갱신한다.
+        sign: 추가면 1, 삭제면 -1
+        '''
+        for (date, food_id, category_id), count in Counter(rows).items():
+            updated = self.filter(
+                date=date, food_id=food_id
+            ).update(count=F('count') + sign * count)
+            if updated or sign < 0:
+                continue
+            try:
+                with transaction.atomic():
+                    self.create(date=date, food_id=food_id, category_id=category_id, count=count)
+            except IntegrityError:
+                # 다른 요청이 먼저 행을 만든 경우
+                self.filter(date=date, food_id=food_id).update(count=F('count') + count)
+
+class DailyFoodCount(models.Model):
+    '''
+    날짜별/음식별 History 수. History가 추가/삭제될 때마다 갱신되고,
+    backfill_daily_counts 명령으로 다시 집계할 수 있다.
+    인기 음식 추천은 History 전체 대신 기간 내의 이 행들만 더한다.
+    '''
+    date        = models.DateField(
+        verbose_name= 'date',
+    )
+
+    food        = models.ForeignKey(
+        Food,
+        related_name= 'daily_counts',
+        verbose_name= 'food',
+        on_delete   = models.CASCADE
+    )
+
+    category    = models.ForeignKey(
+        Category,
+        related_name= 'daily_counts',
+        verbose_name= 'category',
+        on_delete   = models.CASCADE
+    )
+
+    count       = models.IntegerField(
+        verbose_name= 'count',
+        default     = 0
+    )
+
+    objects     = DailyFoodCountManager()
+
+    class Meta:
+        db_table = 'recommendation_daily_food_count'
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'food'], name='unique_date_food'),
+        ]
+        indexes = [
+            models.Index(fields=['category', 'date']),
+        ]
+
+    def __str__(self):
+        return f'{self.date} | {self.food_id} | {self.count}'
+
+
+class InterestFoodCountManager(models.Manager):
+    def apply(self, rows, sign=1):
+        '''
+        rows: (선호 대분류 id, food id, 횟수) 목록. 같은 (대분류, 음식)끼리 묶어서 한 번씩만 갱신한다.
+        sign: 추가면 1, 삭제면 -1
+        '''
+        counts  = Counter()
+        for interest_id, food_id, count in rows:
+            if interest_id is not None:
+                counts[(interest_id, food_id)] += count
+
+        for (interest_id, food_id), count in counts.items():
+            updated = self.filter(
+                interest_id=interest_id, food_id=food_id
+            ).update(count=F('count') + sign * count)
+            if updated or sign < 0:
+                continue
+            try:
+                with transaction.atomic():
+                    self.create(interest_id=interest_id, food_id=food_id, count=count)
+            except IntegrityError:
+                # 다른 요청이 먼저 행을 만든 경우
+                self.filter(interest_id=interest_id, food_id=food_id).update(count=F('count') + count)
+
+    def apply_user(self, user_id, interest_id, sign=1):
+        '''사용자의 기록 전체를 interest_id 대분류에 더하거나(1) 뺀다(-1).'''
+        if interest_id is None:
+            return
+        rows    = History.objects.filter(
+            user_id=user_id
+        ).values_list(
+            'food'
+        ).annotate(
+            count=models.Count('id')
+        ).order_by()
+        self.apply([(interest_id, food_id, count) for food_id, count in rows], sign=sign)
+
+class InterestFoodCount(models.Model):
+    '''
+    선호 대분류별로, 그 대분류를 선택한 사용자들이 음식을 먹은 횟수.
+    History가 추가/삭제되거나 사용자가 선호 대분류를 바꿀 때마다 갱신되고,
+    backfill_interest_counts 명령으로 다시 집계할 수 있다.
+    '''
+    interest    = models.ForeignKey(
+        Category,
+        related_name= 'interest_counts',
+        verbose_name= 'interest',
+        on_delete   = models.CASCADE
+    )
+
+    food        = models.ForeignKey(
+        Food,
+        related_name= 'interest_counts',
+        verbose_name= 'food',
+        on_delete   = models.CASCADE
+    )
+
+    count       = models.IntegerField(
+        verbose_name= 'count',
+        default     = 0
+    )
+
+    objects     = InterestFoodCountManager()
+
+    class Meta:
+        db_table = 'recommendation_interest_food_count'
+        constraints = [
+            models.UniqueConstraint(fields=['interest', 'food'], name='unique_interest_food'),
+        ]
+        indexes = [
+            models.Index(fields=['interest', '-count']),
+        ]
+
+    def __str__(self):
+        return f'{self.interest_id} | {self.food_id} | {self.count}'
+
+
+def _history_row(history):
+    return (timezone.localdate(history.created_at), history.food_id, history.food.category_id)
+
+@receiver(pre_save, sender=History)
+def stash_history_row(sender, instance, update_fields=None, **kwargs):
+    # 날짜나 음식이 바뀌는 수정이면 이전 값을 기억해 둠 (ex. db_init.py의 created_at 수정)
+    instance._daily_count_row = None
+    if instance.pk is None:
+        return
+    if update_fields is not None and not {'created_at', 'food'} & set(update_fields):
+        return
+    row = History.objects.filter(pk=instance.pk).values_list(
+        'created_at', 'food_id', 'food__category_id'
+    ).first()
+    if row:
+        instance._daily_count_row = (timezone.localdate(row[0]), row[1], row[2])
+
+def _interest_of(user_id):
+    return Profile.objects.filter(user_id=user_id).values_list('interest_in_id', flat=True).first()
+
+@receiver(post_save, sender=History)
+def count_history(sender, instance, created, **kwargs):
+    if created:
+        DailyFoodCount.objects.apply([_history_row(instance)])
+        InterestFoodCount.objects.apply([(_interest_of(instance.user_id), instance.food_id, 1)])
+        return
+
+    before  = getattr(instance, '_daily_count_row', None)
+    after   = _history_row(instance)
+    if before and before[:2] != after[:2]:
+        DailyFoodCount.objects.apply([before], sign=-1)
+        DailyFoodCount.objects.apply([after])
+    if before and before[1] != after[1]:
+        interest_id = _interest_of(instance.user_id)
+        InterestFoodCount.objects.apply([(interest_id, before[1], 1)], sign=-1)
+        InterestFoodCount.objects.apply([(interest_id, after[1], 1)])
+
+@receiver(histories_created, sender=History)
+def count_histories(sender, histories, **kwargs):
+    # History.objects.bulk_add로 추가된 기록. 배치 전체를 카운터마다 한 번씩 반영
+    user_ids    = {history.user_id for history in histories}
+    interests   = dict(Profile.objects.filter(user_id__in=user_ids).values_list('user_id', 'interest_in_id'))
+    DailyFoodCount.objects.apply([_history_row(history) for history in histories])
+    InterestFoodCount.objects.apply([
+        (interests.get(history.user_id), history.food_id, 1) for history in histories
+    ])
+    _recommendations_changed(*user_ids)
+
+@receiver(post_delete, sender=History)
+def uncount_history(sender, instance, **kwargs):
+    # 음식이 함께 삭제되는 경우도 있으므로 category는 조회하지 않음 (감소에는 필요 없음)
+    DailyFoodCount.objects.apply(
+        [(timezone.localdate(instance.created_at), instance.food_id, None)], sign=-1
+    )
+    # 삭제된 기록은 update_als_users가 시각으로 찾을 수 없으므로 사용자를 남겨 둠
+    ALSStaleUser.objects.bulk_create([ALSStaleUser(user_id=instance.user_id)], ignore_conflicts=True)
+    # Profile이 (User와 함께) 삭제되는 중이면 uncount_profile에서 이미 사용자의 기록 전체를 뺐음
+    if instance.user_id not in _uncounted_users():
+        InterestFoodCount.objects.apply([(_interest_of(instance.user_id), instance.food_id, 1)], sign=-1)
+
+# Profile 삭제 중인 user id. pre_delete는 모든 객체에 먼저 보내지고 삭제 순서는 모델마다 다르므로,
+# 같은 삭제에서 Profile보다 먼저 지워지는 History가 대분류 횟수를 한 번 더 빼지 않도록 기억해 둔다.
+_deleting   = threading.local()
+
+def _uncounted_users():
+    if not hasattr(_deleting, 'user_ids'):
+        _deleting.user_ids = set()
+    return _deleting.user_ids
+
+@receiver(pre_delete, sender=Profile)
+def uncount_profile(sender, instance, **kwargs):
+    # User 삭제의 cascade에서는 Profile이 History보다 먼저 지워질 수 있어 History의 post_delete로는 대분류를 알 수 없음.
+    # 남은 기록 전체를 지금 대분류에서 뺀다. (Profile만 삭제되는 경우도 같음)
+    InterestFoodCount.objects.apply_user(instance.user_id, instance.interest_in_id, sign=-1)
+    _uncounted_users().add(instance.user_id)
+
+@receiver(post_delete, sender=Profile)
+def forget_uncounted_profile(sender, instance, **kwargs):
+    _uncounted_users().discard(instance.user_id)
+
+@receiver(post_init, sender=Profile)
+def stash_interest(sender, instance, **kwargs):
+    # 선호 대분류 변경을 알 수 있도록 읽어 온 시점의 값을 기억해 둠
+    # (only() 등으로 지연된 필드라면 조회하지 않음)
+    instance._initial_interest_in_id = instance.__dict__.get('interest_in_id', models.DEFERRED)
+
+@receiver(post_save, sender=Profile)
+def move_interest_counts(sender, instance, **kwargs):
+    # account.views.Interest 등에서 선호 대분류를 바꾸면 사용자의 기록을 이전 대분류에서 새 대분류로 옮김
+    before  = instance._initial_interest_in_id
+    after   = instance.interest_in_id
+    if before is models.DEFERRED or before == after:
+        return
+    InterestFoodCount.objects.apply_user(instance.user_id, before, sign=-1)
+    InterestFoodCount.objects.apply_user(instance.user_id, after)
+    instance._initial_interest_in_id = after
+    _recommendations_changed(instance.user_id)
+
+@receiver(post_save, sender=History)
+@receiver(post_delete, sender=History)
+def invalidate_history_user(sender, instance, **kwargs):
+    _recommendations_changed(instance.user_id)
+
+@receiver(post_save, sender=ProfileLike)
+@receiver(post_delete, sender=ProfileLike)
+@receiver(post_save, sender=ProfileDislike)
+@receiver(post_delete, sender=ProfileDislike)
+def invalidate_preference_user(sender, instance, **kwargs):
+    _recommendations_changed(instance.profile_id)
+
+@receiver(m2m_changed, sender=ProfileLike)
+@receiver(m2m_changed, sender=ProfileDislike)
+def invalidate_preference_users(sender, instance, action, reverse, pk_set, **kwargs):
+    # profile.likes.add()/remove() 등은 bulk로 처리되어 post_save가 호출되지 않음
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        _recommendations_changed(instance.pk)
+    elif pk_set:
+        _recommendations_changed(*pk_set)
+
+def _recommendations_changed(*user_ids):
+    # 미리 계산한 결과에는 이전 기록/좋아요/싫어요/선호 대분류가 반영되어 있으므로 (ex. 방금 먹은 음식, 이전 대분류의 음식)
+    # 캐시된 응답과 함께 지워서 다음 refresh 전까지는 바로 계산하도록 함
+    UserRecommendation.objects.filter(user_id__in=user_ids).delete()
+    invalidate(*user_ids)
+
+@receiver(post_save, sender=Food)
+@receiver(post_delete, sender=Food)
+def invalidate_food_index(sender, **kwargs):
+    # 다른 워커는 FOOD_INDEX_TTL이 지나면 다시 만듦
+    food_index.invalidate()
@@ -0,0 +1,65 @@
+import os
+
+from django.db import connections, transaction
+
+from feature.models import Food
+from recommendation.batch import STRATEGIES
+from recommendation.cache import UNCACHED_PARAMS, invalidate
+from recommendation.conf import get_setting
+from recommendation.models import UserRecommendation
+
+
+def get_precomputed(user, strategy):
+    '''미리 계산해 둔 음식 id 목록. 사용하지 않도록 설정되었거나 결과가 없으면 None.'''
+    if not get_setting('SERVE_PRECOMPUTED'):
+        return None
+    return UserRecommendation.objects.filter(
+        user=user, strategy=strategy
+    ).values_list('food_ids', flat=True).first()
+
+
+class PrecomputedMixin(object):
+    strategy = None
+
+    def get_precomputed(self, request):
+        # 미리 계산한 결과에는 kcal 등의 필터가 반영되어 있지 않음
+        if any(name in request.query_params for name in UNCACHED_PARAMS):
+            return None
+        food_ids    = get_precomputed(request.user, self.strategy)
+        if food_ids is None:
+            return None
+        return Food.objects.in_order(food_ids)
+
+
+def init_worker():
+    '''
+    프로세스 풀의 워커 초기화.
+    spawn 방식이면 Django를 새로 설정하고, fork 방식이면 부모의 DB 연결을 공유하지 않도록 닫는다.
+    '''
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    django.setup()
+    connections.close_all()
+
+
+def compute_chunk(strategy, user_ids, n=None):
+    '''n이 없으면 전략별 API와 같은 개수'''
+    if n is None:
+        return strategy, STRATEGIES[strategy](user_ids)
+    return strategy, STRATEGIES[strategy](user_ids, n)
+
+
+def save_chunk(strategy, results):
+    '''{user id: [food id, ...]}를 (user, strategy) 행으로 교체 저장'''
+    with transaction.atomic():
+        UserRecommendation.objects.filter(
+            strategy    = strategy,
+            user_id__in = list(results),
+        ).delete()
+        UserRecommendation.objects.bulk_create([
+            UserRecommendation(user_id=user_id, strategy=strategy, food_ids=food_ids)
+            for user_id, food_ids in results.items()
+        ])
+    # 서빙 중인 캐시된 응답이 새 결과를 가리지 않도록
+    invalidate(*results)
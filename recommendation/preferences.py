@@ -0,0 +1,99 @@
+import numpy as np
+
+from account.models import ProfileDislike, ProfileLike
+from recommendation.cf import top_k
+from recommendation.conf import get_setting
+
+
+class Preferences:
+    '''
+    사용자가 좋아요/싫어요 한 음식 id (정렬된 int64 배열).
+
+    추천마다 결과 목록을 걸러내는 대신 top-k 전의 점수 배열에 바로 적용한다.
+    싫어요 한 음식은 -inf가 되어 후보에서 빠지고, 좋아요 한 음식은 점수에 LIKE_BOOST를 곱한다.
+    '''
+    def __init__(self, liked=(), disliked=()):
+        self.liked      = np.unique(np.asarray(liked, dtype=np.int64))
+        self.disliked   = np.unique(np.asarray(disliked, dtype=np.int64))
+
+    def __bool__(self):
+        return bool(len(self.liked) or len(self.disliked))
+
+    @classmethod
+    def load(cls, user_id):
+        return cls.load_users([user_id])[int(user_id)]
+
+    @classmethod
+    def load_users(cls, user_ids):
+        '''{user id: Preferences}. 사용자 수와 상관없이 좋아요/싫어요를 각각 한 번씩 조회한다.'''
+        user_ids    = [int(user_id) for user_id in user_ids]
+        foods       = {}
+        for i, model in enumerate((ProfileLike, ProfileDislike)):
+            # Profile의 primary key가 user이므로 profile_id == user id
+            for user_id, food_id in model.objects.filter(
+                profile_id__in=user_ids
+            ).values_list('profile_id', 'food_id').order_by():
+                foods.setdefault(user_id, ([], []))[i].append(food_id)
+        return {user_id: cls(*foods.get(user_id, ((), ()))) for user_id in user_ids}
+
+    def masks(self, item_ids):
+        '''item_ids와 같은 순서의 (좋아요, 싫어요) bool 배열'''
+        return np.isin(item_ids, self.liked), np.isin(item_ids, self.disliked)
+
+    def apply(self, scores, item_ids, boost=None):
+        '''
+        scores  : item_ids 순서의 점수. 직접 바꾼다.
+        점수가 양수인 좋아요 음식에만 boost를 곱하므로, 관련 없는 음식이 좋아요만으로 추천되지는 않는다.
+        '''
+        if not self:
+            return scores
+        boost       = get_setting('LIKE_BOOST') if boost is None else boost
+        liked, disliked = self.masks(item_ids)
+        liked       &= scores > 0
+        scores[liked]   *= boost
+        scores[disliked] = -np.inf
+        return scores
+
+
+def apply_rows(scores, item_ids, preferences, boost=None):
+    '''
+    (사용자 x item) 점수 배열에 행마다 다른 Preferences를 한 번의 인덱싱으로 적용한다.
+    item_ids    : 정렬된 item id (열 순서)
+    preferences : 행 순서의 Preferences
+    '''
+    boost       = get_setting('LIKE_BOOST') if boost is None else boost
+
+    def _cells(name):
+        foods       = [getattr(p, name) for p in preferences]
+        rows        = np.repeat(np.arange(len(foods)), [len(f) for f in foods])
+        foods       = np.concatenate(foods) if foods else np.zeros(0, dtype=np.int64)
+        if not len(item_ids):
+            return rows[:0], rows[:0]
+        cols        = np.searchsorted(item_ids, foods)
+        cols[cols == len(item_ids)] = 0
+        known       = item_ids[cols] == foods
+        return rows[known], cols[known]
+
+    rows, cols  = _cells('liked')
+    positive    = scores[rows, cols] > 0
+    scores[rows[positive], cols[positive]] *= boost
+    scores[_cells('disliked')] = -np.inf
+    return scores
+
+
+def rank(item_ids, scores, n, preferences=None):
+    '''
+    (item id, 점수) 후보에 preferences를 적용하고 상위 n개 item id.
+    DB에서 집계한 인기 순위처럼 점수가 모델 밖에 있는 추천에 사용한다.
+    싫어요로 빠질 수 있으므로 후보는 n_candidates(n, preferences)개를 가져온다.
+    '''
+    item_ids    = np.asarray(item_ids, dtype=np.int64)
+    scores      = np.asarray(scores, dtype=np.float64)
+    if preferences:
+        preferences.apply(scores, item_ids)
+    return item_ids[top_k(scores, n, min_score=-np.inf)].tolist()
+
+
+def n_candidates(n, preferences=None):
+    '''싫어요로 빠지더라도 n개가 남도록 가져올 후보 수'''
+    return n + (len(preferences.disliked) if preferences else 0)
@@ -0,0 +1,153 @@
+import os
+import datetime
+import random
+import threading
+import time
+
+import numpy as np
+
+from feature.models import Food
+from recommendation.artifacts import registry
+
+
+FOOD_INDEX_TTL      = 60
+
+
+class FoodIndex:
+    '''
+    랜덤 추천용 음식 id 인덱스. DB에서 (id, 대분류, kcal)만 한 번 읽어 numpy 배열로 들고 있는다.
+
+    ids             : kcal 오름차순으로 정렬된 음식 id
+    kcal            : ids와 같은 순서의 kcal
+    category_ids    : 대분류 -> 정렬 시작 위치. by_category_* 배열에서 [start, stop) 구간을 사용
+    by_category_ids : (대분류, kcal) 순으로 정렬된 음식 id
+    by_category_kcal: by_category_ids와 같은 순서의 kcal
+
+    필터가 있으면 searchsorted로 구간 [lo, hi)를 찾고, 그 안에서 k개의 위치만 뽑으므로
+    음식 수와 상관없이 O(k + log n) 이다.
+    '''
+    def __init__(self, ids, category, kcal, version=None):
+        ids         = np.asarray(ids, dtype=np.int64)
+        category    = np.asarray(category, dtype=np.int64)
+        kcal        = np.asarray(kcal, dtype=np.float64)
+
+        order               = np.argsort(kcal, kind='stable')
+        self.ids            = ids[order]
+        self.kcal           = kcal[order]
+
+        order               = np.lexsort((kcal, category))
+        self.by_category_ids    = ids[order]
+        self.by_category_kcal   = kcal[order]
+        category            = category[order]
+        self.category_ids, starts = np.unique(category, return_index=True)
+        self.category_bounds    = np.append(starts, len(category))
+
+        self.version        = version or datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%d%H%M%S')
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def build(cls):
+        # 기본 매니저의 annotate/prefetch 없이 필요한 컬럼만 읽음
+        rows        = list(Food._base_manager.order_by().values_list('id', 'category_id', 'kcal'))
+        if not rows:
+            return cls([], [], [])
+        ids, category, kcal = zip(*rows)
+        return cls(ids, category, [float(value) for value in kcal])
+
+    def candidates(self, category=None, min_kcal=None, max_kcal=None):
+        '''필터에 맞는 음식의 (id 배열, 구간 시작, 구간 끝)'''
+        if category is None:
+            ids, kcal, lo, hi = self.ids, self.kcal, 0, len(self.ids)
+        else:
+            pos         = np.searchsorted(self.category_ids, category)
+            if pos == len(self.category_ids) or self.category_ids[pos] != category:
+                return self.ids, 0, 0
+            ids, kcal   = self.by_category_ids, self.by_category_kcal
+            lo, hi      = self.category_bounds[pos], self.category_bounds[pos + 1]
+
+        if min_kcal is not None:
+            lo          = lo + np.searchsorted(kcal[lo:hi], min_kcal, side='left')
+        if max_kcal is not None:
+            hi          = lo + np.searchsorted(kcal[lo:hi], max_kcal, side='right')
+        return ids, int(lo), int(max(lo, hi))
+
+    def kcal_ids(self, min_kcal=None, max_kcal=None):
+        '''kcal 구간 안의 음식 id. kcal 오름차순 배열에서 searchsorted로 찾은 구간을 복사 없이 반환'''
+        ids, lo, hi = self.candidates(None, min_kcal, max_kcal)
+        return ids[lo:hi]
+
+    def mask(self, item_ids, min_kcal=None, max_kcal=None):
+        '''
+        item_ids와 같은 순서의 bool 배열 (kcal 구간 안의 음식이면 True). 필터가 없으면 None.
+        모델의 점수 배열과 순서가 같으므로 top-k 전에 점수에 바로 적용한다.
+        '''
+        if min_kcal is None and max_kcal is None:
+            return None
+        return np.isin(item_ids, self.kcal_ids(min_kcal, max_kcal))
+
+    def sample(self, k, category=None, min_kcal=None, max_kcal=None, exclude=None):
+        '''
+        exclude: 뽑지 않을 음식 id 배열 (ex. 싫어요). 빠질 수 있는 만큼만 더 뽑아서 가리므로 O(k + len(exclude))
+        '''
+        ids, lo, hi = self.candidates(category, min_kcal, max_kcal)
+        extra       = len(exclude) if exclude is not None else 0
+        picked      = ids[random.sample(range(lo, hi), k=min(k + extra, hi - lo))]
+        if extra:
+            picked      = picked[~np.isin(picked, exclude)]
+        return picked[:k].tolist()
+
+
+class FoodIndexHolder:
+    '''
+    FoodIndex를 프로세스당 하나만 만들어 두고 ttl초마다 다시 만든다.
+    이 프로세스에서 음식이 추가/수정/삭제되면(recommendation.models의 receiver) 바로 무효화한다.
+    '''
+    def __init__(self, name, ttl=FOOD_INDEX_TTL):
+        self.name       = name
+        self.ttl        = ttl
+
+        self._lock      = threading.Lock()
+        self._index     = None
+        self._built_at  = 0
+        self._loaded_at = None
+        self._build_seconds = None
+
+        registry[name]  = self
+
+    def get(self):
+        index       = self._index
+        if index is not None and time.monotonic() - self._built_at < self.ttl:
+            return index
+
+        with self._lock:
+            # 다른 스레드가 먼저 만들었을 수 있음
+            index       = self._index
+            if index is None or time.monotonic() - self._built_at >= self.ttl:
+                _t                  = time.perf_counter()
+                index               = FoodIndex.build()
+                self._build_seconds = time.perf_counter() - _t
+                self._built_at      = time.monotonic()
+                self._loaded_at     = datetime.datetime.now(datetime.timezone.utc)
+                self._index         = index
+            return index
+
+    def invalidate(self):
+        self._index     = None
+
+    def status(self):
+        index       = self._index
+        return {
+            'name'          : self.name,
+            'path'          : None,
+            'exists'        : True,
+            'loaded'        : index is not None,
+            'version'       : index.version if index else None,
+            'loaded_at'     : self._loaded_at.isoformat() if index else None,
+            'load_seconds'  : round(self._build_seconds, 4) if index else None,
+            'pid'           : os.getpid(),
+        }
+
+
+food_index = FoodIndexHolder('food-index')
@@ -0,0 +1,41 @@
+from rest_framework import serializers
+
+from recommendation.batch import STRATEGIES
+
+
+class KcalFilterSerializer(serializers.Serializer):
+    min_kcal    = serializers.FloatField(
+        min_value   = 0,
+        required    = False,
+    )
+    max_kcal    = serializers.FloatField(
+        min_value   = 0,
+        required    = False,
+    )
+
+    def validate(self, attrs):
+        if attrs.get('min_kcal', 0) > attrs.get('max_kcal', float('inf')):
+            raise serializers.ValidationError({'max_kcal': 'max_kcal must be greater than or equal to min_kcal.'})
+        return attrs
+
+class BatchRecommendSerializer(KcalFilterSerializer):
+    user_ids    = serializers.ListField(
+        child       = serializers.IntegerField(min_value=1),
+        allow_empty = False,
+        max_length  = 10000,
+    )
+    strategy    = serializers.ChoiceField(
+        choices     = sorted(STRATEGIES),
+        default     = 'als',
+    )
+    n           = serializers.IntegerField(
+        min_value   = 1,
+        max_value   = 50,
+        default     = 5,
+    )
+
+class RandomRecommendSerializer(KcalFilterSerializer):
+    category    = serializers.IntegerField(
+        min_value   = 1,
+        required    = False,
+    )
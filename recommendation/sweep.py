@@ -0,0 +1,123 @@
+import itertools
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import scipy.sparse as sparse
+
+
+# 프로세스 풀의 워커마다 한 번만 받아 두는 학습/평가 행렬
+_matrices = {}
+
+# confidence = 1 + ALPHA * log(1 + 먹은 횟수)
+ALPHA       = 10.0
+
+
+def train_test_split(matrix, test_ratio=0.2, seed=0):
+    '''
+    (사용자 x item) CSR 행렬의 nonzero 항목 중 test_ratio 비율을 평가용으로 떼어 낸다.
+    (train, test) 두 CSR 행렬을 반환. 모양은 원래 행렬과 같다.
+    '''
+    coo         = sparse.coo_matrix(matrix)
+    held_out    = np.random.default_rng(seed).random(coo.nnz) < test_ratio
+
+    def _part(mask):
+        return sparse.csr_matrix(
+            (coo.data[mask], (coo.row[mask], coo.col[mask])), shape=matrix.shape
+        )
+    return _part(~held_out), _part(held_out)
+
+
+def ranking_metrics(scores, test, k, train=None):
+    '''
+    scores  : (사용자 x item) dense 점수
+    test    : (사용자 x item) CSR, 0보다 크면 정답
+    train   : (사용자 x item) CSR. 학습에 쓴 item은 순위에서 제외 (학습 데이터를 그대로 맞히는 것을 막음)
+    평가용 기록이 있는 사용자들에 대한 precision@k, ndcg@k의 평균. 사용자 루프 없이 행렬 연산으로 계산.
+    '''
+    users       = np.flatnonzero(np.diff(test.indptr))
+    if not len(users):
+        return {'precision': 0.0, 'ndcg': 0.0, 'users': 0}
+    k           = min(k, scores.shape[1])
+    scores      = np.array(scores[users], dtype=np.float64)
+    relevant    = test[users].toarray() > 0
+    if train is not None:
+        scores[train[users].toarray() > 0] = -np.inf
+
+    part        = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    rank        = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1, kind='stable')
+    top         = np.take_along_axis(part, rank, axis=1)
+    hits        = np.take_along_axis(relevant, top, axis=1)
+
+    discount    = 1 / np.log2(np.arange(2, k + 2))
+    dcg         = (hits * discount).sum(axis=1)
+    n_relevant  = np.minimum(relevant.sum(axis=1), k)
+    idcg        = np.cumsum(discount)[n_relevant - 1]
+    return {
+        'precision' : float(hits.sum(axis=1).mean() / k),
+        'ndcg'      : float((dcg / idcg).mean()),
+        'users'     : int(len(users)),
+    }
+
+
+def confidence(counts, alpha=ALPHA):
+    '''
+    먹은 횟수 -> implicit ALS의 confidence (Hu et al.)
+    매일 같은 음식을 먹는 사용자 몇 명이 item factor를 끌고 가지 않도록 횟수는 log로 줄인다.
+    '''
+    return 1 + alpha * np.log1p(np.asarray(counts, dtype=np.float32))
+
+
+def init_worker(train, test):
+    _matrices['train']  = train
+    _matrices['test']   = test
+
+
+def fit(matrix, factors, regularization, iterations, alpha=ALPHA, seed=0, num_threads=0):
+    '''matrix: (사용자 x item) 먹은 횟수 CSR. confidence로 바꿔서 학습한다.'''
+    from implicit.als import AlternatingLeastSquares as ALS
+
+    weighted    = sparse.csr_matrix(matrix, dtype=np.float32, copy=True)
+    weighted.data = confidence(weighted.data, alpha)
+
+    model       = ALS(
+        factors         = factors,
+        regularization  = regularization,
+        iterations      = iterations,
+        random_state    = seed,
+        num_threads     = num_threads,
+    )
+    model.fit(weighted, show_progress=False)
+    return model
+
+
+def evaluate(config, k=3, seed=0):
+    '''워커에서 설정 하나를 학습하고 평가한다. 행렬은 init_worker로 받은 것을 사용'''
+    _t          = time.perf_counter()
+    # 워커끼리 CPU를 나눠 쓰므로 implicit 내부 스레드는 1개만
+    model       = fit(_matrices['train'], seed=seed, num_threads=1, **config)
+    train_seconds = time.perf_counter() - _t
+
+    scores      = np.asarray(model.user_factors).dot(np.asarray(model.item_factors).T)
+    return {
+        **config,
+        **ranking_metrics(scores, _matrices['test'], k, train=_matrices['train']),
+        'train_seconds' : round(train_seconds, 3),
+    }
+
+
+def sweep(matrix, grid, k=3, test_ratio=0.2, workers=None, seed=0):
+    '''
+    grid: {'factors': [...], 'regularization': [...], 'iterations': [...], 'alpha': [...]}
+    모든 조합을 프로세스 풀에서 병렬로 학습/평가하고, ndcg@k 내림차순의 leaderboard를 반환.
+    train/test 행렬은 한 번만 나누고, 워커마다 한 번씩만 전달한다.
+    '''
+    train, test = train_test_split(matrix, test_ratio, seed)
+    names       = sorted(grid)
+    configs     = [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(train, test)) as executor:
+        results = list(executor.map(evaluate, configs, itertools.repeat(k), itertools.repeat(seed)))
+
+    results.sort(key=lambda result: (-result['ndcg'], -result['precision'], result['train_seconds']))
+    return results
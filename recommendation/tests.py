@@ -1,3 +1,647 @@
-from django.test import TestCase
+import datetime
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import scipy.sparse as sparse
+from asgiref.sync import async_to_sync
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from account.models import Profile, ProfileDislike, ProfileLike
+from feature.models import Category, Food, History
+from feature.tests import QueryPlanMixin
+from recommendation.als import als_model
+from recommendation.ann import IVFIndex
+from recommendation.batch import (
+    STRATEGIES,
+    interest_popular,
+    interest_user,
+    popular,
+    recommend_batch,
+    recommend_memory_cf,
+    yesterday_popular,
+)
+from recommendation.blend import FALLBACK_KEY, _run_before, blend, merge
+from recommendation.cache import cache_key, stats
+from recommendation.cf import (
+    CF_WINDOW_DAYS,
+    ItemNeighbors,
+    UserItemMatrix,
+    index_of,
+    item_neighbors,
+    mask_consumed,
+    neighbors,
+    top_k,
+    top_k_rows,
+)
+from recommendation.factors import FactorModel
+from recommendation.models import UserRecommendation
+from recommendation.precompute import save_chunk
+from recommendation.preferences import Preferences, apply_rows, n_candidates, rank
+from recommendation.sampling import FoodIndex, food_index
+
+
+class PopularRecommendQueryTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        user        = User.objects.create(username='tester')
+        category    = Category.objects.create(name='한식')
+        for i in range(20):
+            food    = Food.objects.create(category=category, name=f'food{i}', detail='')
+            for _ in range(i % 3 + 1):
+                History.objects.create(user=user, food=food)
+
+    def test_yesterday_popular_query_count(self):
+        client      = APIClient()
+
+        # 집계 1 + 음식 조회 1 + 요청 로그 저장 1 (음식 수와 무관)
+        with self.assertNumQueries(3):
+            response = client.get('/api/recommendation/yesterday-popular')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 10)
+
+
+class RecommendationQueryPlanTest(QueryPlanMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seed()
+
+    def test_yesterday_popular(self):
+        self.assertGetNoFullScan('/api/recommendation/yesterday-popular')
+
+    def test_interest_popular(self):
+        self.assertGetNoFullScan('/api/recommendation/interest-popular')
+
+    def test_interest_user(self):
+        self.assertGetNoFullScan('/api/recommendation/interest-user')
+
+    def test_memory_cf_histories(self):
+        # MemoryBasedRecommend, recommend_memory_cf가 읽는 최근 기록 (유사도 모델 없이 쿼리만 확인)
+        since       = timezone.localdate() - datetime.timedelta(days=CF_WINDOW_DAYS)
+        self.assertNoFullScan(lambda: list(
+            self.users[0].histories.filter(created_at__gte=since).values_list('food', flat=True)
+        ))
+        self.assertNoFullScan(lambda: list(History.objects.filter(
+            user_id__in=[user.id for user in self.users], created_at__gte=since,
+        ).values_list('user_id', 'food_id')))
+
+
+class ResponseCacheTest(TestCase):
+    path            = '/api/recommendation/interest-popular'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categories  = [Category.objects.create(name=name) for name in ('한식', '중식')]
+        cls.foods       = [
+            Food.objects.create(category=cls.categories[i % 2], name=f'food{i}', detail='', image='food.jpg')
+            for i in range(6)
+        ]
+        for i in range(2):
+            User.objects.create(username=f'tester{i}')
+        # Profile은 User와 함께 만들어지므로 선호 대분류를 바꾼 뒤 다시 읽음
+        Profile.objects.update(interest_in=cls.categories[0])
+        cls.users       = list(User.objects.select_related('profile').order_by('username'))
+        for food in cls.foods:
+            History.objects.create(user=cls.users[1], food=food)
+
+    def setUp(self):
+        cache.clear()
+        self.client     = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+    def get(self, path=None):
+        response    = self.client.get(path or self.path)
+        self.assertEqual(response.status_code, 200)
+        return [row['food_id'] for row in response.json()]
+
+    def counts(self, strategy='interest-popular'):
+        return next((row['hits'], row['misses']) for row in stats() if row['strategy'] == strategy)
+
+    def cached(self, user):
+        return cache.get(cache_key('interest-popular', user.id)) is not None
+
+    def test_hit_miss(self):
+        first       = self.get()
+        self.assertEqual(self.get(), first)
+        self.assertEqual(self.get(), first)
+        self.assertEqual(self.counts(), (2, 1))
+
+        # kcal 필터가 있으면 캐시를 읽지도 세지도 않음
+        self.get(f'{self.path}?min_kcal=0')
+        self.assertEqual(self.counts(), (2, 1))
+
+    def test_history_invalidates(self):
+        self.get()
+        self.client.force_authenticate(self.users[1])
+        self.get()
+
+        History.objects.create(user=self.users[0], food=self.foods[0])
+        self.assertFalse(self.cached(self.users[0]))
+        self.assertTrue(self.cached(self.users[1]))
+
+        self.client.force_authenticate(self.users[0])
+        self.get()
+        self.assertEqual(self.counts(), (0, 3))
+
+    def test_preferences_invalidate(self):
+        profile     = self.users[0].profile
+        self.get()
+        profile.likes.add(self.foods[0])
+        self.assertFalse(self.cached(self.users[0]))
+
+        self.get()
+        ProfileDislike.objects.create(profile=profile, food=self.foods[2])
+        self.assertFalse(self.cached(self.users[0]))
+        self.assertNotIn(self.foods[2].id, self.get())
+
+    def test_interest_invalidates(self):
+        self.assertEqual(set(self.get()), {food.id for food in self.foods[0::2]})
+
+        profile     = self.users[0].profile
+        profile.interest_in = self.categories[1]
+        profile.save()
+        self.assertEqual(set(self.get()), {food.id for food in self.foods[1::2]})
+
+    def test_refresh_invalidates(self):
+        self.get()
+        save_chunk('interest-popular', {self.users[0].id: [self.foods[0].id]})
+        self.assertFalse(self.cached(self.users[0]))
+
+    @override_settings(RECOMMENDATION={'SERVE_PRECOMPUTED': True})
+    def test_history_drops_precomputed(self):
+        # 방금 먹은 음식이 미리 계산한 결과로 계속 추천되지 않도록
+        save_chunk('interest-popular', {self.users[0].id: [self.foods[4].id]})
+        save_chunk('interest-popular', {self.users[1].id: [self.foods[4].id]})
+        self.assertEqual(self.get(), [self.foods[4].id])
+
+        History.objects.create(user=self.users[0], food=self.foods[4])
+        self.assertFalse(UserRecommendation.objects.filter(user=self.users[0]).exists())
+        self.assertTrue(UserRecommendation.objects.filter(user=self.users[1]).exists())
+        # 미리 계산한 행 대신 바로 계산 (방금 먹은 음식이 가장 많이 먹은 음식이 됨)
+        food_ids    = self.get()
+        self.assertEqual(food_ids[0], self.foods[4].id)
+        self.assertEqual(set(food_ids), {food.id for food in self.foods[0::2]})
+
+    @override_settings(RECOMMENDATION={'SERVE_PRECOMPUTED': True})
+    def test_interest_drops_precomputed(self):
+        save_chunk('interest-popular', {self.users[0].id: [self.foods[0].id]})
+        profile     = self.users[0].profile
+        profile.interest_in = self.categories[1]
+        profile.save()
+        self.assertFalse(UserRecommendation.objects.filter(user=self.users[0]).exists())
+        self.assertEqual(set(self.get()), {food.id for food in self.foods[1::2]})
+
+
+def brute_top_k(scores, k, min_score=0):
+    '''점수 내림차순 전체 정렬 후 min_score보다 큰 앞의 k개'''
+    order       = sorted(range(len(scores)), key=lambda i: -scores[i])
+    return [i for i in order if scores[i] > min_score][:k]
+
+
+class CFEngineTest(SimpleTestCase):
+
+    def setUp(self):
+        self.rng        = np.random.default_rng(0)
+
+    def scores(self, *shape):
+        # 값이 모두 달라야 top-k의 순서가 하나로 정해짐 (음수와 0도 포함)
+        return self.rng.permutation(np.arange(np.prod(shape)) - 5).reshape(shape).astype(np.float64)
+
+    def test_index_of(self):
+        ids         = np.array([3, 5, 9, 12], dtype=np.int64)
+        self.assertEqual(index_of(ids, [9, 3, 4, 13, 12, 9]).tolist(), [2, 0, 3, 2])
+        self.assertEqual(index_of(ids, []).tolist(), [])
+        self.assertEqual(index_of(np.zeros(0, dtype=np.int64), [1, 2]).tolist(), [])
+
+    def test_top_k(self):
+        scores      = self.scores(20)
+        for k in (1, 5, 14, 20, 30):
+            for min_score in (0, 10, -np.inf):
+                self.assertEqual(top_k(scores, k, min_score).tolist(), brute_top_k(scores, k, min_score))
+
+    def test_top_k_edges(self):
+        self.assertEqual(top_k(np.array([0., -1., -np.inf]), 3).tolist(), [])
+        self.assertEqual(top_k(np.zeros(0), 3).tolist(), [])
+        self.assertEqual(top_k(np.array([1., 2.]), 0).tolist(), [])
+
+    def test_top_k_rows(self):
+        scores      = self.scores(6, 8)
+        scores[2]   = -1
+        for k in (1, 3, 8, 12):
+            self.assertEqual(
+                [row.tolist() for row in top_k_rows(scores, k)],
+                [brute_top_k(row, k) for row in scores],
+            )
+        self.assertEqual([row.tolist() for row in top_k_rows(scores, 0)], [[]] * 6)
+        self.assertEqual(top_k_rows(np.zeros((0, 4)), 3), [])
+        self.assertEqual([row.tolist() for row in top_k_rows(np.zeros((2, 0)), 3)], [[], []])
+
+    def test_mask_consumed(self):
+        score       = self.scores(4, 5)
+        consumed    = sparse.csr_matrix((self.rng.random((4, 5)) < 0.4) * self.rng.integers(1, 4, (4, 5)))
+        expected    = np.where(consumed.toarray() > 0, 0, score)
+        self.assertTrue(np.array_equal(mask_consumed(score, consumed).toarray(), expected))
+
+    def test_item_neighbors(self):
+        dense       = self.rng.integers(0, 3, (30, 9)).astype(np.float64)
+        # 아무도 먹지 않은 음식 (norm 0)
+        dense[:, 4] = 0
+        matrix      = sparse.csr_matrix(dense, dtype=np.float32)
+        norms       = np.linalg.norm(dense, axis=0)
+        normalized  = np.divide(dense, norms, out=np.zeros_like(dense), where=norms > 0)
+        sim         = normalized.T @ normalized
+        np.fill_diagonal(sim, 0)
+
+        for k, block_size in ((3, 1024), (3, 2), (8, 4), (20, 4)):
+            idx, val    = item_neighbors(matrix, k, block_size=block_size)
+            self.assertEqual(idx.shape, (9, min(k, 8)))
+            for item in range(9):
+                # 유사도가 같은 이웃은 순서가 정해지지 않으므로 값으로 비교
+                expected    = np.sort(sim[item])[::-1][:idx.shape[1]]
+                self.assertTrue(np.allclose(val[item], expected, atol=1e-6))
+                self.assertTrue(np.allclose(sim[item, idx[item]], val[item], atol=1e-6))
+                self.assertNotIn(item, idx[item][val[item] > 0])
+            self.assertFalse(val[4].any())
+
+    def test_item_neighbors_edges(self):
+        # 음식이 하나면 이웃은 자기 자신(유사도 0) 하나
+        idx, val    = item_neighbors(sparse.csr_matrix(np.ones((3, 1), dtype=np.float32)), 5)
+        self.assertEqual((idx.tolist(), val.tolist()), ([[0]], [[0]]))
+        idx, val    = item_neighbors(sparse.csr_matrix((0, 0), dtype=np.float32), 5)
+        self.assertEqual((idx.shape, val.shape), ((0, 1), (0, 1)))
+
+
+class IVFIndexTest(SimpleTestCase):
+
+    def setUp(self):
+        rng             = np.random.default_rng(0)
+        self.factors    = rng.normal(size=(200, 8)).astype(np.float32)
+        self.queries    = rng.normal(size=(10, 8)).astype(np.float32)
+        self.index      = IVFIndex.build(self.factors, n_lists=12)
+
+    def exact(self, query, n, allowed=None):
+        scores      = self.factors.dot(query)
+        if allowed is not None:
+            scores[~allowed] = -np.inf
+        return brute_top_k(scores, n, min_score=-np.inf)
+
+    def test_build(self):
+        # 모든 item이 한 군집에 한 번씩
+        self.assertEqual(sorted(self.index.items.tolist()), list(range(200)))
+        self.assertEqual((self.index.offsets[0], self.index.offsets[-1]), (0, 200))
+        self.assertEqual(self.index.n_lists, 12)
+
+    def test_all_probes_match_exact(self):
+        for query in self.queries:
+            for n in (1, 10, 50):
+                self.assertEqual(
+                    self.index.search(self.factors, query, n, n_probe=self.index.n_lists).tolist(),
+                    self.exact(query, n),
+                )
+
+    def test_few_probes_are_approximate(self):
+        for query in self.queries:
+            candidates  = self.index.candidates(query, n_probe=2)
+            self.assertLess(len(candidates), 200)
+            result      = self.index.search(self.factors, query, 5, n_probe=2)
+            self.assertTrue(set(result.tolist()) <= set(candidates.tolist()))
+
+    def test_allowed_with_few_candidates(self):
+        # 허용된 item이 적으면 min_items를 채울 때까지 군집을 더 보고, 허용된 item만 반환
+        allowed     = np.zeros(200, dtype=bool)
+        allowed[[3, 50, 120, 177, 199]] = True
+        for query in self.queries:
+            candidates  = self.index.candidates(query, n_probe=1, min_items=3, allowed=allowed)
+            self.assertGreaterEqual(len(candidates), 3)
+            self.assertTrue(allowed[candidates].all())
+
+            result      = self.index.search(self.factors, query, 3, n_probe=1, allowed=allowed)
+            self.assertEqual(len(result), 3)
+            self.assertTrue(allowed[result].all())
+
+            # 허용된 item이 n보다 적으면 모두, 모든 군집을 보면 정확한 결과
+            self.assertEqual(
+                sorted(self.index.search(self.factors, query, 10, n_probe=1, allowed=allowed).tolist()),
+                [3, 50, 120, 177, 199],
+            )
+            self.assertEqual(
+                self.index.search(self.factors, query, 3, n_probe=self.index.n_lists, allowed=allowed).tolist(),
+                self.exact(query, 3, allowed),
+            )
+
+        self.assertEqual(self.index.candidates(self.queries[0], allowed=np.zeros(200, dtype=bool)).tolist(), [])
+
+    def test_adjust(self):
+        excluded    = set(self.exact(self.queries[0], 3))
+
+        def adjust(scores, candidates):
+            scores[np.isin(candidates, list(excluded))] = -np.inf
+
+        result      = self.index.search(self.factors, self.queries[0], 5, n_probe=self.index.n_lists, adjust=adjust)
+        self.assertEqual(result.tolist(), self.exact(self.queries[0], 8)[3:])
+
+    def test_save_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertIsNone(IVFIndex.load(directory))
+            self.index.save(directory)
+            loaded  = IVFIndex.load(directory)
+        self.assertTrue(np.array_equal(loaded.items, self.index.items))
+        self.assertEqual(
+            loaded.search(self.factors, self.queries[0], 5).tolist(),
+            self.index.search(self.factors, self.queries[0], 5).tolist(),
+        )
+
+
+class PreferencesTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categories  = [Category.objects.create(name=name) for name in ('한식', '중식')]
+        cls.foods       = [
+            Food.objects.create(category=cls.categories[i % 2], name=f'food{i}', detail='', kcal=100 * (i + 1))
+            for i in range(8)
+        ]
+        for i in range(4):
+            User.objects.create(username=f'tester{i}')
+        Profile.objects.update(interest_in=cls.categories[1])
+        cls.users       = list(User.objects.select_related('profile').order_by('username'))
+
+        # food0 > food1 > ... 순으로 인기. food1, food3은 food0과 같이 먹은 사용자가 많아 CF 점수도 높음
+        for i, user in enumerate(cls.users[1:]):
+            for food in cls.foods[:8 - 2 * i]:
+                History.objects.create(user=user, food=food)
+        History.objects.create(user=cls.users[0], food=cls.foods[0])
+
+        cls.disliked    = [cls.foods[1].id, cls.foods[3].id]
+        for food_id in cls.disliked:
+            ProfileDislike.objects.create(profile_id=cls.users[0].id, food_id=food_id)
+        ProfileLike.objects.create(profile_id=cls.users[0].id, food=cls.foods[5])
+
+    def setUp(self):
+        food_index.invalidate()
+        self.preferences = Preferences.load(self.users[0].id)
+
+        rng             = np.random.default_rng(0)
+        item_ids        = np.array(sorted(food.id for food in self.foods), dtype=np.int64)
+        item_factors    = rng.normal(size=(8, 4)).astype(np.float32)
+        user_factors    = rng.normal(size=(4, 4)).astype(np.float32)
+        # 싫어요 한 음식의 점수가 가장 높도록
+        user_factors[0] = item_factors[np.isin(item_ids, self.disliked)].sum(axis=0) * 3
+        self.als        = FactorModel(
+            user_ids        = np.array([user.id for user in self.users], dtype=np.int64),
+            item_ids        = item_ids,
+            user_factors    = user_factors,
+            item_factors    = item_factors,
+            index           = IVFIndex.build(item_factors, n_lists=2),
+        )
+        pairs           = np.array(History.objects.values_list('user_id', 'food_id'))
+        self.cf         = ItemNeighbors.build(UserItemMatrix.from_pairs(pairs[:, 0], pairs[:, 1]), k=7)
+
+        for holder, model in ((neighbors, self.cf), (als_model, self.als)):
+            patcher     = mock.patch.object(holder, 'get', return_value=model)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_loaded(self):
+        self.assertEqual(self.preferences.disliked.tolist(), sorted(self.disliked))
+        self.assertEqual(self.preferences.liked.tolist(), [self.foods[5].id])
+        self.assertFalse(Preferences.load(self.users[1].id))
+        self.assertEqual(n_candidates(5, self.preferences), 7)
+        self.assertEqual(n_candidates(5), 5)
+
+    def test_disliked_never_recommended(self):
+        user, preferences = self.users[0], self.preferences
+        category    = user.profile.interest_in_id
+        # 싫어요가 없다면 추천되었을 음식
+        self.assertTrue(set(self.disliked) <= set(popular(8)))
+        self.assertTrue(set(self.disliked) & set(self.als.recommend(user.id, n=2)))
+        self.assertTrue(set(self.disliked) & set(self.cf.recommend([self.foods[0].id], n=2)))
+
+        results     = {
+            'popular'           : popular(8, preferences=preferences),
+            'yesterday-popular' : yesterday_popular(8, preferences),
+            'interest-popular'  : interest_popular(category, 8, preferences),
+            'interest-user'     : interest_user(category, 8, preferences),
+            'random'            : food_index.get().sample(8, exclude=preferences.disliked),
+            'memory-cf'         : self.cf.recommend([self.foods[0].id], n=8, preferences=preferences),
+            'als'               : self.als.recommend(user.id, n=8, preferences=preferences),
+            'als-ann'           : self.als.recommend(user.id, n=2, retrieval='ann', n_probe=1, preferences=preferences),
+            'als-users'         : self.als.recommend_users(
+                [user.id], n=8, preferences={user.id: preferences}
+            )[user.id],
+            'als-users-ann'     : self.als.recommend_users(
+                [user.id], n=2, retrieval='ann', n_probe=1, preferences={user.id: preferences}
+            )[user.id],
+        }
+        for strategy in STRATEGIES:
+            results[f'batch-{strategy}'] = [food.id for food in recommend_batch(strategy, [user.id], 8)[user.id]]
+
+        for name, food_ids in results.items():
+            with self.subTest(name):
+                self.assertTrue(food_ids)
+                self.assertFalse(set(self.disliked) & set(food_ids))
+
+    def test_like_boost_changes_order(self):
+        liked       = Preferences(liked=[2])
+        self.assertEqual(rank([1, 2, 3], [5, 4, 1], 3), [1, 2, 3])
+        self.assertEqual(rank([1, 2, 3], [5, 4, 1], 3, liked), [2, 1, 3])
+        # 점수가 0 이하인 음식은 좋아요만으로 올라가지 않음
+        self.assertEqual(rank([1, 2], [0, -1], 2, liked), [1, 2])
+
+        # ALS: 좋아요 한 음식이 바로 아래 순위라면 boost로 앞선다
+        user_id     = self.users[1].id
+        ranked      = self.als.recommend(user_id, n=8)
+        scores      = dict(zip(self.als.item_ids.tolist(), self.als.scores(user_id).tolist()))
+        first, second = ranked[:2]
+        self.assertGreater(scores[second] * 1.5, scores[first])
+        preferences = Preferences(liked=[second])
+        for retrieval in ('exact', 'ann'):
+            with self.subTest(retrieval):
+                self.assertEqual(
+                    self.als.recommend(user_id, n=2, retrieval=retrieval, n_probe=2, preferences=preferences),
+                    [second, first],
+                )
+                self.assertEqual(
+                    self.als.recommend_users([user_id], n=2, retrieval=retrieval, n_probe=2,
+                                             preferences={user_id: preferences})[user_id],
+                    [second, first],
+                )
+
+    def test_apply_rows_matches_apply(self):
+        rng         = np.random.default_rng(1)
+        item_ids    = np.array([2, 4, 6, 8, 10], dtype=np.int64)
+        scores      = rng.normal(size=(3, 5))
+        rows        = [Preferences(liked=[4, 6, 99], disliked=[10]), Preferences(), Preferences(disliked=[2, 3, 4])]
+
+        expected    = np.array([
+            preferences.apply(row.copy(), item_ids, boost=2) for row, preferences in zip(scores, rows)
+        ])
+        self.assertTrue(np.array_equal(apply_rows(scores.copy(), item_ids, rows, boost=2), expected))
+        self.assertEqual(np.isneginf(expected).sum(), 3)
+
+
+class FoodIndexTest(SimpleTestCase):
+
+    def setUp(self):
+        # (id, 대분류, kcal). 같은 kcal이 여러 개이고 대분류마다 섞여 있음
+        self.rows       = [
+            (1, 10, 300), (2, 20, 200), (3, 10, 200), (4, 20, 500), (5, 10, 100),
+            (6, 20, 200), (7, 30, 400), (8, 10, 500), (9, 20, 100), (10, 10, 200),
+        ]
+        self.index      = FoodIndex(*zip(*self.rows))
+
+    def brute(self, category=None, min_kcal=None, max_kcal=None):
+        return sorted(
+            food_id for food_id, food_category, kcal in self.rows
+            if (category is None or food_category == category)
+            and (min_kcal is None or kcal >= min_kcal)
+            and (max_kcal is None or kcal <= max_kcal)
+        )
+
+    def candidates(self, **filters):
+        ids, lo, hi = self.index.candidates(**filters)
+        return sorted(ids[lo:hi].tolist())
+
+    def test_candidates(self):
+        for category in (None, 10, 20, 30):
+            for min_kcal, max_kcal in (
+                (None, None), (200, None), (None, 200), (200, 200), (150, 450), (200, 500), (600, None), (300, 200),
+            ):
+                filters = {'category': category, 'min_kcal': min_kcal, 'max_kcal': max_kcal}
+                with self.subTest(**filters):
+                    self.assertEqual(self.candidates(**filters), self.brute(**filters))
+
+    def test_unknown_category(self):
+        self.assertEqual(self.candidates(category=40), [])
+        self.assertEqual(self.candidates(category=5, min_kcal=100), [])
+        self.assertEqual(self.index.sample(3, category=40), [])
+
+    def test_mask(self):
+        item_ids    = np.array([1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11])
+        self.assertIsNone(self.index.mask(item_ids))
+        self.assertEqual(
+            item_ids[self.index.mask(item_ids, min_kcal=200, max_kcal=300)].tolist(),
+            self.brute(min_kcal=200, max_kcal=300),
+        )
+
+    def test_sample(self):
+        for _ in range(20):
+            picked  = self.index.sample(3, category=20, max_kcal=200)
+            self.assertEqual(len(picked), 3)
+            self.assertEqual(len(set(picked)), 3)
+            self.assertTrue(set(picked) <= set(self.brute(category=20, max_kcal=200)))
+        self.assertEqual(sorted(self.index.sample(20, min_kcal=400)), self.brute(min_kcal=400))
+
+    def test_sample_exclude(self):
+        # 제외하고 남은 음식이 k개보다 적으면 남은 음식만
+        pool        = self.brute(category=10, min_kcal=200)
+        for _ in range(20):
+            self.assertEqual(
+                sorted(self.index.sample(3, category=10, min_kcal=200, exclude=np.array([3, 8, 99]))),
+                sorted(set(pool) - {3, 8}),
+            )
+            picked  = self.index.sample(5, exclude=np.array([2, 3, 6, 10]))
+            self.assertEqual(len(picked), 5)
+            self.assertFalse({2, 3, 6, 10} & set(picked))
+        self.assertEqual(self.index.sample(3, category=30, exclude=np.array([7])), [])
+
+    def test_empty(self):
+        index       = FoodIndex([], [], [])
+        self.assertEqual(index.sample(3), [])
+        self.assertEqual(index.sample(3, category=10, min_kcal=100), [])
+        self.assertEqual(index.kcal_ids(max_kcal=100).tolist(), [])
+
+
+class BlendTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category        = Category.objects.create(name='한식')
+        cls.food_ids    = [
+            Food.objects.create(category=category, name=f'food{i}', detail='').id for i in range(10)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def blend(self, sources, n=4, **kcal):
+        '''sources: {이름: (제한 시간, quota, 추천 함수)}'''
+        settings    = {
+            'BLEND_TIMEOUTS': {name: timeout for name, (timeout, _, _) in sources.items()},
+            'BLEND_QUOTAS'  : {name: quota for name, (_, quota, _) in sources.items()},
+        }
+        with override_settings(RECOMMENDATION=settings), mock.patch.dict(
+            'recommendation.blend.SOURCES', {name: (func, False) for name, (_, _, func) in sources.items()}, clear=True
+        ):
+            return async_to_sync(blend)(AnonymousUser(), n, **kcal)
+
+    def test_merge(self):
+        results     = {'als': [1, 2, 3, 4], 'popular': [2, 5, 6], 'random': [7, 1, 8]}
+        quotas      = {'als': 2, 'popular': 1, 'random': 1}
+        # 각 추천의 quota만큼 우선순위대로, 중복은 건너뜀
+        self.assertEqual(merge(results, quotas, 4), [(1, 'als'), (2, 'als'), (5, 'popular'), (7, 'random')])
+        # 모자라면 남은 후보로 채움
+        self.assertEqual(
+            merge(results, quotas, 6),
+            [(1, 'als'), (2, 'als'), (5, 'popular'), (7, 'random'), (3, 'als'), (4, 'als')],
+        )
+        self.assertEqual(merge(results, quotas, 3, exclude=[1, 5]), [(2, 'als'), (3, 'als'), (6, 'popular')])
+        self.assertEqual(merge(results, quotas, 4, allowed={2, 6, 8}), [(2, 'als'), (6, 'popular'), (8, 'random')])
+        self.assertEqual(merge({}, quotas, 4), [])
+
+    def test_timeout_uses_fallback(self):
+        ids         = self.food_ids
+        cache.set(FALLBACK_KEY, [ids[0], ids[5], ids[6]])
+        threads     = []
+
+        def fast(user, n, preferences, kcal):
+            threads.append(threading.current_thread().name)
+            return ids[:4]
+
+        def slow(user, n, preferences, kcal):
+            time.sleep(0.5)
+            return ids[7:]
+
+        data        = self.blend({'fast': (1, 2, fast), 'slow': (0.05, 2, slow)})
+        self.assertEqual(data['sources']['fast']['status'], 'ok')
+        self.assertEqual(data['sources']['slow']['status'], 'timeout')
+        # 시간 초과된 추천의 quota는 fallback(캐시된 인기 음식)으로, 중복은 제외
+        self.assertEqual(
+            [(food['food_id'], food['source']) for food in data['foods']],
+            [(ids[0], 'fast'), (ids[1], 'fast'), (ids[5], 'fallback'), (ids[6], 'fallback')],
+        )
+        # 기본 실행기가 아닌 blend 전용 스레드 풀에서 실행
+        self.assertTrue(threads[0].startswith('blend'))
+
+    @mock.patch('recommendation.blend.yesterday_popular')
+    def test_fallback_primed_when_missing(self, yesterday_popular):
+        ids         = self.food_ids
+        yesterday_popular.return_value = [ids[8], ids[9]]
+
+        def failing(user, n, preferences, kcal):
+            raise ValueError
+
+        data        = self.blend({'failing': (1, 2, failing)})
+        self.assertEqual(data['sources']['failing']['status'], 'error: ValueError')
+        self.assertEqual([food['food_id'] for food in data['foods']], [ids[8], ids[9]])
+        self.assertEqual(cache.get(FALLBACK_KEY), [ids[8], ids[9]])
+
+        # 캐시된 뒤에는 다시 집계하지 않음
+        self.blend({'failing': (1, 2, failing)})
+        yesterday_popular.assert_called_once()
+
+    def test_late_start_skipped(self):
+        func        = mock.Mock(return_value=[1])
+        self.assertEqual(_run_before(time.monotonic() - 1, func), [])
+        func.assert_not_called()
+        self.assertEqual(_run_before(time.monotonic() + 10, func), [1])
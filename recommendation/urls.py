@@ -2,11 +2,15 @@ from django.urls import path
 
 from recommendation.views import (
     ALSRecommend,
+    BatchRecommend,
+    CacheStatus,
     InterestPopularRecommend,
     InterestUserRecommend,
     MemoryBasedRecommend,
+    ModelStatus,
     RandomRecommend,
-    YesterdayPopularRecommend
+    YesterdayPopularRecommend,
+    blended_recommend,
 )
 
 
@@ -17,4 +21,9 @@ urlpatterns = [
     path('interest-user', InterestUserRecommend.as_view()),
     path('memory-cf', MemoryBasedRecommend.as_view()),
     path('als', ALSRecommend.as_view()),
+    path('batch', BatchRecommend.as_view()),
+    path('blended', blended_recommend),
+
+    path('models', ModelStatus.as_view()),
+    path('cache', CacheStatus.as_view()),
 ]
@@ -1,14 +1,12 @@
-from random import choices, sample
 import datetime
-import joblib
 
-import pandas as pd
-import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.preprocessing import normalize
-from django.db.models import Count
+from asgiref.sync import sync_to_async
 from django.contrib.auth import get_user_model
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from django.contrib.auth.models import AnonymousUser
+from django.http import JsonResponse
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.authentication import TokenAuthentication
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -18,16 +16,38 @@ from rest_framework.status import (
     HTTP_204_NO_CONTENT,
 
     HTTP_400_BAD_REQUEST,
+    HTTP_401_UNAUTHORIZED,
+    HTTP_405_METHOD_NOT_ALLOWED,
 )
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
-from feature.models import Food, History, Category
-from feature.serializers import FoodDetailSerializer, FoodListSerializer
+from feature.models import Food, Category
+from feature.serializers import FoodListSerializer
+from recommendation.als import als_model, retrieval_options
+from recommendation.artifacts import registry
+from recommendation.batch import (
+    interest_popular,
+    interest_user,
+    recommend_batch,
+    yesterday_popular,
+)
+from recommendation.blend import blend
+from recommendation.cache import cache_per_user, stats
+from recommendation.cf import CF_WINDOW_DAYS, neighbors
+from recommendation.precompute import PrecomputedMixin
+from recommendation.preferences import Preferences
+from recommendation.sampling import food_index
+from recommendation.serializers import BatchRecommendSerializer, KcalFilterSerializer, RandomRecommendSerializer
 
 
 User = get_user_model()
 
+KCAL_PARAMETERS = [
+    openapi.Parameter('min_kcal', openapi.IN_QUERY, description='Min kcal', type=openapi.TYPE_NUMBER),
+    openapi.Parameter('max_kcal', openapi.IN_QUERY, description='Max kcal', type=openapi.TYPE_NUMBER),
+]
+
 class RandomRecommend(APIView):
     serializer_class    = FoodListSerializer
     authentication_classes = (TokenAuthentication,)
@@ -36,13 +56,23 @@ class RandomRecommend(APIView):
     @swagger_auto_schema(   
         operation_id            = '음식 추천 - 랜덤',
         operation_description   = '랜덤으로 음식을 추천합니다.',
+        manual_parameters       = [
+            openapi.Parameter('category', openapi.IN_QUERY, description='Category id', type=openapi.TYPE_INTEGER),
+            *KCAL_PARAMETERS,
+        ],
         responses               = {200: openapi.Response('', FoodListSerializer(many=True))}
     )
     def get(self, request):
-        foods       = Food.objects.all()
-        counts_foods= foods.count()
-        foods_chosen= sample(list(foods), k=min(5, counts_foods))
-        serializer  = self.serializer_class(foods_chosen, many=True)
+        params      = RandomRecommendSerializer(data=request.query_params)
+        if not params.is_valid():
+            return Response(params.errors, status=HTTP_400_BAD_REQUEST)
+
+        # 캐시된 음식 id 인덱스에서 5개의 id만 뽑고, 뽑힌 음식만 조회함 (싫어요 한 음식은 제외)
+        exclude     = Preferences.load(request.user.id).disliked if request.user.is_authenticated else None
+        food_ids    = food_index.get().sample(5, exclude=exclude, **params.validated_data)
+        foods       = Food.objects.in_order(food_ids)
+
+        serializer  = self.serializer_class(foods, many=True)
         return Response(serializer.data, status=HTTP_200_OK)
 
 
@@ -54,34 +84,22 @@ class YesterdayPopularRecommend(APIView):
     @swagger_auto_schema(   
         operation_id            = '음식 추천 - 인기',
         operation_description   = '다른 사용자들이 어제 가장 많이 먹은 음식을 추천합니다.',
+        manual_parameters       = KCAL_PARAMETERS,
         responses               = {200: openapi.Response('', FoodListSerializer(many=True))}
     )
     def get(self, request):
-        yesterday   = datetime.date.today() - datetime.timedelta(days=1)
-
-        histories   = History.objects.all().values(
-            'food'
-        ).filter(
-            created_at__gte=yesterday
-        ).annotate(
-            count=Count('id')
-        ).order_by('-count')
-        
-        foods       = []
-        idx         = 0
-        
-        while len(foods)<10 and idx<len(histories):
-            food_id = histories[idx]['food']
-            try:
-                foods.append(Food.objects.get(pk=food_id))
-            except:
-                pass
-            idx += 1
+        params      = KcalFilterSerializer(data=request.query_params)
+        if not params.is_valid():
+            return Response(params.errors, status=HTTP_400_BAD_REQUEST)
+
+        preferences = Preferences.load(request.user.id) if request.user.is_authenticated else None
+        foods       = Food.objects.in_order(yesterday_popular(10, preferences, **params.validated_data))
 
         serializer  = self.serializer_class(foods, many=True)
         return Response(serializer.data, status=HTTP_200_OK)
 
-class InterestPopularRecommend(APIView):
+class InterestPopularRecommend(APIView, PrecomputedMixin):
+    strategy            = 'interest-popular'
     serializer_class    = FoodListSerializer
     authentication_classes = (TokenAuthentication,)
     permission_classes = (IsAuthenticated, )
@@ -89,38 +107,25 @@ class InterestPopularRecommend(APIView):
     @swagger_auto_schema(   
         operation_id            = '음식 추천 - 선호대분류 기반',
         operation_description   = '선택한 선호 대분류에서 가장 인기있는 음식을 추천합니다.',
+        manual_parameters       = KCAL_PARAMETERS,
         responses               = {200: openapi.Response('', FoodListSerializer(many=True))}
     )
+    @cache_per_user
     def get(self, request):
-        last_month  = datetime.date.today() - datetime.timedelta(days=30)
-        
-        histories   = History.objects.select_related(
-            'food__category'
-        ).all().values(
-            'food'
-        ).filter(
-            food__category =request.user.profile.interest_in
-        ).filter(
-            created_at__gte=last_month
-        ).annotate(
-            count=Count('id')
-        ).order_by('-count')
-        
-        foods       = []
-        idx         = 0
-
-        while len(foods)<10 and idx<len(histories):
-            food_id = histories[idx]['food']
-            try:
-                foods.append(Food.objects.get(pk=food_id))
-            except:
-                pass
-            idx += 1
+        params      = KcalFilterSerializer(data=request.query_params)
+        if not params.is_valid():
+            return Response(params.errors, status=HTTP_400_BAD_REQUEST)
+
+        if (foods := self.get_precomputed(request)) is None:
+            foods   = Food.objects.in_order(interest_popular(
+                request.user.profile.interest_in_id, 10, Preferences.load(request.user.id), **params.validated_data
+            ))
 
         serializer  = self.serializer_class(foods, many=True)
         return Response(serializer.data, status=HTTP_200_OK)
 
-class InterestUserRecommend(APIView):
+class InterestUserRecommend(APIView, PrecomputedMixin):
+    strategy            = 'interest-user'
     serializer_class    = FoodListSerializer
     authentication_classes = (TokenAuthentication,)
     permission_classes = (IsAuthenticated, )
@@ -128,38 +133,25 @@ class InterestUserRecommend(APIView):
     @swagger_auto_schema(   
         operation_id            = '음식 추천 - 유저/선호대분류 기반',
         operation_description   = '같은 선호대분류를 선택한 유저들의 인기 음식을 추천합니다.',
+        manual_parameters       = KCAL_PARAMETERS,
         responses               = {200: openapi.Response('', FoodListSerializer(many=True))}
     )
+    @cache_per_user
     def get(self, request):
-        users       = User.objects.select_related(
-            'profile__interest_in'
-        ).filter(
-            profile__interest_in=request.user.profile.interest_in
-        )
-
-        histories   = History.objects.values(
-            'food'
-        ).filter(
-            user__in= users
-        ).annotate(
-            count=Count('id')
-        ).order_by('-count')
-
-        foods       = []
-        idx         = 0
-        
-        while len(foods)<10 and idx<len(histories):
-            food_id = histories[idx]['food']
-            try:
-                foods.append(Food.objects.get(pk=food_id))
-            except:
-                pass
-            idx += 1
+        params      = KcalFilterSerializer(data=request.query_params)
+        if not params.is_valid():
+            return Response(params.errors, status=HTTP_400_BAD_REQUEST)
+
+        if (foods := self.get_precomputed(request)) is None:
+            foods   = Food.objects.in_order(interest_user(
+                request.user.profile.interest_in_id, 10, Preferences.load(request.user.id), **params.validated_data
+            ))
 
         serializer  = self.serializer_class(foods, many=True)
         return Response(serializer.data, status=HTTP_200_OK)
 
-class MemoryBasedRecommend(APIView):
+class MemoryBasedRecommend(APIView, PrecomputedMixin):
+    strategy            = 'memory-cf'
     serializer_class    = FoodListSerializer
     authentication_classes = (TokenAuthentication,)
     permission_classes = (IsAuthenticated, )
@@ -167,119 +159,145 @@ class MemoryBasedRecommend(APIView):
     @swagger_auto_schema(   
         operation_id            = '음식 추천 - 메모리 기반 CF',
         operation_description   = '메모리 기반의 협업 필터링 추천을 진행합니다. top 5의 음식 반환.',
+        manual_parameters       = KCAL_PARAMETERS,
         responses               = {200: openapi.Response('', FoodListSerializer(many=True))}
     )
+    @cache_per_user
     def get(self, request):
-        df= pd.read_csv('./data/history_test.csv')
-        df['date(utc)'] = df['date(utc)'].astype('datetime64')
-
-        # 최근 10일 간의 데이터를 사용
-        # 최근 10일 동안 먹지 않았던 점심 중에서 추천을 진행함
-        df = df[df['date(utc)'] > np.datetime64(datetime.date.today() - datetime.timedelta(days=10))]
-
-        # 임의로 생성한 데이터이기 때문에 확인이 의미가 없지만 관례상 Train/Test split
-        test_df = df.groupby('user').head(3)
-        train_df = df[~df.index.isin(test_df.index)]
-        train_df['values'] = 1
-
-        # Pivot Table 생성. 더 많이 먹었던 음식엔 높은 값 -> aggfunc = 'sum'
-        pivot_table = pd.pivot_table(
-            train_df,
-            index   ='user',
-            columns ='food',
-            values  ='values',
-            aggfunc ='sum', 
-            fill_value=0
-        )
-
-        # user_id -> dataframe['user']_index, dataframe['food']_index <-> food_id 매핑
-        user_id_to_idx = {user_id: i for i, user_id in enumerate(pivot_table.index)}
-        idx_to_food_id = pivot_table.columns
-        food_id_to_idx = {food_id: i for i, food_id in enumerate(pivot_table.columns)}
-
-
-        # 음식 간 유사도를 구함
-        sim_food = cosine_similarity(pivot_table.T)
-
-        # pivot_table과 sim_food를 내적하면, 
-        # 어떤 음식에 대해 얼마나 유사한 음식을 먹었는가를 수치화 할 수 있음.
-        #                 ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
-        # 음식 간 유사도: 음식 A와 B를 먹은 사람이 얼마나 비슷한가 = A와 B가 얼마나 유사한가
-        #                 ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
-        # (피벗 테이블) x (음식 간 유사도): 어떤 사람 1이 어떤 음식 A에 대해 A와 유사한 음식을 많이 먹었다면(유사도가 큰 음식),
-        #                                                 ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
-        # 상대적으로 높은 수치를 갖게 됨.
-        score = pivot_table.dot(sim_food)
-
-        # 수치에서 이미 먹었던 음식은 제외함
-        for uid in score.index:
-            for ate in train_df[train_df.user==uid].food.values:
-                score.loc[uid][food_id_to_idx[ate]] = 0
-                
-        # 일관된 점수 확인을 위해 정규화
-        score_norm = normalize(score, axis=0)
-        rank_idx = score_norm.argsort(axis=1)
-
-        # uid에 대한 추천 음식의 id를 저장
-        uid = request.user.id
-        top_5_idx = rank_idx[user_id_to_idx[uid]][::-1][:5]
-        top_5_food_id = [idx_to_food_id[idx] for idx in top_5_idx]
-
-        foods       = Food.objects.filter(id__in=top_5_food_id)
+        params      = KcalFilterSerializer(data=request.query_params)
+        if not params.is_valid():
+            return Response(params.errors, status=HTTP_400_BAD_REQUEST)
+
+        if (foods := self.get_precomputed(request)) is None:
+            # 최근 10일 동안 먹지 않았던 점심 중에서 추천을 진행함
+            # 음식 간 유사도는 create_cf_model.py에서 미리 계산한 top-k 이웃을 사용하고,
+            # 요청 시에는 현재 사용자의 기록만 조회함
+            since       = timezone.localdate() - datetime.timedelta(days=CF_WINDOW_DAYS)
+            ate         = request.user.histories.filter(
+                created_at__gte=since
+            ).values_list('food', flat=True)
+
+            # kcal 구간 밖의 음식은 top-k 전에 점수 배열에서 제외 (캐시된 kcal 정렬 인덱스 사용)
+            model       = neighbors.get()
+            top_5_food_id = model.recommend(
+                list(ate), n=5,
+                preferences = Preferences.load(request.user.id),
+                allowed     = food_index.get().mask(model.food_ids, **params.validated_data),
+            )
+
+            foods       = Food.objects.in_order(top_5_food_id)
+
         seriralizer = self.serializer_class(foods, many=True)
         return Response(seriralizer.data, status=HTTP_200_OK)
 
-class ALSRecommend(APIView):
+class ALSRecommend(APIView, PrecomputedMixin):
+    strategy            = 'als'
     serializer_class    = FoodListSerializer
     authentication_classes = (TokenAuthentication,)
     permission_classes = (IsAuthenticated, )
 
+    @swagger_auto_schema(
+        operation_id            = '음식 추천 - ALS',
+        operation_description   = 'ALS 모델의 사용자/음식 factor로 top 5의 음식을 추천합니다.',
+        manual_parameters       = KCAL_PARAMETERS,
+        responses               = {200: openapi.Response('', FoodListSerializer(many=True))}
+    )
+    @cache_per_user
     def get(self, request):
-        model       = joblib.load('./data/als_model.pkl')
-        category_map= joblib.load('./data/als_category.pkl')
-
-        last_week   = datetime.date.today() - datetime.timedelta(days=30)
-
-        user_hist   = request.user.histories.filter(
-            created_at__gte=last_week
-        ).values('food__category__name')
-
-        user_items  = []
-        for data in user_hist:
-            if c := category_map.get(data['food__category__name']):
-                user_items.append(c)
-        
-        rec_category= model.recommend(
-            request.user.id, 
-            user_items, 
-            N=8, 
-            filter_already_liked_items=False
-        )[0][:3]
-        
-        category_map= {category_map[name]: name for name in category_map}
-        categories  = []
-        for rec in rec_category:
-            cat_name    = category_map[rec]
-            categories.append(cat_name)
-        
-        histories   = History.objects.filter(
-            food__category__name__in=categories
-        ).values(
-            'food'
-        ).annotate(
-            count=Count('id')
-        ).order_by('-count')[:5]
-        
-        foods       = []
-        idx         = 0
-        
-        while len(foods)<10 and idx<len(histories):
-            food_id = histories[idx]['food']
-            try:
-                foods.append(Food.objects.get(pk=food_id))
-            except:
-                pass
-            idx += 1
+        params      = KcalFilterSerializer(data=request.query_params)
+        if not params.is_valid():
+            return Response(params.errors, status=HTTP_400_BAD_REQUEST)
+
+        if (foods := self.get_precomputed(request)) is None:
+            # 사용자 factor와 음식 factor의 내적으로 상위 5개 음식을 바로 고름
+            # (factor 행렬은 mmap으로 열려 있어 워커 간에 공유됨)
+            model       = als_model.get()
+            food_ids    = model.recommend(
+                request.user.id, n=5,
+                preferences = Preferences.load(request.user.id),
+                allowed     = food_index.get().mask(model.item_ids, **params.validated_data),
+                **retrieval_options()
+            )
+
+            foods       = Food.objects.in_order(food_ids)
 
         serializer  = self.serializer_class(foods, many=True)
         return Response(serializer.data, status=HTTP_200_OK)
+
+class BatchRecommend(APIView):
+    serializer_class    = BatchRecommendSerializer
+    authentication_classes = (TokenAuthentication,)
+    permission_classes = (IsAuthenticated, IsAdminUser,)
+
+    @swagger_auto_schema(
+        operation_id            = '음식 추천 - 여러 사용자',
+        operation_description   = '여러 사용자의 추천 결과를 한 번에 계산합니다. (interest-popular, interest-user, memory-cf, als) {user_id: [음식 목록]}',
+        request_body            = BatchRecommendSerializer,
+        responses               = {200: openapi.Response('')}
+    )
+    def post(self, request):
+        serializer  = self.serializer_class(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=HTTP_400_BAD_REQUEST)
+
+        data        = serializer.validated_data
+        kcal        = {name: data[name] for name in ('min_kcal', 'max_kcal') if name in data}
+        results     = recommend_batch(data['strategy'], data['user_ids'], data['n'], **kcal)
+        return Response({
+            user_id: FoodListSerializer(foods, many=True).data
+            for user_id, foods in results.items()
+        }, status=HTTP_200_OK)
+
+class ModelStatus(APIView):
+    authentication_classes = (TokenAuthentication,)
+    permission_classes = (IsAuthenticated, IsAdminUser,)
+
+    @swagger_auto_schema(
+        operation_id            = '추천 모델 상태 조회',
+        operation_description   = '현재 워커에 로드된 추천 모델의 버전과 로드 시각을 조회합니다.',
+        responses               = {200: openapi.Response('')}
+    )
+    def get(self, request):
+        return Response([holder.status() for holder in registry.values()], status=HTTP_200_OK)
+
+class CacheStatus(APIView):
+    authentication_classes = (TokenAuthentication,)
+    permission_classes = (IsAuthenticated, IsAdminUser,)
+
+    @swagger_auto_schema(
+        operation_id            = '추천 응답 캐시 상태 조회',
+        operation_description   = '추천 전략별 응답 캐시의 hit/miss 수를 조회합니다.',
+        responses               = {200: openapi.Response('')}
+    )
+    def get(self, request):
+        return Response(stats(), status=HTTP_200_OK)
+
+async def blended_recommend(request):
+    '''
+    홈 화면용 추천. 여러 추천(als, memory-cf, interest, popular, random)을 동시에 실행해
+    제한 시간 안에 끝난 결과를 중복 없이, 추천별 quota에 맞춰 합친다. (recommendation.blend)
+
+    DRF의 APIView와 Django 4.0의 클래스 기반 View는 async 핸들러를 지원하지 않으므로 async 함수 view로 작성했다.
+    ASGI(config/asgi.py, ex. uvicorn config.asgi:application)로 실행해야 기다리는 동안 다른 요청도 처리된다.
+    '''
+    if request.method != 'GET':
+        return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=HTTP_405_METHOD_NOT_ALLOWED, json_dumps_params={'ensure_ascii': False})
+
+    user        = AnonymousUser()
+    try:
+        if auth := await sync_to_async(TokenAuthentication().authenticate)(request):
+            user    = auth[0]
+    except AuthenticationFailed as e:
+        return JsonResponse({'detail': e.detail}, status=HTTP_401_UNAUTHORIZED, json_dumps_params={'ensure_ascii': False})
+    # SaveRequest 미들웨어가 요청 로그에 사용자를 남길 수 있도록
+    request.user = user
+
+    n           = request.GET.get('n', '10')
+    if not n.isdigit() or not 1 <= int(n) <= 30:
+        return JsonResponse({'n': ['1 ~ 30 사이의 정수를 입력하세요.']}, status=HTTP_400_BAD_REQUEST, json_dumps_params={'ensure_ascii': False})
+    params      = KcalFilterSerializer(data=request.GET)
+    if not params.is_valid():
+        return JsonResponse(params.errors, status=HTTP_400_BAD_REQUEST, json_dumps_params={'ensure_ascii': False})
+
+    data        = await blend(user, int(n), **params.validated_data)
+    return JsonResponse(data, status=HTTP_200_OK, json_dumps_params={'ensure_ascii': False})